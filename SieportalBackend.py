@@ -0,0 +1,157 @@
+import asyncio
+import logging
+
+from dataclasses import dataclass
+from typing import Dict, Mapping, Optional, Callable, Any
+
+import aiohttp
+
+from SieportalError import TransportError
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+try:
+    import httpx
+    # httpx пишет каждый запрос в INFO, requests и так логирует результат
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+except ImportError:
+    httpx = None
+
+try:
+    import h2  # noqa: F401 - нужен httpx для HTTP/2
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+BACKEND_AIOHTTP = 'aiohttp'
+BACKEND_HTTPX = 'httpx'
+BACKENDS = (BACKEND_AIOHTTP, BACKEND_HTTPX)
+
+@dataclass(frozen=True)
+class Timeouts:
+    """Таймауты одного эндпоинта в секундах (None - без ограничения)"""
+    connect: Optional[float] = 10.0
+    read: Optional[float] = 30.0
+    total: Optional[float] = 60.0
+
+    def client_timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=self.total, sock_connect=self.connect, sock_read=self.read)
+
+
+@dataclass
+class HttpResponse:
+    status: int
+    headers: Mapping[str, str]
+    body: bytes
+
+
+class HttpBackend:
+    """Интерфейс HTTP бэкенда для requests
+
+    `request` возвращает ответ с уже прочитанным телом при любом статусе.
+    Таймаут попытки поднимается как asyncio.TimeoutError, остальные сетевые
+    ошибки как TransportError.
+    """
+    name = ''
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        proxy: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[Timeouts] = None,
+        params: Optional[Dict[str, Any]] = None,
+        json: Any = None
+    ) -> HttpResponse:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class AiohttpBackend(HttpBackend):
+    """Бэкенд по умолчанию: aiohttp, HTTP/1.1"""
+    name = BACKEND_AIOHTTP
+
+    def __init__(self, session: aiohttp.ClientSession, session_for: Optional[Callable[[Optional[str]], aiohttp.ClientSession]] = None):
+        """
+        Args:
+            - session: Сессия для запросов
+            - session_for: Выбор сессии по прокси (например, Transport.session_for)
+        """
+        self.session = session
+        self.session_for = session_for
+        self._timeouts: Dict[Timeouts, aiohttp.ClientTimeout] = {}
+
+    async def request(self, method, url, *, proxy=None, headers=None, timeout=None, params=None, json=None) -> HttpResponse:
+        session = self.session_for(proxy) if self.session_for is not None else self.session
+        options = {}
+        if timeout is not None:
+            if timeout not in self._timeouts:
+                self._timeouts[timeout] = timeout.client_timeout()
+            options['timeout'] = self._timeouts[timeout]
+        try:
+            async with session.request(method, url, params=params, json=json, proxy=proxy, headers=headers, **options) as response:
+                return HttpResponse(response.status, response.headers, await response.read())
+        except aiohttp.ClientError as error:
+            if isinstance(error, asyncio.TimeoutError):
+                raise
+            raise TransportError(str(error) or type(error).__name__) from error
+
+
+class HttpxBackend(HttpBackend):
+    """httpx с HTTP/2: сотни одновременных запросов мультиплексируются в несколько соединений
+
+    У httpx прокси задаётся при создании клиента, поэтому на каждый прокси свой клиент
+    со своим пулом. HTTP/2 согласуется через TLS (ALPN); по http:// клиент работает по HTTP/1.1.
+    Клиент тратит заметно больше CPU на запрос, чем aiohttp (см. SieportalBench --backend aiohttp httpx),
+    поэтому выигрывает только там, где узкое место - число соединений, а не процессор.
+    """
+    name = BACKEND_HTTPX
+
+    def __init__(self, *, limit: int = 100, keepalive_timeout: float = 30.0, http2: bool = True):
+        if httpx is None:
+            raise RuntimeError("Для бэкенда httpx установите пакет: pip install 'httpx[http2]'")
+        if http2 and not HTTP2:
+            logger.warning("Модуль h2 не установлен, httpx будет работать по HTTP/1.1")
+        self.http2 = http2 and HTTP2
+        self.limits = httpx.Limits(
+            max_connections=limit or None,
+            max_keepalive_connections=limit or None,
+            keepalive_expiry=keepalive_timeout
+        )
+        self._clients: Dict[Optional[str], 'httpx.AsyncClient'] = {}
+
+    def _client(self, proxy: Optional[str]) -> 'httpx.AsyncClient':
+        client = self._clients.get(proxy)
+        if client is None:
+            client = self._clients[proxy] = httpx.AsyncClient(http2=self.http2, limits=self.limits, proxy=proxy, timeout=None)
+        return client
+
+    async def request(self, method, url, *, proxy=None, headers=None, timeout=None, params=None, json=None) -> HttpResponse:
+        options = {}
+        total = None
+        if timeout is not None:
+            options['timeout'] = httpx.Timeout(connect=timeout.connect, read=timeout.read, write=timeout.read, pool=timeout.connect)
+            total = timeout.total
+        try:
+            request = self._client(proxy).request(method, url, params=params, json=json, headers=headers, **options)
+            # Общий лимит на попытку: у httpx есть только таймауты фаз (asyncio.timeout - только с Python 3.11)
+            response = await (asyncio.wait_for(request, total) if total is not None else request)
+        except httpx.TimeoutException as error:
+            raise asyncio.TimeoutError(str(error)) from error
+        except httpx.HTTPError as error:
+            raise TransportError(str(error) or type(error).__name__) from error
+        return HttpResponse(response.status_code, response.headers, response.content)
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
@@ -0,0 +1,298 @@
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import tempfile
+
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+import aiohttp
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from SieportalTyping import BaseAPI
+from SieportalToken import Token, TOKENS
+from SieportalGetTreeAPI import GetTreeAPI as TreeAPI
+from SieportalGetProductAPI import GetProductAPI as ProductAPI
+from SieprotalPrice import GetPriceAPI as PriceAPI
+from SieportalWriter import CsvWriter
+from SieportalSeen import SeenSet
+from SieportalPipeline import PricePipeline, read_articles
+from SieportalTransport import Transport, TransportConfig
+from SieportalHedge import HedgePolicy
+from SieportalBackend import HttpBackend, HttpResponse, BACKEND_AIOHTTP, BACKENDS
+from SieportalMock import MockCatalog, add_arguments, config_from_args
+from SieportalStart import spider
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ('crawl', 'prices')
+
+class RequestTimer(HttpBackend):
+    """Обёртка над HTTP бэкендом, замеряющая задержку каждого запроса к API"""
+    def __init__(self, backend: HttpBackend):
+        self.backend = backend
+        self.name = backend.name
+        self.latencies: List[float] = []
+        self.statuses: Dict[int, int] = {}
+
+    async def request(self, method, url, **kwargs) -> HttpResponse:
+        started = time.perf_counter()
+        response = await self.backend.request(method, url, **kwargs)
+        self.latencies.append(time.perf_counter() - started)
+        self.statuses[response.status] = self.statuses.get(response.status, 0) + 1
+        return response
+
+    async def close(self):
+        await self.backend.close()
+
+    def reset(self):
+        self.latencies = []
+        self.statuses = {}
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def parse():
+    parser = argparse.ArgumentParser(
+    description='Нагрузочный прогон обходчика и конвейера цен на локальном стенде SiePortal',
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    epilog='''
+        Примеры использования:
+        python SieportalBench.py
+        python SieportalBench.py --depth 5 --latency 0.02 -c 64 --json files/bench.json
+        python SieportalBench.py --fault-429 0.05 --fault-5xx 0.02 --token-ttl 30
+        python SieportalBench.py --baseline files/bench.json --tolerance 0.15
+        python SieportalBench.py --backend aiohttp httpx
+        python SieportalBench.py --latency-sigma 1.5 --scenario crawl --hedge
+    '''
+    )
+    add_arguments(parser)
+    parser.add_argument('--url', type=str,
+                       help='Адрес уже запущенного стенда (по умолчанию стенд запускается отдельным процессом)')
+    parser.add_argument('--scenario', type=str, nargs='+', choices=SCENARIOS, default=list(SCENARIOS),
+                       help='Какие прогоны выполнить')
+    parser.add_argument('--backend', type=str, nargs='+', choices=BACKENDS, default=[BACKEND_AIOHTTP],
+                       help='HTTP бэкенды для сравнения: каждый прогон выполняется на каждом бэкенде')
+    parser.add_argument('--hedge', action='store_true',
+                       help='Подстраховывать медленные запросы каталога (см. --hedge в SieportalStart)')
+    parser.add_argument('--concurrent', '-c', type=int, default=16,
+                       help='Воркеры обходчика')
+    parser.add_argument('--price-concurrent', type=int, default=8,
+                       help='Воркеры конвейера цен')
+    parser.add_argument('--max-try', '-m', type=int, default=5,
+                       help='Максимальное количество попыток для запроса')
+    parser.add_argument('--sleep', '-s', type=float, default=0.2,
+                       help='Базовая задержка повтора (секунды)')
+    parser.add_argument('--json', type=str,
+                       help='Сохранить результаты в JSON (для --baseline следующих прогонов)')
+    parser.add_argument('--baseline', type=str,
+                       help='JSON прошлого прогона: при падении запросов в секунду больше --tolerance код выхода 1')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                       help='Допустимое падение производительности относительно --baseline')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                       help='Писать в лог каждый запрос')
+    return parser.parse_args()
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def rss_mb() -> Optional[float]:
+    """Текущий RSS процесса в МБ: psutil, без него /proc (Linux); None - измерить нечем"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2 ** 20
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class PeakMemory:
+    """Пик RSS за один прогон: RSS опрашивается в фоне каждые `interval` секунд
+
+    Пик за всю жизнь процесса (ru_maxrss) не годится - следующий бэкенд унаследовал бы пик предыдущего.
+    """
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _sample(self):
+        value = rss_mb()
+        if value is not None and (self.peak is None or value > self.peak):
+            self.peak = value
+
+    async def _sampler(self):
+        while True:
+            self._sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.peak = None
+        self._task = asyncio.create_task(self._sampler())
+
+    async def stop(self) -> Optional[float]:
+        """Останавливает опрос и возвращает пик в МБ (None - RSS не измерить)"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._sample()
+        return round(self.peak, 1) if self.peak is not None else None
+
+async def start_mock(args) -> tuple[asyncio.subprocess.Process, str]:
+    """Запускает стенд отдельным процессом, чтобы он не делил цикл событий с клиентом"""
+    port = free_port()
+    mock_args = []
+    for name in ('roots', 'fanout', 'depth', 'products', 'accessories', 'latency', 'latency_sigma',
+                 'fault_401', 'fault_403', 'fault_429', 'fault_5xx', 'token_ttl', 'seed'):
+        mock_args += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, str(Path(__file__).with_name('SieportalMock.py')), '--port', str(port), *mock_args,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    async with aiohttp.ClientSession() as session:
+        for _ in range(100):
+            try:
+                async with session.get(f"{url}/stats") as response:
+                    if response.status == 200:
+                        return process, url
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Стенд не запустился")
+
+def result(name: str, timer: RequestTimer, wall: float, articles: int, peak: Optional[float]) -> Dict[str, Any]:
+    return {
+        "scenario": name,
+        "backend": timer.name,
+        "requests": len(timer.latencies),
+        "rps": round(len(timer.latencies) / wall, 1) if wall else 0,
+        "p50_ms": round(timer.percentile(0.5) * 1000, 1),
+        "p99_ms": round(timer.percentile(0.99) * 1000, 1),
+        "wall_s": round(wall, 2),
+        "articles": articles,
+        "statuses": timer.statuses,
+        "peak_mb": peak
+    }
+
+def setting(args, transport: Transport) -> Dict[str, Any]:
+    return {'session': transport.session, 'transport': transport, 'language': 'en', 'region': 'de',
+            'max_try': args.max_try, 'sleep_time': args.sleep, 'hedge': HedgePolicy() if args.hedge else None}
+
+async def bench_crawl(args, transport: Transport, timer: RequestTimer, output: Path) -> Dict[str, Any]:
+    SETTING = setting(args, transport)
+    writer = CsvWriter(output, 5000)
+    memory = PeakMemory()
+    timer.reset()
+    memory.start()
+    started = time.perf_counter()
+    crawler = await spider(MockCatalog(config_from_args(args)).roots(), TreeAPI(**SETTING), ProductAPI(**SETTING), writer,
+                           max_concurrent=args.concurrent, seen_articles=SeenSet())
+    await writer.close()
+    wall = time.perf_counter() - started
+    if SETTING['hedge'] is not None:
+        logger.info(f"Подстраховка: {SETTING['hedge'].get_stats()}")
+    return result('crawl', timer, wall, crawler.articles, await memory.stop())
+
+async def bench_prices(args, transport: Transport, timer: RequestTimer, articles: Path, output: Path) -> Dict[str, Any]:
+    SETTING = setting(args, transport)
+    writer = CsvWriter(output, 5000)
+    pipeline = PricePipeline(PriceAPI(**SETTING), writer, 'EUR', workers=args.price_concurrent)
+    memory = PeakMemory()
+    timer.reset()
+    memory.start()
+    started = time.perf_counter()
+    await pipeline.run(read_articles(articles))
+    await writer.close()
+    wall = time.perf_counter() - started
+    return result('prices', timer, wall, pipeline.processed, await memory.stop())
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> bool:
+    """Сравнивает с прошлым прогоном; возвращает True, если есть регрессия"""
+    # В старых прогонах бэкенд не записан - это всегда был aiohttp
+    previous = {(item['scenario'], item.get('backend', BACKEND_AIOHTTP)): item for item in baseline}
+    regression = False
+    for item in results:
+        old = previous.get((item['scenario'], item['backend']))
+        if not old or not old['rps']:
+            continue
+        change = item['rps'] / old['rps'] - 1
+        name = f"{item['scenario']} [{item['backend']}]"
+        if change < -tolerance:
+            regression = True
+            logger.error(f"РЕГРЕССИЯ {name}: {old['rps']} -> {item['rps']} запросов/сек ({change:+.1%})")
+        else:
+            logger.info(f"{name}: {old['rps']} -> {item['rps']} запросов/сек ({change:+.1%})")
+    return regression
+
+async def main() -> int:
+    args = parse()
+    if not args.verbose:
+        for name in ('SieportalRequests', 'SieportalWriter', 'SieportalToken'):
+            logging.getLogger(name).setLevel(logging.WARNING)
+    process = None
+    url = args.url
+    if url is None:
+        process, url = await start_mock(args)
+    BaseAPI.BASE_URL = url
+    Token.URL = f"{url}/connect/token"
+
+    results = []
+    try:
+        for backend in args.backend:
+            with tempfile.TemporaryDirectory() as directory:
+                articles = Path(directory) / 'articles.csv'
+                async with Transport(TransportConfig(backend=backend)) as transport:
+                    timer = transport.backend = RequestTimer(transport.backend)
+                    # Конвейеру цен нужны артикулы, поэтому обход выполняется всегда
+                    results.append(await bench_crawl(args, transport, timer, articles))
+                    if 'prices' in args.scenario:
+                        results.append(await bench_prices(args, transport, timer, articles, Path(directory) / 'prices.csv'))
+                # Токены привязаны к сессии прогона
+                TOKENS.close()
+        results = [item for item in results if item['scenario'] in args.scenario]
+    finally:
+        TOKENS.close()
+        if process is not None:
+            process.terminate()
+            await process.wait()
+
+    for item in results:
+        logger.info(
+            f"{item['scenario']} [{item['backend']}]: {item['requests']} запросов за {item['wall_s']} сек., {item['rps']} запросов/сек, "
+            f"p50 {item['p50_ms']} мс, p99 {item['p99_ms']} мс, артикулов {item['articles']}, "
+            f"статусы {item['statuses']}, пик памяти за прогон {item['peak_mb'] if item['peak_mb'] is not None else '-'} МБ"
+        )
+    if args.json:
+        Path(args.json).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        return int(compare(results, baseline, args.tolerance))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
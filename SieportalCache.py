@@ -0,0 +1,195 @@
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import asyncio
+import threading
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Any
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 3600
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    stored_at: float
+    fresh: bool
+
+
+def _normalize(value: Any) -> Any:
+    """Приводит параметры к каноничному виду: 10008397 и '10008397' дают один ключ"""
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if value is None or isinstance(value, bool):
+        return value
+    return str(value)
+
+
+class ResponseCache:
+    """Постоянный кэш ответов SiePortal в локальной SQLite базе
+
+    Ключ - метод, URL и нормализованные params/json (регион, язык, узел, страница).
+    У каждого эндпоинта свой TTL (0 - не кэшируется). Устаревшие записи
+    перепроверяются условным запросом (If-None-Match / If-Modified-Since), при
+    превышении `max_bytes` вытесняются давно не читанные записи. В режиме `offline`
+    кэш только читается, а в сеть запросы не уходят.
+    """
+    DEFAULT_TTL = {
+        'tree': 7 * DAY,
+        'products': DAY,
+        'accessories': DAY,
+        'prices': 0,
+    }
+
+    def __init__(
+        self,
+        fp: str | Path,
+        *,
+        ttl: Optional[Dict[str, float]] = None,
+        max_bytes: int = 2 * 1024 ** 3,
+        offline: bool = False
+    ):
+        """Инцилизяция кэша
+
+        Args:
+            - fp: Путь к файлу базы
+            - ttl: Время жизни записей по эндпоинтам в секундах поверх DEFAULT_TTL
+            - max_bytes: Максимальный суммарный размер тел ответов
+            - offline: Только чтение, без сети (отдаются и устаревшие записи)
+        """
+        self.fp = Path(fp)
+        self.fp.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = self.DEFAULT_TTL | (ttl or {})
+        self.max_bytes = max_bytes
+        self.offline = offline
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.fp, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                body BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)")
+        self._db.commit()
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def enabled_for(self, endpoint: str) -> bool:
+        return self.ttl.get(endpoint, 0) > 0 or self.offline
+
+    @staticmethod
+    def key(method: str, url: str, params: Any = None, json_data: Any = None) -> str:
+        raw = json.dumps(
+            [method.upper(), url, _normalize(params), _normalize(json_data)],
+            sort_keys=True, separators=(',', ':'), ensure_ascii=False
+        )
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    async def get(self, key: str, endpoint: str) -> Optional[CacheEntry]:
+        """Возвращает запись кэша (свежую или устаревшую) или None"""
+        entry = await asyncio.to_thread(self._get, key, endpoint)
+        if entry is not None and (entry.fresh or self.offline):
+            self.hits += 1
+        else:
+            self.misses += 1
+        return entry
+
+    def _get(self, key: str, endpoint: str) -> Optional[CacheEntry]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, etag, last_modified, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if not self.offline:
+                self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self._db.commit()
+        body, etag, last_modified, stored_at = row
+        return CacheEntry(body, etag, last_modified, stored_at, now - stored_at < self.ttl.get(endpoint, 0))
+
+    async def put(self, key: str, endpoint: str, body: bytes, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        if self.offline:
+            return
+        await asyncio.to_thread(self._put, key, endpoint, body, etag, last_modified)
+
+    def _put(self, key: str, endpoint: str, body: bytes, etag: Optional[str], last_modified: Optional[str]):
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, endpoint, body, etag, last_modified, now, now, len(body))
+            )
+            self._size += len(body) - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        """Вытесняет давно не читанные записи до 90% от max_bytes (вызывается под self._lock)"""
+        target = self.max_bytes * 0.9
+        removed = 0
+        while self._size > target:
+            rows = self._db.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._size <= target:
+                    break
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= size
+                removed += 1
+        logger.info(f"Из кэша вытеснено {removed} записей")
+
+    async def touch(self, key: str):
+        """Продлевает запись, подтверждённую сервером ответом 304"""
+        self.revalidated += 1
+        await asyncio.to_thread(self._touch, key)
+
+    def _touch(self, key: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute("UPDATE responses SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+            self._db.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_revalidated": self.revalidated,
+            "cache_mb": round(self._size / 1024 ** 2, 1)
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,331 @@
+import time
+import sqlite3
+import asyncio
+import logging
+import argparse
+import threading
+
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional, Any
+
+from SieportalTyping import NodeInfo, TASK_PRODUCTS, TASK_ACCESSORIES
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS crawls (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        language TEXT NOT NULL,
+        region TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        finished_at REAL,
+        nodes INTEGER,
+        articles INTEGER
+    )""",
+    """CREATE TABLE IF NOT EXISTS nodes (
+        language TEXT NOT NULL,
+        region TEXT NOT NULL,
+        node_id TEXT NOT NULL,
+        save_info INTEGER NOT NULL,
+        save_product INTEGER NOT NULL,
+        save_accessory INTEGER NOT NULL,
+        crawled_at REAL NOT NULL,
+        PRIMARY KEY (language, region, node_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS edges (
+        language TEXT NOT NULL,
+        region TEXT NOT NULL,
+        parent_id TEXT NOT NULL,
+        child_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        PRIMARY KEY (language, region, parent_id, child_id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS edges_child ON edges(language, region, child_id)",
+    """CREATE TABLE IF NOT EXISTS pages (
+        language TEXT NOT NULL,
+        region TEXT NOT NULL,
+        node_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        product_count INTEGER NOT NULL,
+        crawled_at REAL NOT NULL,
+        PRIMARY KEY (language, region, node_id, kind, page)
+    )""",
+    """CREATE TABLE IF NOT EXISTS node_articles (
+        language TEXT NOT NULL,
+        region TEXT NOT NULL,
+        node_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        article TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        crawled_at REAL NOT NULL,
+        PRIMARY KEY (language, region, node_id, kind, article)
+    )""",
+    "CREATE INDEX IF NOT EXISTS node_articles_article ON node_articles(article)",
+)
+
+# Все потомки узла (включая его самого) по рёбрам edges
+_SUBTREE = """
+    WITH RECURSIVE subtree(node_id) AS (
+        SELECT ?
+        UNION
+        SELECT edges.child_id FROM edges JOIN subtree ON edges.parent_id = subtree.node_id
+        WHERE edges.language = ? AND edges.region = ?
+    )
+"""
+
+
+class CatalogStore:
+    """Локальный каталог SiePortal в SQLite
+
+    Хранит узлы дерева с флагами save_info/save_product/save_accessory, рёбра родитель-потомок,
+    страницы товаров с productCount и связи узел-артикул (товары и аксессуары) с временем обхода,
+    по языку и региону. Обходчик только копит записи в памяти, а `save` пишет их одной
+    транзакцией в отдельном потоке. Повторный обход узла заменяет его рёбра, а первая
+    страница списка - все прежние артикулы этого списка, поэтому повторы после
+    возобновления ничего не дублируют.
+    """
+    def __init__(self, fp: str | Path, language: str, region: str, *, buffer: int = 5000, journal_mode: str = 'WAL'):
+        """Инцилизяция каталога
+
+        Args:
+            - fp: Путь к файлу базы (общий для всех пар язык-регион)
+            - language: Язык обхода
+            - region: Регион обхода
+            - buffer: Сколько записей копить перед сохранением
+            - journal_mode: Режим журнала SQLite; DELETE - для файла, который пишут процессы
+                на разных машинах через общую файловую систему (WAL требует общей памяти)
+        """
+        self.fp = Path(fp)
+        self.fp.parent.mkdir(parents=True, exist_ok=True)
+        self.language = language
+        self.region = region
+        self.buffer_size = buffer
+
+        self._nodes: List[Tuple] = []
+        self._edges: List[Tuple[str, List[str]]] = []
+        self._pages: List[Tuple] = []
+        self._records = 0
+        self._crawl: Optional[int] = None
+        self._save_lock = asyncio.Lock()
+
+        self.saved_nodes = 0
+        self.saved_articles = 0
+
+        self._lock = threading.Lock()
+        # Несколько обходов могут писать в один файл, WAL (или DELETE) и ожидание блокировки это позволяют
+        self._db = sqlite3.connect(self.fp, check_same_thread=False, timeout=60)
+        self._db.execute(f"PRAGMA journal_mode={journal_mode}")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            for statement in SCHEMA:
+                self._db.execute(statement)
+
+    @property
+    def _locale(self) -> Tuple[str, str]:
+        return self.language, self.region
+
+    def start(self):
+        """Отмечает начало обхода"""
+        with self._lock, self._db:
+            self._crawl = self._db.execute(
+                "INSERT INTO crawls (language, region, started_at) VALUES (?, ?, ?)",
+                (*self._locale, time.time())
+            ).lastrowid
+
+    def finish(self):
+        """Отмечает завершение обхода (только если он прошёл полностью)"""
+        if self._crawl is None:
+            return
+        with self._lock, self._db:
+            nodes, articles = self._db.execute(
+                "SELECT (SELECT COUNT(*) FROM nodes WHERE language = ? AND region = ?), "
+                "(SELECT COUNT(DISTINCT article) FROM node_articles WHERE language = ? AND region = ?)",
+                (*self._locale, *self._locale)
+            ).fetchone()
+            self._db.execute(
+                "UPDATE crawls SET finished_at = ?, nodes = ?, articles = ? WHERE id = ?",
+                (time.time(), nodes, articles, self._crawl)
+            )
+
+    def node(self, node_info: NodeInfo):
+        """Запоминает узел и его дочерние узлы"""
+        node = str(node_info.node_id)
+        self._nodes.append((
+            *self._locale, node, int(node_info.save_info), int(node_info.save_product),
+            int(node_info.save_accessory), time.time()
+        ))
+        self._edges.append((node, [str(child.node_id) for child in node_info.children]))
+        self._records += 1 + len(node_info.children)
+
+    def page(self, node_id: int | str, kind: str, page: int, count: int, articles: List[str]):
+        """Запоминает страницу товаров или аксессуаров узла"""
+        self._pages.append((str(node_id), kind, page, count, articles, time.time()))
+        self._records += 1 + len(articles)
+
+    def full(self) -> bool:
+        return self._records >= self.buffer_size
+
+    async def save(self):
+        nodes, edges, pages = self._nodes, self._edges, self._pages
+        self._nodes, self._edges, self._pages, self._records = [], [], [], 0
+        async with self._save_lock:
+            if nodes or pages:
+                await asyncio.to_thread(self._write, nodes, edges, pages)
+
+    def _write(self, nodes: List[Tuple], edges: List[Tuple[str, List[str]]], pages: List[Tuple]):
+        locale = self._locale
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?)", nodes)
+            for parent, children in edges:
+                self._db.execute("DELETE FROM edges WHERE language = ? AND region = ? AND parent_id = ?", (*locale, parent))
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO edges VALUES (?, ?, ?, ?, ?)",
+                    ((*locale, parent, child, position) for position, child in enumerate(children))
+                )
+            for node, kind, page, count, articles, crawled_at in pages:
+                if page == 0:
+                    # Первая страница всегда обрабатывается раньше остальных - прежний список узла заменяется
+                    self._db.execute("DELETE FROM pages WHERE language = ? AND region = ? AND node_id = ? AND kind = ?", (*locale, node, kind))
+                    self._db.execute("DELETE FROM node_articles WHERE language = ? AND region = ? AND node_id = ? AND kind = ?", (*locale, node, kind))
+                self._db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)", (*locale, node, kind, page, count, crawled_at))
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO node_articles VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    ((*locale, node, kind, article, page, crawled_at) for article in articles)
+                )
+                self.saved_articles += len(articles)
+        self.saved_nodes += len(nodes)
+
+    def _query(self, sql: str, parameters: Tuple) -> List[Tuple]:
+        with self._lock:
+            return self._db.execute(sql, parameters).fetchall()
+
+    def children(self, node_id: int | str) -> List[str]:
+        return [row[0] for row in self._query(
+            "SELECT child_id FROM edges WHERE language = ? AND region = ? AND parent_id = ? ORDER BY position",
+            (*self._locale, str(node_id))
+        )]
+
+    def descendants(self, node_id: int | str) -> List[str]:
+        """Все узлы поддерева (без самого узла)"""
+        return [row[0] for row in self._query(
+            _SUBTREE + "SELECT node_id FROM subtree WHERE node_id != ?",
+            (str(node_id), *self._locale, str(node_id))
+        )]
+
+    def ancestors(self, node_id: int | str) -> List[str]:
+        """Путь от узла к корню (без самого узла)"""
+        rows = self._query(
+            """WITH RECURSIVE path(node_id, depth) AS (
+                SELECT ?, 0
+                UNION
+                SELECT edges.parent_id, path.depth + 1 FROM edges JOIN path ON edges.child_id = path.node_id
+                WHERE edges.language = ? AND edges.region = ?
+            )
+            SELECT node_id FROM path WHERE depth > 0 ORDER BY depth""",
+            (str(node_id), *self._locale)
+        )
+        return [row[0] for row in rows]
+
+    def articles_under(self, node_id: int | str, kind: Optional[str] = TASK_PRODUCTS) -> List[str]:
+        """Артикулы всего поддерева узла (kind=None - и товары, и аксессуары)"""
+        sql = _SUBTREE + """
+            SELECT DISTINCT node_articles.article FROM node_articles JOIN subtree ON node_articles.node_id = subtree.node_id
+            WHERE node_articles.language = ? AND node_articles.region = ?
+        """
+        parameters: Tuple[Any, ...] = (str(node_id), *self._locale, *self._locale)
+        if kind is not None:
+            sql += " AND node_articles.kind = ?"
+            parameters += (kind,)
+        return [row[0] for row in self._query(sql, parameters)]
+
+    def product_counts(self) -> Dict[str, int]:
+        """productCount поддеревьев по узлам (сумма товаров и аксессуаров узла и всех потомков) по прошлым обходам"""
+        counts: Dict[str, int] = {}
+        for node_id, count in self._query(
+            "SELECT node_id, SUM(product_count) FROM pages WHERE language = ? AND region = ? AND page = 0 GROUP BY node_id",
+            self._locale
+        ):
+            counts[node_id] = count
+        children: Dict[str, List[str]] = {}
+        for parent_id, child_id in self._query("SELECT parent_id, child_id FROM edges WHERE language = ? AND region = ?", self._locale):
+            children.setdefault(parent_id, []).append(child_id)
+
+        totals: Dict[str, int] = {}
+        visited = set()
+        for root in [*children, *counts]:
+            # Потомки раньше родителя, без рекурсии: дерево бывает глубже лимита рекурсии
+            stack = [(root, False)]
+            while stack:
+                node_id, expanded = stack.pop()
+                if expanded:
+                    totals[node_id] = counts.get(node_id, 0) + sum(totals.get(child, 0) for child in children.get(node_id, ()))
+                elif node_id not in visited:
+                    visited.add(node_id)
+                    stack.append((node_id, True))
+                    stack.extend((child, False) for child in children.get(node_id, ()) if child not in visited)
+        return totals
+
+    def nodes_of(self, article: str) -> List[Tuple[str, str]]:
+        """Узлы, в которых встречается артикул: [(node_id, products/accessories)]"""
+        return self._query(
+            "SELECT node_id, kind FROM node_articles WHERE article = ? AND language = ? AND region = ?",
+            (article, *self._locale)
+        )
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"catalog_nodes": self.saved_nodes, "catalog_articles": self.saved_articles}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def parse():
+    parser = argparse.ArgumentParser(
+    description='Запросы к локальному каталогу SiePortal (SQLite, заполняется SieportalStart.py --catalog)',
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    epilog='''
+        Примеры использования:
+        python SieportalCatalog.py files/catalog.sqlite -l en -r de --under 10045207
+        python SieportalCatalog.py files/catalog.sqlite -l en -r de --under 10045207 --kind accessories
+        python SieportalCatalog.py files/catalog.sqlite -l en -r de --article 6ES7214-1AG40-0XB0
+    '''
+    )
+    parser.add_argument('catalog', type=str,
+                       help='Файл каталога')
+    parser.add_argument('--language', '-l', type=str, required=True,
+                       help='Язык обхода')
+    parser.add_argument('--region', '-r', type=str, required=True,
+                       help='Регион обхода')
+    parser.add_argument('--under', type=str,
+                       help='Вывести все артикулы поддерева узла')
+    parser.add_argument('--kind', type=str, choices=[TASK_PRODUCTS, TASK_ACCESSORIES, 'all'], default=TASK_PRODUCTS,
+                       help='Товары, аксессуары или всё вместе (для --under)')
+    parser.add_argument('--article', type=str,
+                       help='Вывести узлы, в которых встречается артикул, и их путь к корню')
+    return parser.parse_args()
+
+def main():
+    args = parse()
+    catalog = CatalogStore(args.catalog, args.language, args.region)
+    try:
+        if args.under:
+            started = time.perf_counter()
+            articles = catalog.articles_under(args.under, None if args.kind == 'all' else args.kind)
+            for article in articles:
+                print(article)
+            logger.info(f"Артикулов под узлом {args.under}: {len(articles)} за {(time.perf_counter() - started) * 1000:.1f} мс")
+        if args.article:
+            for node, kind in catalog.nodes_of(args.article):
+                print(f"{node} ({kind}): {' <- '.join(catalog.ancestors(node))}")
+    finally:
+        catalog.close()
+
+if __name__ == "__main__":
+    main()
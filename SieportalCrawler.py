@@ -0,0 +1,498 @@
+import math
+import time
+import logging
+import asyncio
+
+from typing import Iterable, Dict, Any, List, Optional, Callable, Awaitable
+
+from SieportalGetTreeAPI import GetTreeAPI
+from SieportalGetProductAPI import GetProductAPI
+from SieportalTyping import CrawlTask, NodeInfo, NodeProduct, TASK_NODE, TASK_PRODUCTS, TASK_ACCESSORIES
+from SieportalWriter import Writer
+from SieportalJournal import CrawlJournal
+from SieportalSeen import SeenSet, BloomFilter
+from SieportalPipeline import PricePipeline
+from SieportalDelta import DeltaCrawl
+from SieportalCatalog import CatalogStore
+from SieportalSchedule import Frontier, CrawlQuota, POLICY_BFS
+from SieportalError import TaskFailed
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+PAGINATION_COUNT = 'count'
+PAGINATION_SERIAL = 'serial'
+
+class SharedTree:
+    """Структура дерева, общая для обходов одного каталога в разных регионах и языках
+
+    Дочерние узлы и флаги товаров от локали не зависят, поэтому каждый узел
+    запрашивается один раз: первый обход, дошедший до узла, делает запрос, а
+    остальные ждут и используют его ответ. Если запрос не удался, каждый обход
+    запрашивает узел сам.
+    """
+    def __init__(self):
+        self._nodes: Dict[str, asyncio.Future] = {}
+        self.requested = 0
+        self.reused = 0
+
+    async def get_node_info(self, node_id: int | str, fetch: Callable[[int | str], Awaitable[Optional[NodeInfo]]]) -> Optional[NodeInfo]:
+        key = str(node_id)
+        future = self._nodes.get(key)
+        if future is not None:
+            node_info = await asyncio.shield(future)
+            if node_info is not None:
+                self.reused += 1
+                return node_info
+            return await fetch(node_id)
+
+        future = self._nodes[key] = asyncio.get_running_loop().create_future()
+        node_info = None
+        try:
+            self.requested += 1
+            node_info = await fetch(node_id)
+            return node_info
+        finally:
+            future.set_result(node_info)
+            if node_info is None:
+                # Неудачный ответ не запоминаем, следующий обход запросит узел заново
+                del self._nodes[key]
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"tree_requested": self.requested, "tree_reused": self.reused}
+
+
+class Crawler:
+    """Обход каталога через общую очередь задач (frontier) и фиксированный пул воркеров
+
+    Каждая задача очереди это ровно один запрос к API (узел дерева или страница товаров),
+    поэтому одновременно выполняется не больше `workers` запросов независимо от глубины дерева,
+    а свободный воркер сразу берёт следующую задачу, не дожидаясь соседних веток.
+    """
+    def __init__(
+        self,
+        tree_api: GetTreeAPI,
+        product_api: GetProductAPI,
+        writer: Writer,
+        *,
+        workers: int = 8,
+        report_interval: float = 30.0,
+        pagination: str = PAGINATION_COUNT,
+        journal: Optional[CrawlJournal] = None,
+        checkpoint_interval: float = 30.0,
+        seen_articles: Optional[SeenSet | BloomFilter] = None,
+        seen_nodes: Optional[SeenSet] = None,
+        pricer: Optional[PricePipeline] = None,
+        budget: Optional[asyncio.Semaphore] = None,
+        shared_tree: Optional[SharedTree] = None,
+        delta: Optional[DeltaCrawl] = None,
+        catalog: Optional[CatalogStore] = None,
+        spill: Optional[Callable[[CrawlTask], bool]] = None,
+        policy: str = POLICY_BFS,
+        known_counts: Optional[Dict[str, int]] = None,
+        quota: Optional[CrawlQuota] = None,
+        task_retries: int = 2,
+        task_retry_delay: float = 10.0
+    ):
+        """Инцилизяция обходчика
+
+        Args:
+            - tree_api: API дерева каталога
+            - product_api: API товаров и аксессуаров
+            - writer: Куда сохраняются найденные артикулы
+            - workers: Количество воркеров (= максимальное количество запросов в полёте)
+            - report_interval: Как часто (в секундах) писать в лог состояние очереди
+            - pagination: 'count' - по productCount первой страницы сразу ставит в очередь все остальные,
+                'serial' - запрашивает страницы по одной до первой пустой
+            - journal: Журнал для возобновления обхода (None - без контрольных точек)
+            - checkpoint_interval: Как часто (в секундах) сбрасывать вывод на диск (fsync) и дописывать контрольную точку
+            - seen_articles: Множество уже записанных артикулов (None - артикулы не дедуплицируются; с delta обязательно)
+            - seen_nodes: Множество уже обработанных узлов (например, из журнала при возобновлении)
+            - pricer: Конвейер цен - если задан, найденные артикулы сразу уходят в него,
+                а в writer попадают строки [артикул, цена] (у конвейера свои воркеры и свой лимит запросов)
+            - budget: Общий для нескольких обходов лимит запросов в полёте
+            - shared_tree: Общая с другими обходами структура дерева (узлы не запрашиваются повторно)
+            - delta: Сравнение с прошлым снимком - в writer пишутся строки [артикул, added/unchanged/removed],
+                а страницы неизменённых узлов берутся из снимка
+            - catalog: Локальный каталог - в него пишутся узлы, рёбра дерева и артикулы каждого узла (до дедупликации)
+            - spill: Отдаёт узел другому процессу шардированного обхода; если вернул True, узел не ставится
+                в свою очередь (вызывается, только пока в своей очереди есть другие задачи)
+            - policy: Порядок задач в очереди: bfs, dfs, count (больший productCount первым), flagged (узлы с товарами первыми)
+            - known_counts: productCount поддеревьев из прошлого обхода для политик count и flagged
+            - quota: Ограничение по времени и числу запросов - по его исчерпании обход останавливается,
+                дождавшись запросов в полёте, а оставшаяся очередь остаётся в журнале
+            - task_retries: Сколько раз повторить задачу, запрос которой не удался после всех своих повторов;
+                после этого задача считается невыполненной, остаётся в журнале ожидающей, и обход не завершён
+            - task_retry_delay: Задержка перед первым повтором задачи (секунды), дальше удваивается
+        """
+        self.tree_api = tree_api
+        self.product_api = product_api
+        self.writer = writer
+
+        self.workers = max(1, workers)
+        self.report_interval = report_interval
+        self.pagination = pagination
+        self.journal = journal
+        self.checkpoint_interval = checkpoint_interval
+        self.seen_nodes = seen_nodes if seen_nodes is not None else SeenSet()
+        self.delta = delta
+        self.catalog = catalog
+        self.spill = spill
+        self.quota = quota
+        self.task_retries = task_retries
+        self.task_retry_delay = task_retry_delay
+        if delta is not None and seen_articles is None:
+            # Без множества найденных артикулов не посчитать удалённые; при возобновлении
+            # его нужно заполнить из уже записанного вывода, поэтому создаёт его вызывающий
+            raise ValueError("Для delta нужен seen_articles")
+        self.seen_articles = seen_articles
+        self.pricer = pricer
+        self.budget = budget
+        self.shared_tree = shared_tree
+        self._flush = asyncio.Event()
+        self._stopping = False
+        # Задачи, которые сейчас отдают артикулы в конвейер цен; контрольная точка
+        # закрывает вход и ждёт, пока они не будут отмечены в журнале
+        self._emitting: set = set()
+        self._emit_open = asyncio.Event()
+        self._emit_open.set()
+        self._emit_idle = asyncio.Event()
+        self._emit_idle.set()
+        self._exhausted = asyncio.Event()
+        self.frontier = Frontier(policy, known_counts)
+
+        self.finished = False
+        self.busy = 0
+        self.processed = 0
+        self.articles = 0
+        self.duplicate_nodes = 0
+        self.duplicate_articles = 0
+        self.failed: List[CrawlTask] = []  # Задачи, не выполненные и после повторов
+        self._attempts: Dict[tuple, int] = {}
+        self._deferred = 0  # Задачи, ждущие повтора вне очереди
+        self._requeued = asyncio.Event()
+        self.started_at: float | None = None
+        self._busy_time = 0.0
+
+    def push(self, task: CrawlTask, parent: Optional[CrawlTask] = None, *, count: Optional[int] = None, flagged: Optional[bool] = None):
+        """Добавляет задачу в очередь обхода; уже виденные узлы пропускаются
+
+        `count` и `flagged` - подсказки для порядка очереди (см. Frontier.push)
+        """
+        if task.kind == TASK_NODE and not self.seen_nodes.add(task.node_id):
+            self.duplicate_nodes += 1
+            return
+        if task.kind == TASK_NODE and self.spill is not None and not self.frontier.empty() and self.spill(task):
+            return
+        self.frontier.push(task, count=count, flagged=flagged)
+        if self.journal is not None:
+            self.journal.push(task, parent)
+
+    async def run(self, nodes: Iterable[int | str], resume: Optional[List[CrawlTask]] = None):
+        """Обходит дерево начиная с `nodes` и возвращается, когда очередь полностью разобрана или исчерпана `quota`
+
+        Args:
+            - nodes: Корневые узлы
+            - resume: Незавершённые задачи из журнала - если заданы, обход продолжается с них, а `nodes` не используются
+        """
+        if resume is not None:
+            # Эти задачи уже записаны в журнале как ожидающие
+            for task in resume:
+                if task.kind == TASK_NODE:
+                    self.seen_nodes.add(task.node_id)
+                self.frontier.push(task)
+        else:
+            for node_id in nodes:
+                self.push(CrawlTask(TASK_NODE, node_id))
+
+        self.started_at = time.monotonic()
+        self._stopping = False
+        if self.pricer is not None:
+            self.pricer.start()
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        reporter = asyncio.create_task(self._reporter())
+        # Контрольные точки делает только этот таск, и его не отменяют посреди сохранения
+        flusher = asyncio.create_task(self._flusher())
+        finished = False
+        try:
+            finished = await self._wait()
+            if finished and self.failed:
+                finished = False
+                where = " и остаются в журнале (продолжить - --resume)" if self.journal is not None else ""
+                logger.error(f"Обход не завершён: {len(self.failed)} задач не выполнены{where}")
+            if finished and self.delta is not None:
+                self.writer.extend(self.delta.removed_rows(self.seen_articles))
+        finally:
+            for task in (*workers, reporter):
+                task.cancel()
+            await asyncio.gather(*workers, reporter, return_exceptions=True)
+            self._stopping = True
+            self._flush.set()
+            await asyncio.gather(flusher, return_exceptions=True)
+            await self.checkpoint(finished = finished)
+            self.finished = finished
+            if self.pricer is not None:
+                await self.pricer.close()
+            self._report()
+
+    async def _drained(self):
+        """Ждёт, пока очередь разобрана и не осталось задач, ждущих повтора"""
+        while True:
+            await self.frontier.join()
+            if not self._deferred:
+                return
+            self._requeued.clear()
+            await self._requeued.wait()
+
+    async def _wait(self) -> bool:
+        """Ждёт, пока очередь разобрана (True) или исчерпана квота (False)"""
+        if self.quota is None:
+            await self._drained()
+            return True
+        join = asyncio.ensure_future(self._drained())
+        exhausted = asyncio.ensure_future(self._exhausted.wait())
+        try:
+            done, _ = await asyncio.wait((join, exhausted), timeout=self.quota.remaining(), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            join.cancel()
+            exhausted.cancel()
+        if join in done:
+            return True
+        self._exhausted.set()
+        logger.info(f"Квота обхода исчерпана ({self.quota.get_stats()}), ждём {self.busy} запросов в полёте")
+        # Воркеры больше не берут задачи; начатые завершаются и попадают в контрольную точку
+        while self.busy:
+            await asyncio.sleep(0.05)
+        logger.info(f"Обход остановлен: в очереди {self.frontier.qsize()} задач, они сохранены в журнале (продолжить - --resume)")
+        return False
+
+    async def _worker(self):
+        while True:
+            item = await self.frontier.get()
+            if self._exhausted.is_set() or (self.quota is not None and not self.quota.take()):
+                # Задача остаётся в очереди и в журнале как ожидающая
+                self._exhausted.set()
+                self.frontier.put_nowait(item)
+                self.frontier.task_done()
+                return
+            task = item[-1]
+            self.busy += 1
+            started = time.monotonic()
+            try:
+                await self.handle(task)
+                # Между добавлением строк задачи в буфер (или в конвейер цен) и этой отметкой
+                # нет await, поэтому контрольная точка видит задачу либо целиком, либо никак
+                if self.journal is not None:
+                    self.journal.done(task)
+            except Exception as error:
+                # Задача не отмечается выполненной: в журнале она остаётся ожидающей
+                if self.journal is not None:
+                    self.journal.forget(task)
+                if isinstance(error, TaskFailed):
+                    logger.warning(f"Задача {task} не выполнена: {error}")
+                else:
+                    logger.exception(f"Ошибка при обработке {task}: {error}")
+                self._retry(task)
+            finally:
+                self._end_emit(task)
+                self._busy_time += time.monotonic() - started
+                self.busy -= 1
+                self.processed += 1
+                self.frontier.task_done()
+            if self.writer.full():
+                # Запись на диск идёт в фоновой задаче writer-а, ждём только при заполненной очереди
+                await self.writer.submit()
+            if (self.delta is not None and self.delta.full()) or (self.catalog is not None and self.catalog.full()):
+                self._flush.set()
+
+    def _retry(self, task: CrawlTask):
+        """Ставит упавшую задачу в очередь повторно с нарастающей задержкой или считает невыполненной"""
+        key = (task.kind, str(task.node_id), task.page)
+        attempt = self._attempts.get(key, 0)
+        if attempt >= self.task_retries:
+            self._attempts.pop(key, None)
+            self.failed.append(task)
+            return
+        self._attempts[key] = attempt + 1
+        self._deferred += 1
+        asyncio.get_running_loop().call_later(self.task_retry_delay * 2 ** attempt, self._requeue, task)
+
+    def _requeue(self, task: CrawlTask):
+        # Узел уже в seen_nodes и в журнале - в очередь напрямую, минуя push
+        self._deferred -= 1
+        if not self._stopping:
+            self.frontier.push(task)
+        self._requeued.set()
+
+    async def _begin_emit(self, task: CrawlTask):
+        """Задача начинает отдавать артикулы в конвейер цен; во время контрольной точки ждёт её окончания"""
+        if self.pricer is None:
+            return
+        while not self._emit_open.is_set():
+            await self._emit_open.wait()
+        self._emitting.add(id(task))
+        self._emit_idle.clear()
+
+    def _end_emit(self, task: CrawlTask):
+        if id(task) in self._emitting:
+            self._emitting.discard(id(task))
+            if not self._emitting:
+                self._emit_idle.set()
+
+    async def checkpoint(self, finished: bool = False):
+        """Сохраняет буфер writer-а и, если есть журнал, дописывает контрольную точку"""
+        # Снимки изменений и каталога только повторяются при возобновлении, поэтому пишутся до snapshot
+        if self.delta is not None:
+            await self.delta.save()
+        if self.catalog is not None:
+            await self.catalog.save()
+        try:
+            if self.pricer is not None:
+                # Новые задачи не отдают артикулы, начатые доходят до отметки в журнале,
+                # и все их артикулы с ценами оказываются в буфере writer-а
+                self._emit_open.clear()
+                await self._emit_idle.wait()
+                await self.pricer.drain()
+            # Между snapshot и забором буфера в save() нет await: в размер попадают
+            # строки ровно тех задач, что вошли в snapshot
+            snapshot = self.journal.snapshot() if self.journal is not None else None
+            size = await self.writer.save()
+        finally:
+            self._emit_open.set()
+        if self.journal is not None:
+            await self.journal.commit(snapshot, size, finished = finished)
+
+    async def _flusher(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush.wait(), self.checkpoint_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush.clear()
+            try:
+                await self.checkpoint()
+            except Exception as error:
+                logger.exception(f"Ошибка при сохранении контрольной точки: {error}")
+
+    async def handle(self, task: CrawlTask):
+        """Выполняет одну задачу очереди"""
+        if task.kind == TASK_NODE:
+            await self.process_node(task)
+        elif task.kind == TASK_PRODUCTS:
+            await self.process_page(task, self.product_api.get_node_products)
+        elif task.kind == TASK_ACCESSORIES:
+            await self.process_page(task, self.product_api.get_node_accessories)
+        else:
+            logger.error(f"Неизвестный тип задачи: {task}")
+
+    async def process_node(self, task: CrawlTask):
+        """Получает информацию об узле и ставит в очередь его страницы товаров и дочерние узлы"""
+        if self.shared_tree is not None:
+            node_info = await self.shared_tree.get_node_info(task.node_id, self._get_node_info)
+        else:
+            node_info = await self._get_node_info(task.node_id)
+        if node_info is None:
+            raise TaskFailed(f"узел {task.node_id} не получен")
+        if self.delta is not None:
+            self.delta.node(node_info)
+        if self.catalog is not None:
+            self.catalog.node(node_info)
+        if node_info.save_product:
+            self.push(CrawlTask(TASK_PRODUCTS, task.node_id, 0, task.depth), task, flagged=True)
+        if node_info.save_accessory:
+            self.push(CrawlTask(TASK_ACCESSORIES, task.node_id, 0, task.depth), task, flagged=True)
+        for child in node_info.children:
+            self.push(CrawlTask(TASK_NODE, child.node_id, 0, task.depth + 1), task, flagged=child.save_product)
+
+    async def _get_node_info(self, node_id: int | str) -> Optional[NodeInfo]:
+        return await self._request(self.tree_api.get_node_info, node_id)
+
+    async def _request(self, func, *args):
+        """Один запрос к API в рамках общего лимита `budget`"""
+        if self.budget is None:
+            return await func(*args)
+        async with self.budget:
+            return await func(*args)
+
+    async def process_page(self, task: CrawlTask, func):
+        """Сохраняет одну страницу товаров и ставит в очередь следующие"""
+        response: Optional[NodeProduct] = await self._request(func, task.node_id, task.page)
+        if response is None:
+            raise TaskFailed(f"страница {task.page} ({task.kind}) узла {task.node_id} не получена")
+        if not response.products or not response.product_count:
+            return
+        articles = [article.node_id for article in response.products]
+        await self._begin_emit(task)
+        await self.save_articles(articles)
+        if self.catalog is not None:
+            self.catalog.page(task.node_id, task.kind, task.page, response.product_count, articles)
+
+        if self.delta is not None:
+            self.delta.page(task.node_id, task.kind, task.page, response.product_count, articles)
+            if task.page == 0:
+                reused = self.delta.unchanged_pages(task.node_id, task.kind, response.product_count)
+                if reused is not None:
+                    # Узел не изменился - остальные страницы не запрашиваем
+                    for number, page in reused.items():
+                        await self.save_articles(page)
+                        if self.catalog is not None:
+                            self.catalog.page(task.node_id, task.kind, number, response.product_count, page)
+                    return
+
+        if self.pagination == PAGINATION_SERIAL:
+            self.push(CrawlTask(task.kind, task.node_id, task.page + 1, task.depth), task, count=response.product_count)
+        elif task.page == 0:
+            # Количество страниц известно из первой, остальные идут в очередь разом
+            pages = math.ceil(response.product_count / self.product_api.PAGE_SIZE)
+            for page in range(1, pages):
+                self.push(CrawlTask(task.kind, task.node_id, page, task.depth), task, count=response.product_count)
+
+    async def save_articles(self, articles: List[str]):
+        """Отсеивает уже виденные артикулы и отправляет остальные в writer или конвейер цен"""
+        if self.seen_articles is not None:
+            new = [article for article in articles if self.seen_articles.add(article)]
+            self.duplicate_articles += len(articles) - len(new)
+            articles = new
+        self.articles += len(articles)
+        if self.pricer is not None:
+            for article in articles:
+                await self.pricer.put(article)
+        elif self.delta is not None:
+            self.writer.extend(self.delta.rows(articles))
+        else:
+            self.writer.extend(articles)
+
+    async def _reporter(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self._report()
+
+    def _report(self):
+        logger.info(
+            f"Очередь: {self.frontier.qsize()}, воркеры: {self.busy}/{self.workers}, "
+            f"задач: {self.processed}, артикулов: {self.articles}, "
+            f"загрузка воркеров: {self.get_stats()['utilization']}%"
+        )
+        controller = self.tree_api.requests.controller
+        if controller is not None:
+            logger.info(f"Адаптивные лимиты: {controller.get_stats()}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Возвращает статистику обхода"""
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        utilization = self._busy_time / (elapsed * self.workers) * 100 if elapsed > 0 else 0
+        return {
+            "frontier": self.frontier.qsize(),
+            "busy_workers": self.busy,
+            "workers": self.workers,
+            "processed_tasks": self.processed,
+            "articles": self.articles,
+            "duplicate_nodes": self.duplicate_nodes,
+            "duplicate_articles": self.duplicate_articles,
+            "failed_tasks": len(self.failed),
+            "utilization": round(utilization, 2)
+        }
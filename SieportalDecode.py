@@ -0,0 +1,69 @@
+import json
+import logging
+
+from typing import Any, Callable, List, Optional, Tuple
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+Decoder = Callable[[bytes], Any]
+ProductPage = Tuple[List[str], int]  # Артикулы страницы и productCount
+
+if orjson is not None:
+    JSON_LIBRARY = 'orjson'
+    _loads: Decoder = orjson.loads
+elif msgspec is not None:
+    JSON_LIBRARY = 'msgspec'
+    _loads: Decoder = msgspec.json.decode
+else:
+    JSON_LIBRARY = 'json'
+    _loads: Decoder = json.loads
+
+def decode_json(body: bytes) -> Any:
+    """Разбирает JSON; пустое тело (например, ответ 204) - None"""
+    if not body:
+        return None
+    return _loads(body)
+
+
+if msgspec is not None:
+    class _Product(msgspec.Struct):
+        articleNumber: Optional[str] = None
+
+    class _ProductPage(msgspec.Struct):
+        products: Optional[List[_Product]] = None
+        productCount: Optional[int] = None
+
+    # Декодер по схеме: поля вне схемы пропускаются без создания объектов
+    _product_page = msgspec.json.Decoder(Optional[_ProductPage], strict=False)
+
+    def decode_product_page(body: bytes) -> Optional[ProductPage]:
+        """Разбирает страницу GetNodeProducts/GetProductAccessories, оставляя только артикулы и productCount"""
+        if not body:
+            return None
+        page = _product_page.decode(body)
+        if page is None:
+            return None
+        return [product.articleNumber or "N/a" for product in page.products or ()], page.productCount or 0
+
+else:
+    def decode_product_page(body: bytes) -> Optional[ProductPage]:
+        """Разбирает страницу GetNodeProducts/GetProductAccessories, оставляя только артикулы и productCount"""
+        page = decode_json(body)
+        if page is None:
+            return None
+        return [product.get('articleNumber') or "N/a" for product in page.get('products') or ()], page.get('productCount') or 0
@@ -0,0 +1,170 @@
+import os
+import json
+import asyncio
+import logging
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional, Iterator, Any
+
+from SieportalTyping import NodeInfo
+from SieportalSeen import SeenSet, BloomFilter
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+ADDED = 'added'
+REMOVED = 'removed'
+UNCHANGED = 'unchanged'
+
+@dataclass
+class SnapshotPages:
+    """Страницы товаров (или аксессуаров) одного узла из снимка"""
+    count: int = 0
+    pages: Dict[int, List[str]] = field(default_factory=dict)
+
+
+class TreeSnapshot:
+    """Снимок дерева каталога: дочерние узлы, productCount и артикулы по страницам
+
+    Хранится в файле JSON Lines, одна запись на узел или страницу:
+        {"node": 10008397, "children": [...]}
+        {"node": 10008397, "kind": "products", "page": 0, "count": 120, "articles": [...]}
+    При повторах (например, после возобновления) действует последняя запись.
+    """
+    def __init__(self):
+        self.children: Dict[str, Tuple[str, ...]] = {}
+        self.pages: Dict[Tuple[str, str], SnapshotPages] = {}
+
+    @classmethod
+    def load(cls, fp: str | Path) -> 'TreeSnapshot':
+        snapshot = cls()
+        fp = Path(fp)
+        if not fp.exists():
+            logger.warning(f"Снимок {fp} не найден, все артикулы будут новыми")
+            return snapshot
+        with open(fp, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Повреждённая запись в снимке {fp}, пропускаем")
+                    continue
+                node = str(record['node'])
+                if 'children' in record:
+                    snapshot.children[node] = tuple(str(child) for child in record['children'])
+                else:
+                    pages = snapshot.pages.setdefault((node, record['kind']), SnapshotPages())
+                    pages.count = record['count']
+                    pages.pages[record['page']] = record['articles']
+        logger.info(f"Загружен снимок {fp}: узлов {len(snapshot.children)}, списков товаров {len(snapshot.pages)}")
+        return snapshot
+
+    def articles(self) -> Iterator[str]:
+        for pages in self.pages.values():
+            for articles in pages.pages.values():
+                yield from articles
+
+
+class DeltaCrawl:
+    """Сравнение обхода с предыдущим снимком
+
+    Узел считается изменённым, если изменился список его дочерних узлов или productCount.
+    Для неизменённых узлов после первой страницы остальные не запрашиваются, а их артикулы
+    берутся из снимка. Каждый артикул помечается как added или unchanged, а в конце
+    обхода артикулы снимка, которые не встретились, выдаются как removed.
+    Параллельно пишется новый снимок для следующего запуска.
+    """
+    def __init__(self, previous: TreeSnapshot, fp: str | Path, *, buffer: int = 1000):
+        """Инцилизяция сравнения
+
+        Args:
+            - previous: Снимок прошлого обхода
+            - fp: Куда писать новый снимок (дописывается, при возобновлении продолжается)
+            - buffer: Сколько записей копить перед сохранением
+        """
+        self.previous = previous
+        self.fp = Path(fp)
+        self.fp.parent.mkdir(parents=True, exist_ok=True)
+        self.buffer_size = buffer
+        self.old_articles = SeenSet()
+        self.old_articles.update(previous.articles())
+        self._changed_nodes = SeenSet()
+        self._records: List[Dict[str, Any]] = []
+        self._lock = asyncio.Lock()
+
+        self.added = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.changed_nodes = 0
+        self.reused_pages = 0
+
+    def node(self, node_info: NodeInfo):
+        """Запоминает дочерние узлы и сравнивает их со снимком"""
+        node = str(node_info.node_id)
+        children = [child.node_id for child in node_info.children]
+        self._records.append({'node': node_info.node_id, 'children': children})
+        if self.previous.children.get(node) != tuple(str(child) for child in children):
+            self._changed_nodes.add(node)
+            self.changed_nodes += 1
+
+    def page(self, node_id: int | str, kind: str, page: int, count: int, articles: List[str]):
+        self._records.append({'node': node_id, 'kind': kind, 'page': page, 'count': count, 'articles': articles})
+
+    def unchanged_pages(self, node_id: int | str, kind: str, count: int) -> Optional[Dict[int, List[str]]]:
+        """Страницы из снимка (кроме первой), если узел не изменился, иначе None"""
+        node = str(node_id)
+        pages = self.previous.pages.get((node, kind))
+        if pages is None or pages.count != count or node in self._changed_nodes:
+            return None
+        reused = {page: articles for page, articles in pages.pages.items() if page != 0}
+        for page, articles in reused.items():
+            self.page(node_id, kind, page, count, articles)
+        self.reused_pages += len(reused)
+        return reused
+
+    def rows(self, articles: List[str]) -> List[List[str]]:
+        """Строки [артикул, статус] для найденных артикулов"""
+        rows = []
+        for article in articles:
+            if article in self.old_articles:
+                rows.append([article, UNCHANGED])
+                self.unchanged += 1
+            else:
+                rows.append([article, ADDED])
+                self.added += 1
+        return rows
+
+    def removed_rows(self, seen: SeenSet | BloomFilter) -> List[List[str]]:
+        """Строки [артикул, removed] для артикулов снимка, которых не было в обходе"""
+        rows = [[article, REMOVED] for article in self.previous.articles() if article not in seen]
+        self.removed = len(rows)
+        return rows
+
+    def full(self) -> bool:
+        return len(self._records) >= self.buffer_size
+
+    async def save(self):
+        records, self._records = self._records, []
+        async with self._lock:
+            if records:
+                await asyncio.to_thread(self._write, records)
+
+    def _write(self, records: List[Dict[str, Any]]):
+        with open(self.fp, 'a', encoding='utf-8') as file:
+            file.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "added": self.added,
+            "unchanged": self.unchanged,
+            "removed": self.removed,
+            "changed_nodes": self.changed_nodes,
+            "reused_pages": self.reused_pages
+        }
@@ -1,2 +1,22 @@
 class NotCorrectData(Exception):
-    """Указывает на то что полученный на вход данные не верные/не сходятся"""
\ No newline at end of file
+    """Указывает на то что полученный на вход данные не верные/не сходятся"""
+
+
+class HttpStatusError(Exception):
+    """Сервер ответил статусом ошибки (4xx/5xx)"""
+    def __init__(self, status: int, headers=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.headers = headers or {}
+
+
+class TaskFailed(Exception):
+    """Задача обхода не выполнена: запрос не удался после всех повторов"""
+
+
+class TransportError(Exception):
+    """Сетевая ошибка HTTP бэкенда (соединение, прокси, обрыв ответа)"""
+
+
+class DecodeError(Exception):
+    """Тело ответа получено, но не разбирается (битый JSON, неожиданная структура)"""
@@ -1,21 +1,11 @@
-from typing import List, Optional, Dict, Any
-
-import aiohttp
+from typing import Optional, Dict, Any
 
 from SieportalTyping import NodeProduct, BaseChild, BaseAPI
+from SieportalRequests import RequestContext
+from SieportalDecode import decode_product_page, ProductPage
 
 class GetProductAPI(BaseAPI):
-    def __init__(
-        self, 
-        session: aiohttp.ClientSession,
-        language: str,
-        region: str,
-        *,
-        proxy_list: Optional[List[str]] = None,
-        use_proxy: bool = False,
-        sleep_time = 1,
-        max_try = 3):
-        super().__init__(session, language, region, proxy_list=proxy_list, use_proxy=use_proxy, sleep_time=sleep_time, max_try=max_try)
+    PAGE_SIZE = 50
     
     async def get_node_products(
         self, 
@@ -35,18 +25,16 @@ class GetProductAPI(BaseAPI):
             NodeProduct - Возращает артикулы и количество найденных атрибутов
         """
         
-        URL = 'https://sieportal.siemens.com/api/mall/CatalogTreeApi/GetNodeProducts'
+        URL = f'{self.BASE_URL}/api/mall/CatalogTreeApi/GetNodeProducts'
         json_data = self._default_params(
             {
                 'nodeId': node_id,
                 'pageNumberIndex': page_number,
             }
         )
-        response = await self.requests.post(URL, json=json_data)
-        return NodeProduct(
-            [BaseChild(product.get('articleNumber', "N/a")) for product in response.get('products', [])],
-            response.get('productCount', 0)
-        ) if response is not None else None
+        response = await self.requests.post(URL, json=json_data, decode=decode_product_page,
+                                            context=RequestContext(node=node_id, page=page_number))
+        return self._node_product(response)
     
     async def get_node_accessories(
         self,
@@ -64,22 +52,27 @@ class GetProductAPI(BaseAPI):
         
             NodeProduct - Возращает артикулы и количество найденных атрибутов
         """
-        URL = 'https://sieportal.siemens.com/api/mall/CatalogTreeApi/GetProductAccessories'
+        URL = f'{self.BASE_URL}/api/mall/CatalogTreeApi/GetProductAccessories'
         json_data = self._default_params(
             {
                 'nodeId': node_id,
                 'pageNumberIndex': page_number,
             }
         )
-        response = await self.requests.post(URL, json=json_data)
-        return NodeProduct(
-            [BaseChild(product.get('articleNumber', "N/a")) for product in response.get('products', [])],
-            response.get('productCount', 0)
-        ) if response is not None else None
+        response = await self.requests.post(URL, json=json_data, decode=decode_product_page,
+                                            context=RequestContext(node=node_id, page=page_number))
+        return self._node_product(response)
+    
+    @staticmethod
+    def _node_product(response: Optional[ProductPage]) -> Optional[NodeProduct]:
+        if response is None:
+            return None
+        articles, count = response
+        return NodeProduct([BaseChild(article) for article in articles], count)
     
     def _default_params(self, new_dict: Dict[str, Any]):
         return super()._default_params(
             {
                 'treeName': 'CatalogTree',
-                'limit': 50,
+                'limit': self.PAGE_SIZE,
             } | new_dict)
\ No newline at end of file
@@ -1,35 +1,22 @@
 import logging
 
-from typing import List, Dict, Optional, Any
-
-import aiohttp
+from typing import Optional
 
 from SieportalTyping import NodeInfo, NodeChild, BaseAPI
+from SieportalRequests import RequestContext
 
 logger = logging.getLogger(__name__)
 
 class GetTreeAPI(BaseAPI):
-    def __init__(
-        self, 
-        session: aiohttp.ClientSession,
-        language: str,
-        region: str,
-        *,
-        proxy_list: Optional[List[str]] = None,
-        use_proxy: bool = False,
-        sleep_time = 1,
-        max_try = 3):
-        super().__init__(session, language, region, proxy_list=proxy_list, use_proxy=use_proxy, sleep_time=sleep_time, max_try=max_try)
-    
     async def get_node_info(self, node_id: int | str) -> Optional[NodeInfo]:
         """Получает информацию о узле каталога по его ID"""
         
-        URL = 'https://sieportal.siemens.com/api/mall/CatalogTreeApi/GetNodeInformation'
+        URL = f'{self.BASE_URL}/api/mall/CatalogTreeApi/GetNodeInformation'
         params = self._default_params({
             'NodeId': node_id,
             'TreeName': 'CatalogTree'
         })
-        response = await self.requests.get(URL, params = params)
+        response = await self.requests.get(URL, params = params, context=RequestContext(node=node_id))
         try:
             return NodeInfo(
                 [
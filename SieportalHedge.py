@@ -0,0 +1,112 @@
+import logging
+
+from collections import deque
+from typing import Dict, Iterable, Optional, Any
+
+from SieportalRetry import RetryBudget
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+# Идемпотентные запросы каталога, которые безопасно отправлять дважды
+HEDGE_ENDPOINTS = ('tree', 'products', 'accessories')
+
+class LatencyWindow:
+    """Задержки последних `size` успешных попыток; квантиль пересчитывается раз в `refresh` наблюдений"""
+    def __init__(self, quantile: float, size: int = 500, refresh: int = 25):
+        self.quantile = quantile
+        self.refresh = refresh
+        self._values = deque(maxlen=size)
+        self._pending = 0
+        self.value: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def observe(self, latency: float):
+        self._values.append(latency)
+        self._pending += 1
+        if self._pending >= self.refresh or self.value is None:
+            self._pending = 0
+            ordered = sorted(self._values)
+            self.value = ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+
+
+class HedgePolicy:
+    """Подстраховка медленных запросов (hedged requests)
+
+    Если попытка идёт дольше `quantile` недавних задержек своего эндпоинта, та же попытка
+    отправляется ещё раз через другой прокси; используется первый успешный ответ, второй
+    запрос отменяется. Подстраховок не больше `ratio` от числа запросов (бюджет как у повторов).
+    """
+    def __init__(
+        self,
+        quantile: float = 0.95,
+        *,
+        ratio: float = 0.05,
+        endpoints: Iterable[str] = HEDGE_ENDPOINTS,
+        min_delay: float = 0.05,
+        min_samples: int = 50,
+        window: int = 500
+    ):
+        """Инцилизяция политики
+
+        Args:
+            - quantile: Квантиль задержки, после которого отправляется подстраховка
+            - ratio: Доля подстраховок от числа запросов
+            - endpoints: Эндпоинты, которые можно подстраховывать (только идемпотентные)
+            - min_delay: Подстраховка не раньше стольких секунд
+            - min_samples: До стольких замеров на эндпоинт подстраховки нет
+            - window: Сколько последних задержек учитывается
+        """
+        self.quantile = quantile
+        self.endpoints = frozenset(endpoints)
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.budget = RetryBudget(ratio, minimum=1.0)
+        self._windows: Dict[str, LatencyWindow] = {}
+
+        self.requests = 0
+        self.hedged = 0
+        self.won = 0
+        self.failed = 0
+
+    def enabled_for(self, endpoint: str) -> bool:
+        return endpoint in self.endpoints
+
+    def deposit(self):
+        """Новый запрос: пополняет бюджет подстраховок"""
+        self.requests += 1
+        self.budget.deposit()
+
+    def allow(self) -> bool:
+        return self.budget.withdraw()
+
+    def observe(self, endpoint: str, latency: float):
+        window = self._windows.get(endpoint)
+        if window is None:
+            window = self._windows[endpoint] = LatencyWindow(self.quantile, self.window)
+        window.observe(latency)
+
+    def delay(self, endpoint: str) -> Optional[float]:
+        """Через сколько секунд подстраховать попытку; None - замеров ещё мало"""
+        window = self._windows.get(endpoint)
+        if window is None or len(window) < self.min_samples:
+            return None
+        return max(self.min_delay, window.value)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "won": self.won,
+            "failed": self.failed,
+            "hedge_rate": round(self.hedged / self.requests * 100, 2) if self.requests else 0,
+            "win_rate": round(self.won / self.hedged * 100, 2) if self.hedged else 0,
+            "delays": {endpoint: round(window.value, 3) for endpoint, window in self._windows.items() if window.value is not None}
+        }
@@ -0,0 +1,131 @@
+import os
+import json
+import asyncio
+import logging
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional
+
+from SieportalTyping import CrawlTask, TASK_NODE
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+def _key(task: CrawlTask) -> Tuple[str, str, int]:
+    return task.kind, str(task.node_id), task.page
+
+def _dump(task: CrawlTask) -> list:
+    return [task.kind, task.node_id, task.page, task.depth]
+
+@dataclass
+class JournalState:
+    """Состояние обхода, восстановленное из журнала"""
+    pending: List[CrawlTask] = field(default_factory=list)
+    nodes: List[int | str] = field(default_factory=list)  # Полностью обработанные узлы
+    done: int = 0
+    size: int = 0
+    finished: bool = False
+
+
+class CrawlJournal:
+    """Журнал обхода для возобновления после падения
+
+    Журнал - файл JSON Lines, в который только дописываются контрольные точки.
+    Каждая точка содержит завершённые задачи, поставленные ими в очередь новые задачи
+    (вместе с номером страницы) и размер выходного файла на этот момент.
+    Дочерние задачи попадают в журнал только вместе с завершением родителя, поэтому
+    после восстановления очередь = все поставленные минус завершённые, а выходной
+    файл обрезается до размера последней точки, и дубликатов в нём не появляется.
+    """
+    def __init__(self, fp: str | Path):
+        self.fp = Path(fp)
+        self.fp.parent.mkdir(parents=True, exist_ok=True)
+        self._pushed: List[CrawlTask] = []
+        self._done: List[CrawlTask] = []
+        self._children: Dict[int, List[CrawlTask]] = {}
+        # Точки дописываются в порядке вызова commit
+        self._lock = asyncio.Lock()
+
+    def push(self, task: CrawlTask, parent: Optional[CrawlTask] = None):
+        """Запоминает новую задачу; задачи родителя ждут его завершения"""
+        if parent is None:
+            self._pushed.append(task)
+        else:
+            self._children.setdefault(id(parent), []).append(task)
+
+    def done(self, task: CrawlTask):
+        """Отмечает задачу завершённой (её строки уже в буфере writer-а)"""
+        self._pushed.extend(self._children.pop(id(task), []))
+        self._done.append(task)
+
+    def forget(self, task: CrawlTask):
+        """Задача упала - её дочерние задачи не записываются, при возобновлении она повторится"""
+        self._children.pop(id(task), None)
+
+    def snapshot(self) -> Tuple[List[CrawlTask], List[CrawlTask]]:
+        """Забирает накопленные с прошлой точки записи"""
+        pushed, done = self._pushed, self._done
+        self._pushed, self._done = [], []
+        return pushed, done
+
+    async def commit(self, snapshot: Tuple[List[CrawlTask], List[CrawlTask]], size: int, *, finished: bool = False):
+        """Дописывает контрольную точку и сбрасывает её на диск (в отдельном потоке)"""
+        pushed, done = snapshot
+        record = {
+            'push': [_dump(task) for task in pushed],
+            'done': [_dump(task) for task in done],
+            'size': size,
+        }
+        if finished:
+            record['finished'] = True
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        async with self._lock:
+            await asyncio.to_thread(self._append, line)
+
+    def _append(self, line: str):
+        with open(self.fp, 'a', encoding='utf-8') as file:
+            file.write(line)
+            file.flush()
+            os.fsync(file.fileno())
+
+    async def reset(self, size: int = 0):
+        """Начинает новый журнал, запоминая исходный размер выходного файла"""
+        await asyncio.to_thread(self.fp.write_text, '', encoding='utf-8')
+        await self.commit(([], []), size)
+
+    @classmethod
+    def load(cls, fp: str | Path) -> JournalState:
+        """Восстанавливает незавершённые задачи из журнала"""
+        state = JournalState()
+        fp = Path(fp)
+        if not fp.exists():
+            return state
+
+        pending: Dict[Tuple[str, str, int], CrawlTask] = {}
+        with open(fp, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная последняя строка - точка не успела записаться
+                    logger.warning(f"Повреждённая запись в журнале {fp}, пропускаем")
+                    continue
+                for raw in record.get('push', []):
+                    task = CrawlTask(*raw)
+                    pending[_key(task)] = task
+                for raw in record.get('done', []):
+                    task = CrawlTask(*raw)
+                    pending.pop(_key(task), None)
+                    if task.kind == TASK_NODE:
+                        state.nodes.append(task.node_id)
+                    state.done += 1
+                state.size = record.get('size', state.size)
+                state.finished = record.get('finished', False)
+
+        state.pending = list(pending.values())
+        return state
@@ -0,0 +1,192 @@
+import time
+import logging
+import asyncio
+
+from collections import deque
+from typing import Dict, Optional, Any, Tuple, List
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+# Короткие имена эндпоинтов SiePortal для логов и статистики
+ENDPOINTS = {
+    'GetNodeInformation': 'tree',
+    'GetNodeProducts': 'products',
+    'GetProductAccessories': 'accessories',
+    'GetProductsAndPrices': 'prices',
+}
+
+def endpoint_name(url: str) -> str:
+    """Возвращает короткое имя эндпоинта по URL"""
+    path = url.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1]
+    return ENDPOINTS.get(path, path)
+
+
+class AdaptiveLimit:
+    """AIMD лимит одновременных запросов для одного ключа (эндпоинта или прокси)
+
+    Пока ответы успешные и задержка стабильна, лимит растёт на 1 за "окно" запросов
+    (+1/limit на каждый ответ). На 403/429/5xx или при росте задержки выше
+    `latency_tolerance` от базовой лимит умножается на `backoff`, но не чаще одного
+    раза за время ответа, чтобы пачка ошибок одного окна не обнулила лимит.
+    """
+    def __init__(
+        self,
+        name: str,
+        initial: float,
+        *,
+        minimum: int = 1,
+        maximum: int = 64,
+        backoff: float = 0.5,
+        latency_tolerance: float = 2.0
+    ):
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+
+        self.in_flight = 0
+        self.latency: Optional[float] = None  # Быстрое EWMA
+        self.baseline: Optional[float] = None  # Медленное EWMA - "нормальная" задержка
+        self.decreases = 0
+        self.rate = 0.0
+
+        self._waiters: deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        self._window_started = time.monotonic()
+        self._window_count = 0
+
+    async def acquire(self):
+        """Ждёт свободного места под лимитом"""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Место уже было выдано - возвращаем его
+                self.in_flight -= 1
+                self._wake()
+            elif future in self._waiters:
+                self._waiters.remove(future)
+            raise
+
+    def release(self, ok: bool, latency: Optional[float] = None, *, throttled: bool = False):
+        """Освобождает место и подстраивает лимит по результату запроса
+
+        Args:
+            - ok: Запрос успешен
+            - latency: Время ответа в секундах
+            - throttled: Сервер нас притормаживает (403/429/5xx)
+        """
+        self.in_flight = max(0, self.in_flight - 1)
+        self._count()
+
+        if ok and latency is not None:
+            self.latency = latency if self.latency is None else self.latency + 0.3 * (latency - self.latency)
+            self.baseline = latency if self.baseline is None else self.baseline + 0.02 * (latency - self.baseline)
+
+        if throttled:
+            self._decrease("ответ сервера")
+        elif ok and self.latency is not None and self.latency > self.baseline * self.latency_tolerance:
+            self._decrease(f"задержка {self.latency:.2f}с при норме {self.baseline:.2f}с")
+        elif ok:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+    def _decrease(self, reason: str):
+        now = time.monotonic()
+        if now - self._last_decrease < max(self.latency or 0, 0.05):
+            return
+        self._last_decrease = now
+        old = self.limit
+        self.limit = max(self.minimum, self.limit * self.backoff)
+        self.decreases += 1
+        logger.info(f"Лимит '{self.name}' снижен {old:.1f} -> {self.limit:.1f} ({reason})")
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def _count(self):
+        now = time.monotonic()
+        self._window_count += 1
+        elapsed = now - self._window_started
+        if elapsed >= 10:
+            self.rate = self._window_count / elapsed
+            self._window_started = now
+            self._window_count = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limit, 1),
+            "in_flight": self.in_flight,
+            "rate": round(self.rate, 2),
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "decreases": self.decreases
+        }
+
+
+class AdaptiveController:
+    """Адаптивный контроллер параллельности: отдельный AIMD лимит на каждый эндпоинт
+    (tree, products, accessories, prices) и на каждый прокси
+    """
+    def __init__(
+        self,
+        maximum: int = 64,
+        *,
+        initial: Optional[int] = None,
+        minimum: int = 1,
+        proxy_maximum: Optional[int] = None
+    ):
+        """Инцилизяция контроллера
+
+        Args:
+            - maximum: Потолок лимита на эндпоинт
+            - initial: Стартовый лимит (по умолчанию половина потолка)
+            - minimum: Ниже этого лимит не опускается
+            - proxy_maximum: Потолок лимита на один прокси (по умолчанию как у эндпоинта)
+        """
+        self.maximum = maximum
+        self.initial = initial if initial is not None else max(minimum, maximum // 2)
+        self.minimum = minimum
+        self.proxy_maximum = proxy_maximum or maximum
+        self._limits: Dict[Tuple[str, str], AdaptiveLimit] = {}
+
+    def limit_for(self, kind: str, key: str) -> AdaptiveLimit:
+        limit = self._limits.get((kind, key))
+        if limit is None:
+            maximum = self.proxy_maximum if kind == 'proxy' else self.maximum
+            limit = self._limits[(kind, key)] = AdaptiveLimit(
+                f"{kind}:{key}",
+                min(self.initial, maximum),
+                minimum=self.minimum,
+                maximum=maximum
+            )
+        return limit
+
+    async def acquire(self, kind: str, key: str) -> AdaptiveLimit:
+        """Занимает место под лимитом ключа и возвращает сам лимит для release"""
+        limit = self.limit_for(kind, key)
+        await limit.acquire()
+        return limit
+
+    def release(self, limits: List[AdaptiveLimit], ok: bool, latency: Optional[float] = None, *, throttled: bool = False):
+        for limit in limits:
+            limit.release(ok, latency, throttled = throttled)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Возвращает текущие лимиты и скорость по эндпоинтам"""
+        return {name: limit.get_stats() for (kind, name), limit in self._limits.items() if kind == 'endpoint'}
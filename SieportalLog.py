@@ -0,0 +1,84 @@
+import time
+import queue
+import logging
+import logging.handlers
+
+from typing import Optional
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+class SampledLog:
+    """Частые однотипные записи (например, успешные ответы): не больше `rate` записей в секунду
+
+    Пропущенные записи не форматируются вовсе; в следующую выведенную добавляется их число.
+    rate=0 - выводить все записи.
+    """
+    def __init__(self, logger: logging.Logger, rate: float = 5.0, level: int = logging.INFO):
+        self.logger = logger
+        self.level = level
+        self.rate = rate
+        self._next = 0.0
+        self.skipped = 0
+
+    def __call__(self, msg: str, *args):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        if self.rate > 0:
+            now = time.monotonic()
+            if now < self._next:
+                self.skipped += 1
+                return
+            self._next = now + 1 / self.rate
+        if self.skipped:
+            msg = f"{msg} (ещё {self.skipped} пропущено)"
+            self.skipped = 0
+        self.logger.log(self.level, msg, *args)
+
+
+class QueueLogging:
+    """Переносит вывод обработчиков корневого логгера в отдельный поток
+
+    Корневые обработчики заменяются одним QueueHandler: в цикле событий запись только
+    форматируется и кладётся в очередь, а запись в консоль или файл идёт в потоке QueueListener.
+    """
+    def __init__(self):
+        self.handlers = []
+        self.listener: Optional[logging.handlers.QueueListener] = None
+
+    def start(self) -> 'QueueLogging':
+        root = logging.getLogger()
+        if self.listener is not None or not root.handlers:
+            return self
+        self.handlers = root.handlers[:]
+        records = queue.SimpleQueue()
+        for handler in self.handlers:
+            root.removeHandler(handler)
+        root.addHandler(logging.handlers.QueueHandler(records))
+        self.listener = logging.handlers.QueueListener(records, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+        return self
+
+    def stop(self):
+        """Дописывает очередь и возвращает обработчики на место"""
+        if self.listener is None:
+            return
+        self.listener.stop()
+        self.listener = None
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            if isinstance(handler, logging.handlers.QueueHandler):
+                root.removeHandler(handler)
+        for handler in self.handlers:
+            root.addHandler(handler)
+        self.handlers = []
+
+    def __enter__(self) -> 'QueueLogging':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,217 @@
+import time
+import asyncio
+import logging
+
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, List, Tuple, Optional, Iterable
+
+from aiohttp import web
+from yarl import URL
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    escaped = (f'{key}="{value.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for key, value in items)
+    return '{' + ','.join(escaped) + '}'
+
+@lru_cache(maxsize=4096)
+def proxy_label(proxy: Optional[str]) -> str:
+    """Прокси без логина и пароля - они не должны попадать в метрики
+
+    Метка прокси ограничена размером пула (host:port), поэтому число рядов
+    счётчиков по прокси не растёт с объёмом обхода.
+    """
+    if proxy is None:
+        return 'direct'
+    url = URL(proxy)
+    return f"{url.host}:{url.port}" if url.host else proxy
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, value: float = 1, **labels):
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+    def total(self, **labels) -> float:
+        """Сумма по всем сериям, у которых совпадают заданные метки"""
+        wanted = set(_labels(labels))
+        return sum(value for key, value in self.values.items() if wanted <= set(key))
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self.values.items():
+            yield f"{self.name}{_format_labels(labels)} {value:g}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.values: Dict[Labels, List[float]] = {}  # Счётчики по корзинам, последняя - +Inf
+        self.sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        counts = self.values.get(key)
+        if counts is None:
+            counts = self.values[key] = [0] * (len(self.buckets) + 1)
+            self.sums[key] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[key] += value
+
+    def count(self, **labels) -> int:
+        wanted = set(_labels(labels))
+        return sum(sum(counts) for key, counts in self.values.items() if wanted <= set(key))
+
+    def quantile(self, q: float, **labels) -> float:
+        """Оценка квантиля по корзинам (верхняя граница корзины)"""
+        wanted = set(_labels(labels))
+        merged = [0] * (len(self.buckets) + 1)
+        for key, counts in self.values.items():
+            if wanted <= set(key):
+                merged = [a + b for a, b in zip(merged, counts)]
+        total = sum(merged)
+        if not total:
+            return 0.0
+        seen = 0
+        for index, count in enumerate(merged):
+            seen += count
+            if seen >= q * total:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, counts in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(labels, ('le', f'{bound:g}' if bound != '+Inf' else bound))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {self.sums[labels]:g}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+class MetricsRegistry:
+    """Общий на процесс набор метрик
+
+    Счётчики и гистограммы по эндпоинтам, статусам и прокси. Отдаются в формате
+    Prometheus через MetricsServer и раз в `interval` секунд сводкой в лог.
+    """
+    def __init__(self):
+        self.requests = Counter('sieportal_requests_total', 'HTTP попытки по эндпоинтам и статусам (0 - сетевая ошибка)')
+        self.results = Counter('sieportal_results_total', 'Итог запросов с учётом повторов (ok, failed, cache)')
+        self.retries = Counter('sieportal_retries_total', 'Повторы по эндпоинтам и статусам')
+        self.timeouts = Counter('sieportal_timeouts_total', 'Таймауты по эндпоинтам')
+        self.hedges = Counter('sieportal_hedges_total', 'Подстраховочные запросы по эндпоинтам и исходу (won, lost, failed)')
+        self.bytes = Counter('sieportal_response_bytes_total', 'Полученные байты тел ответов')
+        self.proxy_requests = Counter('sieportal_proxy_requests_total', 'HTTP попытки по прокси и исходу')
+        self.proxy_retries = Counter('sieportal_proxy_retries_total', 'Неудачные попытки через прокси, после которых запрос повторён')
+        self.proxy_timeouts = Counter('sieportal_proxy_timeouts_total', 'Таймауты по прокси')
+        self.proxy_bytes = Counter('sieportal_proxy_response_bytes_total', 'Полученные байты тел ответов по прокси')
+        self.latency = Histogram('sieportal_request_seconds', 'Задержка HTTP попыток')
+        self.decode = Histogram('sieportal_decode_seconds', 'Время разбора JSON ответов',
+                                (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+        self.token_refreshes = Counter('sieportal_token_refreshes_total', 'Получения и обновления токенов')
+        self.writer_flush = Histogram('sieportal_writer_flush_seconds', 'Время сохранения буфера на диск')
+        self.writer_rows = Counter('sieportal_writer_rows_total', 'Сохранённые строки')
+        self.loop_lag = Histogram('sieportal_event_loop_lag_seconds', 'Задержка цикла событий',
+                                  (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+        self._metrics = [
+            self.requests, self.results, self.retries, self.timeouts, self.hedges, self.bytes,
+            self.proxy_requests, self.proxy_retries, self.proxy_timeouts, self.proxy_bytes,
+            self.latency, self.decode, self.token_refreshes, self.writer_flush, self.writer_rows, self.loop_lag
+        ]
+        self._last_total = 0.0
+        self._last_time = time.monotonic()
+
+    def render(self) -> str:
+        return '\n'.join(line for metric in self._metrics for line in metric.render()) + '\n'
+
+    def summary(self) -> str:
+        now = time.monotonic()
+        total = self.requests.total()
+        rate = (total - self._last_total) / (now - self._last_time) if now > self._last_time else 0
+        self._last_total, self._last_time = total, now
+
+        statuses: Dict[str, float] = {}
+        for labels, value in self.requests.values.items():
+            status = dict(labels)['status']
+            statuses[status] = statuses.get(status, 0) + value
+        endpoints = sorted({dict(labels)['endpoint'] for labels in self.latency.values})
+        latency = ', '.join(
+            f"{endpoint} p50 {self.latency.quantile(0.5, endpoint=endpoint) * 1000:.0f}/p99 {self.latency.quantile(0.99, endpoint=endpoint) * 1000:.0f} мс"
+            for endpoint in endpoints
+        )
+        flushes = self.writer_flush.count()
+        flush = sum(self.writer_flush.sums.values()) / flushes if flushes else 0
+        decodes = self.decode.count()
+        decode = sum(self.decode.sums.values()) / decodes if decodes else 0
+        return (
+            f"Метрики: {rate:.1f} запросов/сек, всего {total:.0f}, статусы {statuses}, повторов {self.retries.total():.0f}, "
+            f"таймаутов {self.timeouts.total():.0f}, подстраховок {self.hedges.total():.0f} (выиграно {self.hedges.total(outcome='won'):.0f}), {latency}; разбор JSON в среднем {decode * 1000:.2f} мс; токенов получено {self.token_refreshes.total():.0f}; "
+            f"сохранений {flushes}, в среднем {flush * 1000:.0f} мс; задержка цикла p99 {self.loop_lag.quantile(0.99) * 1000:.0f} мс"
+        )
+
+    async def monitor(self, interval: float = 60.0, probe: float = 0.5):
+        """Замеряет задержку цикла событий и раз в `interval` секунд пишет сводку в лог"""
+        last_report = time.monotonic()
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(probe)
+            now = time.monotonic()
+            self.loop_lag.observe(max(0.0, now - started - probe))
+            if interval and now - last_report >= interval:
+                last_report = now
+                logger.info(self.summary())
+
+
+class MetricsServer:
+    """Локальный HTTP эндпоинт /metrics в формате Prometheus"""
+    def __init__(self, registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self.metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type='text/plain', charset='utf-8')
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+METRICS = MetricsRegistry()
@@ -0,0 +1,303 @@
+import time
+import zlib
+import random
+import asyncio
+import logging
+import secrets
+import argparse
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Any
+
+from aiohttp import web
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+# Узел с id n имеет детей n * FANOUT_BASE + i, поэтому глубина узла вычисляется из id
+FANOUT_BASE = 16
+
+@dataclass
+class MockConfig:
+    """Параметры синтетического каталога и поведения стенда"""
+    roots: int = 8
+    fanout: int = 6
+    depth: int = 4
+    products: int = 120  # Среднее количество товаров в листе
+    accessories: float = 0.3  # Доля листьев с аксессуарами
+    accessory_pool: int = 5000  # Аксессуары берутся из общего пула, поэтому повторяются между узлами
+    page_size: int = 50
+    latency: float = 0.05  # Медиана задержки ответа (секунды)
+    latency_sigma: float = 0.5  # Разброс логнормального распределения задержки
+    fault_401: float = 0.0
+    fault_403: float = 0.0
+    fault_429: float = 0.0
+    fault_5xx: float = 0.0
+    token_ttl: float = 3600.0
+    seed: int = 0
+
+
+class MockCatalog:
+    """Детерминированный синтетический каталог: одинаковый seed - одинаковое дерево"""
+    def __init__(self, config: MockConfig):
+        self.config = config
+
+    def roots(self) -> List[int]:
+        return list(range(1, min(self.config.roots, FANOUT_BASE - 1) + 1))
+
+    def _random(self, node_id: int, salt: str = '') -> random.Random:
+        return random.Random(f"{self.config.seed}:{node_id}:{salt}")
+
+    @staticmethod
+    def depth(node_id: int) -> int:
+        return (node_id.bit_length() - 1) // 4
+
+    def exists(self, node_id: int) -> bool:
+        if node_id < 1:
+            return False
+        chain = []
+        while node_id >= FANOUT_BASE:
+            chain.append(node_id % FANOUT_BASE)
+            node_id //= FANOUT_BASE
+        if node_id > len(self.roots()) or len(chain) > self.config.depth:
+            return False
+        parent = node_id
+        for index in reversed(chain):
+            if not 1 <= index <= self.fanout(parent):
+                return False
+            parent = parent * FANOUT_BASE + index
+        return True
+
+    def fanout(self, node_id: int) -> int:
+        if self.depth(node_id) >= self.config.depth:
+            return 0
+        return self._random(node_id, 'fanout').randint(max(1, self.config.fanout // 2), min(FANOUT_BASE - 1, self.config.fanout * 3 // 2))
+
+    def children(self, node_id: int) -> List[int]:
+        return [node_id * FANOUT_BASE + index for index in range(1, self.fanout(node_id) + 1)]
+
+    def product_count(self, node_id: int) -> int:
+        if self.depth(node_id) < self.config.depth:
+            return 0
+        return int(self._random(node_id, 'products').expovariate(1 / self.config.products)) if self.config.products else 0
+
+    def accessory_count(self, node_id: int) -> int:
+        if self.depth(node_id) < self.config.depth or self._random(node_id, 'has_accessories').random() >= self.config.accessories:
+            return 0
+        return self._random(node_id, 'accessories').randint(1, self.config.page_size * 3)
+
+    def products(self, node_id: int, page: int, limit: int) -> Tuple[List[str], int]:
+        count = self.product_count(node_id)
+        start = page * limit
+        return [f"6ES{node_id:X}-{index:05d}" for index in range(start, min(start + limit, count))], count
+
+    def accessories(self, node_id: int, page: int, limit: int) -> Tuple[List[str], int]:
+        count = self.accessory_count(node_id)
+        start = page * limit
+        pool = self.config.accessory_pool
+        return [f"6XV{(node_id * 7919 + index) % pool:06d}" for index in range(start, min(start + limit, count))], count
+
+    def size(self) -> Dict[str, int]:
+        """Размер каталога (обходит всё дерево, только для небольших конфигураций)"""
+        nodes, articles, stack = 0, 0, self.roots()
+        while stack:
+            node_id = stack.pop()
+            nodes += 1
+            articles += self.product_count(node_id) + self.accessory_count(node_id)
+            stack.extend(self.children(node_id))
+        return {"nodes": nodes, "articles": articles}
+
+
+class MockServer:
+    """Локальный стенд SiePortal на aiohttp
+
+    Эмулирует connect/token, GetNodeInformation, GetNodeProducts, GetProductAccessories
+    и GetProductsAndPrices поверх MockCatalog: задержка ответа логнормальная, а с
+    заданной вероятностью отдаются 401, 403, 429 (с Retry-After) и 5xx. Токены
+    истекают через token_ttl, запрос с истёкшим токеном получает 401.
+    """
+    def __init__(self, config: Optional[MockConfig] = None):
+        self.config = config or MockConfig()
+        self.catalog = MockCatalog(self.config)
+        self._tokens: Dict[str, float] = {}
+        self._random = random.Random(self.config.seed)
+        self._runner: Optional[web.AppRunner] = None
+        self.url: Optional[str] = None
+        self.stats: Dict[str, int] = {}
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/connect/token', self.token)
+        app.router.add_get('/api/mall/CatalogTreeApi/GetNodeInformation', self.node_information)
+        app.router.add_post('/api/mall/CatalogTreeApi/GetNodeProducts', self.node_products)
+        app.router.add_post('/api/mall/CatalogTreeApi/GetProductAccessories', self.product_accessories)
+        app.router.add_post('/api/mall/ProductInformation/GetProductsAndPrices', self.products_and_prices)
+        app.router.add_get('/stats', self.get_stats)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        logger.info(f"Стенд SiePortal запущен на {self.url}")
+        return self.url
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _count(self, key: str):
+        self.stats[key] = self.stats.get(key, 0) + 1
+
+    async def _respond(self, request: web.Request, endpoint: str) -> Optional[web.Response]:
+        """Задержка и внедрение ошибок; возвращает ответ-ошибку или None"""
+        config = self.config
+        self._count(endpoint)
+        await asyncio.sleep(self._random.lognormvariate(0, config.latency_sigma) * config.latency if config.latency else 0)
+
+        token = request.headers.get('Authorization', '').rpartition(' ')[2]
+        expires_at = self._tokens.get(token)
+        if expires_at is None or expires_at < time.time() or self._random.random() < config.fault_401:
+            self._count('401')
+            return web.json_response({'error': 'invalid_token'}, status=401)
+        roll = self._random.random()
+        if roll < config.fault_403:
+            self._count('403')
+            return web.Response(status=403)
+        roll -= config.fault_403
+        if roll < config.fault_429:
+            self._count('429')
+            return web.Response(status=429, headers={'Retry-After': '1'})
+        roll -= config.fault_429
+        if roll < config.fault_5xx:
+            self._count('5xx')
+            return web.Response(status=self._random.choice((500, 502, 503)))
+        return None
+
+    async def token(self, request: web.Request) -> web.Response:
+        self._count('token')
+        token = secrets.token_hex(16)
+        self._tokens[token] = time.time() + self.config.token_ttl
+        return web.json_response({'access_token': token, 'expires_in': self.config.token_ttl, 'token_type': 'Bearer'})
+
+    async def node_information(self, request: web.Request) -> web.Response:
+        error = await self._respond(request, 'tree')
+        if error is not None:
+            return error
+        try:
+            node_id = int(request.query.get('NodeId', ''))
+        except ValueError:
+            return web.Response(status=400)
+        if not self.catalog.exists(node_id):
+            return web.json_response({})
+        return web.json_response({
+            'id': node_id,
+            'childNodes': [
+                {'id': child, 'containsProducts': self.catalog.product_count(child) > 0}
+                for child in self.catalog.children(node_id)
+            ],
+            'containsProductInformation': True,
+            'containsProductVariants': self.catalog.product_count(node_id) > 0,
+            'containsRelatedProducts': self.catalog.accessory_count(node_id) > 0,
+        })
+
+    async def _page(self, request: web.Request, endpoint: str, source) -> web.Response:
+        error = await self._respond(request, endpoint)
+        if error is not None:
+            return error
+        try:
+            body = await request.json()
+            node_id = int(body['nodeId'])
+            page = int(body.get('pageNumberIndex', 0))
+            limit = int(body.get('limit', self.config.page_size))
+        except (ValueError, KeyError, TypeError):
+            return web.Response(status=400)
+        articles, count = source(node_id, page, limit) if self.catalog.exists(node_id) else ([], 0)
+        return web.json_response({
+            'products': [{'articleNumber': article} for article in articles],
+            'productCount': count,
+        })
+
+    async def node_products(self, request: web.Request) -> web.Response:
+        return await self._page(request, 'products', self.catalog.products)
+
+    async def product_accessories(self, request: web.Request) -> web.Response:
+        return await self._page(request, 'accessories', self.catalog.accessories)
+
+    async def products_and_prices(self, request: web.Request) -> web.Response:
+        error = await self._respond(request, 'prices')
+        if error is not None:
+            return error
+        try:
+            body = await request.json()
+            products = body['products']
+        except (ValueError, KeyError, TypeError):
+            return web.Response(status=400)
+        result = []
+        for product in products:
+            article = product.get('articleNumber', '')
+            item: Dict[str, Any] = {'itemId': product.get('itemId'), 'articleNumber': article}
+            if not article.endswith('7'):  # У части артикулов цены нет
+                item['productPrice'] = {'uiValueListPrice': f"{zlib.crc32(article.encode()) % 100000 / 100:.2f}"}
+            result.append(item)
+        return web.json_response({'products': result})
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+
+def parse():
+    parser = argparse.ArgumentParser(description='Локальный стенд SiePortal с синтетическим каталогом')
+    add_arguments(parser)
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', '-p', type=int, default=8800)
+    return parser.parse_args()
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Параметры MockConfig для командной строки (используется и в SieportalBench)"""
+    defaults = MockConfig()
+    parser.add_argument('--roots', type=int, default=defaults.roots, help='Количество корневых узлов (до 15)')
+    parser.add_argument('--fanout', type=int, default=defaults.fanout, help='Среднее количество дочерних узлов')
+    parser.add_argument('--depth', type=int, default=defaults.depth, help='Глубина дерева (товары только в листьях)')
+    parser.add_argument('--products', type=int, default=defaults.products, help='Среднее количество товаров в листе')
+    parser.add_argument('--accessories', type=float, default=defaults.accessories, help='Доля листьев с аксессуарами')
+    parser.add_argument('--latency', type=float, default=defaults.latency, help='Медиана задержки ответа (секунды)')
+    parser.add_argument('--latency-sigma', type=float, default=defaults.latency_sigma, help='Разброс задержки (логнормальное распределение)')
+    parser.add_argument('--fault-401', type=float, default=defaults.fault_401, help='Доля ответов 401')
+    parser.add_argument('--fault-403', type=float, default=defaults.fault_403, help='Доля ответов 403')
+    parser.add_argument('--fault-429', type=float, default=defaults.fault_429, help='Доля ответов 429')
+    parser.add_argument('--fault-5xx', type=float, default=defaults.fault_5xx, help='Доля ответов 5xx')
+    parser.add_argument('--token-ttl', type=float, default=defaults.token_ttl, help='Время жизни токена (секунды)')
+    parser.add_argument('--seed', type=int, default=defaults.seed, help='Seed синтетического каталога')
+
+def config_from_args(args) -> MockConfig:
+    return MockConfig(
+        roots=args.roots, fanout=args.fanout, depth=args.depth, products=args.products,
+        accessories=args.accessories, latency=args.latency, latency_sigma=args.latency_sigma,
+        fault_401=args.fault_401, fault_403=args.fault_403, fault_429=args.fault_429,
+        fault_5xx=args.fault_5xx, token_ttl=args.token_ttl, seed=args.seed
+    )
+
+async def main():
+    args = parse()
+    server = MockServer(config_from_args(args))
+    await server.start(args.host, args.port)
+    logger.info(f"Корневые узлы: {server.catalog.roots()}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Стенд остановлен")
@@ -0,0 +1,204 @@
+import time
+import logging
+import asyncio
+
+from pathlib import Path
+from typing import List, Set, Tuple, Optional, AsyncIterator, AsyncIterable, Iterable, Dict, Any
+
+import aiofiles
+import aiocsv
+
+from SieprotalPrice import GetPriceAPI
+from SieportalWriter import Writer
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+async def read_articles(fp: str | Path, column: int | str = 0) -> AsyncIterator[str]:
+    """Построчно читает артикулы из CSV
+
+    Args:
+        - fp: Путь к CSV
+        - column: Номер колонки или её имя (тогда первая строка считается заголовком)
+    """
+    async with aiofiles.open(fp, 'r', newline='') as file:
+        reader = aiocsv.AsyncReader(file)
+        index = column
+        async for line in reader:
+            if isinstance(index, str):
+                # Первая строка - заголовок
+                index = line.index(index)
+                continue
+            if len(line) > index and line[index]:  # Проверка на пустую строку
+                yield line[index]
+
+
+class PricePipeline:
+    """Потоковый конвейер цен
+
+    Артикулы собираются в пакеты и идут в ограниченную очередь, которую разбирает
+    фиксированный пул воркеров, поэтому в полёте всегда `workers` запросов, а
+    результаты пишутся по мере получения. Когда очередь заполнена, `put` ждёт -
+    память не растёт даже на многомиллионных входных файлах.
+    """
+    def __init__(
+        self,
+        api: GetPriceAPI,
+        writer: Writer,
+        currency_code: str,
+        *,
+        workers: int = 8,
+        batch_size: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        report_interval: float = 30.0,
+        keep_unpriced: bool = False
+    ):
+        """Инцилизяция конвейера
+
+        Args:
+            - api: API цен
+            - writer: Куда пишутся строки [артикул, цена]
+            - currency_code: Код валюты
+            - workers: Количество воркеров (= запросов в полёте)
+            - batch_size: Артикулов в одном запросе (по умолчанию GetPriceAPI.BATCH_SIZE)
+            - queue_size: Сколько пакетов может ждать в очереди (по умолчанию 2 * workers)
+            - report_interval: Как часто (в секундах) писать в лог прогресс
+            - keep_unpriced: Записывать артикулы без цены строкой [артикул, '']
+        """
+        self.api = api
+        self.writer = writer
+        self.currency_code = currency_code
+        self.workers = max(1, workers)
+        self.batch_size = batch_size or api.BATCH_SIZE
+        self.report_interval = report_interval
+        self.keep_unpriced = keep_unpriced
+        self.queue: asyncio.Queue[Tuple[int, List[str]]] = asyncio.Queue(maxsize=queue_size or 2 * self.workers)
+
+        self.received = 0
+        self.processed = 0
+        self.priced = 0
+        self.failed = 0
+        self.busy = 0
+        self.started_at: Optional[float] = None
+        self._batch: List[str] = []
+        self._tasks: List[asyncio.Task] = []
+        # Номера пакетов, отправленных в очередь и ещё не записанных в writer
+        self._sequence = 0
+        self._outstanding: Set[int] = set()
+        self._progress = asyncio.Condition()
+
+    def start(self):
+        """Запускает воркеры"""
+        self.started_at = time.monotonic()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reporter()))
+
+    async def put(self, article: str):
+        """Добавляет артикул; ждёт, если очередь заполнена"""
+        self._batch.append(article)
+        self.received += 1
+        if len(self._batch) >= self.batch_size:
+            await self._submit()
+
+    async def _submit(self):
+        batch, self._batch = self._batch, []
+        self._sequence += 1
+        self._outstanding.add(self._sequence)
+        # В пакете бывают артикулы уже завершённых задач обхода, поэтому при отмене
+        # вызывающего пакет всё равно должен попасть в очередь
+        await asyncio.shield(self.queue.put((self._sequence, batch)))
+
+    async def drain(self):
+        """Ждёт, пока все уже добавленные артикулы окажутся в буфере writer-а
+
+        Артикулы, добавленные во время ожидания, не ждёт - поэтому под постоянной
+        нагрузкой drain не зависает.
+        """
+        if self._batch:
+            await self._submit()
+        target = self._sequence
+        async with self._progress:
+            await self._progress.wait_for(lambda: not self._outstanding or min(self._outstanding) > target)
+
+    async def close(self):
+        """Дожидается обработки всех артикулов и останавливает воркеры"""
+        if self._batch:
+            await self._submit()
+        try:
+            await self.queue.join()
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+            self._report()
+
+    async def run(self, articles: AsyncIterable[str] | Iterable[str]):
+        """Прогоняет все артикулы через конвейер"""
+        self.start()
+        try:
+            if isinstance(articles, AsyncIterable):
+                async for article in articles:
+                    await self.put(article)
+            else:
+                for article in articles:
+                    await self.put(article)
+        finally:
+            await self.close()
+
+    async def _worker(self):
+        while True:
+            sequence, batch = await self.queue.get()
+            self.busy += 1
+            try:
+                try:
+                    prices = await self.api.get_prices(batch, self.currency_code, batch_size=len(batch), concurrency=1)
+                except Exception as error:
+                    # Пакет без ответа: его артикулы всё равно пишутся ниже как артикулы без цены
+                    prices = {}
+                    logger.exception(f"Ошибка при запросе цен: {error}")
+                rows = [[article, price] for article, price in prices.items() if price is not None]
+                self.priced += len(rows)
+                self.failed += sum(1 for article in batch if article not in prices)
+                if self.keep_unpriced:
+                    # И артикулы с пустой ценой, и те, которых в ответе нет вовсе
+                    rows.extend([article, ''] for article in batch if prices.get(article) is None)
+                self.writer.extend(rows)
+                if self.writer.full():
+                    await self.writer.submit()
+            except Exception as error:
+                logger.exception(f"Ошибка при записи цен: {error}")
+            finally:
+                self.busy -= 1
+                self.processed += len(batch)
+                self.queue.task_done()
+                async with self._progress:
+                    self._outstanding.discard(sequence)
+                    self._progress.notify_all()
+
+    async def _reporter(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self._report()
+
+    def _report(self):
+        stats = self.get_stats()
+        logger.info(
+            f"Цены: обработано артикулов {stats['processed']} из {stats['received']}, с ценой {stats['priced']}, без ответа {stats['failed']}, "
+            f"в очереди пакетов {stats['queued_batches']}, воркеры {self.busy}/{self.workers}, {stats['rate']} арт./сек."
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "priced": self.priced,
+            "failed": self.failed,
+            "queued_batches": self.queue.qsize(),
+            "rate": round(self.processed / elapsed, 1) if elapsed > 0 else 0
+        }
@@ -0,0 +1,158 @@
+import time
+import random
+import logging
+import asyncio
+
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Any
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class ProxyState:
+    """Здоровье одного прокси"""
+    proxy: str
+    successes: int = 0
+    failures: int = 0
+    bans: int = 0
+    success_rate: float = 1.0  # Скользящее среднее (EWMA) доли успешных ответов
+    latency: Optional[float] = None  # Скользящее среднее (EWMA) времени ответа в секундах
+    in_flight: int = 0
+    quarantined_until: float = 0.0
+
+    def available(self, now: float) -> bool:
+        return self.quarantined_until <= now
+
+
+class ProxyPool:
+    """Пул прокси со счётом здоровья
+
+    Прокси выдаётся на каждый запрос, а не на клиента. Чаще выдаются быстрые прокси
+    с высокой долей успешных ответов, забаненные (403) уходят в карантин, причём
+    каждый следующий бан подряд удваивает время карантина.
+    """
+    def __init__(
+        self,
+        proxies: Optional[List[str]] = None,
+        *,
+        cooldown: float = 60.0,
+        max_cooldown: float = 900.0,
+        alpha: float = 0.2
+    ):
+        """Инцилизяция пула
+
+        Args:
+            - proxies: Список прокси (например из переменной окружения PROXY)
+            - cooldown: Время карантина после первого бана (секунды)
+            - max_cooldown: Максимальное время карантина (секунды)
+            - alpha: Вес нового наблюдения в скользящих средних
+        """
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.alpha = alpha
+        self._states: Dict[str, ProxyState] = {
+            proxy: ProxyState(proxy) for proxy in dict.fromkeys(proxies or []) if proxy
+        }
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def __bool__(self) -> bool:
+        return bool(self._states)
+
+    async def acquire(self, exclude: Optional[str] = None) -> Optional[str]:
+        """Выбирает прокси для одного запроса; если все в карантине - ждёт ближайший
+
+        Args:
+            - exclude: Прокси, которого по возможности нужно избежать
+
+        Returns:
+            Optional[str] - прокси или None, если пул пуст
+        """
+        if not self._states:
+            return None
+        while True:
+            now = time.monotonic()
+            available = [state for state in self._states.values() if state.available(now)]
+            if available:
+                if exclude is not None and len(available) > 1:
+                    available = [state for state in available if state.proxy != exclude]
+                state = random.choices(available, weights=[self._weight(state) for state in available])[0]
+                state.in_flight += 1
+                return state.proxy
+            wait = min(state.quarantined_until for state in self._states.values()) - now
+            logger.warning(f"Все прокси в карантине, ждём {wait:.1f} сек.")
+            await asyncio.sleep(wait)
+
+    def _weight(self, state: ProxyState) -> float:
+        # Для ещё не измеренных прокси берём среднюю задержку, чтобы они тоже получали трафик
+        latency = state.latency if state.latency is not None else self._average_latency()
+        return max(state.success_rate, 0.05) ** 2 / max(latency, 0.01) / (1 + state.in_flight)
+
+    def _average_latency(self) -> float:
+        latencies = [state.latency for state in self._states.values() if state.latency is not None]
+        return sum(latencies) / len(latencies) if latencies else 1.0
+
+    def report(self, proxy: Optional[str], ok: bool, latency: Optional[float] = None, *, banned: bool = False):
+        """Учитывает результат запроса через прокси
+
+        Args:
+            - proxy: Прокси, выданный acquire
+            - ok: Запрос успешен
+            - latency: Время ответа в секундах
+            - banned: Прокси получил бан (403) и уходит в карантин
+        """
+        state = self._states.get(proxy)
+        if state is None:
+            return
+        state.in_flight = max(0, state.in_flight - 1)
+        state.success_rate += self.alpha * ((1.0 if ok else 0.0) - state.success_rate)
+        if ok:
+            state.successes += 1
+            state.bans = 0
+            if latency is not None:
+                state.latency = latency if state.latency is None else state.latency + self.alpha * (latency - state.latency)
+        else:
+            state.failures += 1
+        if banned:
+            self.ban(proxy)
+
+    def release(self, proxy: Optional[str], elapsed: Optional[float] = None):
+        """Возвращает прокси отменённого запроса без вердикта
+
+        Args:
+            - proxy: Прокси, выданный acquire
+            - elapsed: Сколько запрос уже шёл; если дольше средней задержки прокси, она растёт до этого значения
+        """
+        state = self._states.get(proxy)
+        if state is None:
+            return
+        state.in_flight = max(0, state.in_flight - 1)
+        if elapsed is not None and state.latency is not None and elapsed > state.latency:
+            state.latency += self.alpha * (elapsed - state.latency)
+
+    def ban(self, proxy: str):
+        """Отправляет прокси в карантин"""
+        state = self._states.get(proxy)
+        if state is None:
+            return
+        state.bans += 1
+        cooldown = min(self.cooldown * 2 ** (state.bans - 1), self.max_cooldown)
+        state.quarantined_until = time.monotonic() + cooldown
+        logger.warning(f"Прокси {proxy} в карантине на {cooldown:.0f} сек.")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Возвращает статистику пула"""
+        now = time.monotonic()
+        return {
+            "proxies": len(self._states),
+            "available": sum(state.available(now) for state in self._states.values()),
+            "quarantined": sum(not state.available(now) for state in self._states.values()),
+            "successes": sum(state.successes for state in self._states.values()),
+            "failures": sum(state.failures for state in self._states.values())
+        }
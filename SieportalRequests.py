@@ -1,14 +1,25 @@
+import time
 import logging
 import asyncio
 
-from typing import List, Dict, Optional, Any
-from itertools import cycle
+from typing import List, Dict, Optional, Any, Tuple
 from http import HTTPStatus
+from dataclasses import dataclass
 
 import aiohttp
 
-from SieportalToken import Token
-from SieprotalTools import find_first_key
+from SieportalError import HttpStatusError, TransportError, DecodeError
+from SieportalToken import TokenRegistry, TOKENS
+from SieportalProxy import ProxyPool
+from SieportalLimiter import AdaptiveController, endpoint_name
+from SieportalRetry import RetryPolicy, NETWORK_ERROR, parse_retry_after
+from SieportalCache import ResponseCache
+from SieportalTransport import Transport
+from SieportalBackend import AiohttpBackend, HttpResponse
+from SieportalHedge import HedgePolicy
+from SieportalMetrics import METRICS, proxy_label
+from SieportalDecode import Decoder, decode_json
+from SieportalLog import SampledLog
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,118 +28,360 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Успешные ответы идут сотнями в секунду - в лог попадает не больше SUCCESS_LOG.rate в секунду
+SUCCESS_LOG = SampledLog(logger)
+
+def _succeeded(task: asyncio.Future) -> bool:
+    """Попытка завершилась ответом без ошибки (статус < 400)"""
+    return not task.cancelled() and task.exception() is None and task.result().status < 400
+
+@dataclass
+class RequestContext:
+    """Что запрашивается - для логов; строка собирается, только когда запись действительно выводится"""
+    endpoint: Optional[str] = None
+    node: Optional[int | str] = None
+    page: Optional[int | str] = None
+    article: Optional[str] = None
+    items: int = 1  # Артикулов в пакетном запросе
+
+    def __str__(self) -> str:
+        if self.article is not None:
+            return f"артикула: {self.article}" + (f" и ещё {self.items - 1}" if self.items > 1 else "")
+        if self.page is not None:
+            return f"{self.endpoint}: {self.node}, page: {self.page}"
+        if self.node is not None:
+            return f"ветки: {self.node}"
+        return str(self.endpoint)
+
+
 class requests:
     def __init__(
         self, 
         session: aiohttp.ClientSession, 
-        token: Token,
+        tokens: Optional[TokenRegistry] = None,
         max_try: int = 3,
         *,
         proxy_list: List[str] = None,
         use_proxy: bool = False,
-        sleep_time: int | float = 1.0 
+        sleep_time: int | float = 1.0,
+        proxy_pool: Optional[ProxyPool] = None,
+        controller: Optional[AdaptiveController] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        cache: Optional[ResponseCache] = None,
+        transport: Optional[Transport] = None,
+        hedge: Optional[HedgePolicy] = None
         ):
         """Инцилизяция класса
         
         Args:
             - session: aiohttp.ClientSession - Хранит сеццию
+            - tokens: Реестр токенов (по умолчанию общий на процесс TOKENS)
             - max_try: Максимальное количество попыток (при -1 будут бесконечные попытки [НЕ РЕКЕМЕНДУЕСТЯ])
+            - proxy_pool: Общий пул прокси (если не задан, создаётся из proxy_list)
+            - controller: Адаптивный контроллер параллельности (None - без ограничений)
+            - retry_policy: Политика повторов (по умолчанию своя, с базовой задержкой sleep_time)
+            - cache: Постоянный кэш ответов (None - без кэша)
+            - transport: Пулы соединений, таймауты по эндпоинтам и HTTP бэкенд (None - всё через session с её настройками)
+            - hedge: Подстраховка медленных запросов копией через другой прокси (None - без подстраховки)
         """
         
-        self.total_requests = 0
+        self.total_requests = 0  # Запросы (вызовы request), повторы не считаются
+        self.attempts = 0  # HTTP попытки, включая повторы
         self.error_requests = 0
         self.sleep_time = sleep_time
         
         self.max_try = max_try
         self.session = session
-        self.token = token or Token(session)
+        self.tokens = tokens or TOKENS
         
-        self.proxy_list = cycle(proxy_list if proxy_list else [])
+        self.proxy_pool = proxy_pool if proxy_pool is not None else ProxyPool(proxy_list)
         self.use_proxy = use_proxy
-        self.current_proxy = None
+        self.controller = controller
+        self.retry_policy = retry_policy or RetryPolicy(base = sleep_time)
+        self.cache = cache
+        self.transport = transport
+        self.backend = transport.backend if transport is not None else AiohttpBackend(session)
+        self.hedge = hedge
+        
+    async def request(self, method: str, url: str, *, decode: Decoder = decode_json, context: Optional[RequestContext] = None, **kwargs) -> Optional[Any]:
+        """Запрос с повторами; тело ответа читается один раз и разбирается `decode`
         
-    async def request(self, method: str, url: str, *args, **kwargs) -> Optional[Dict[str, Any]]:
+        Args:
+            - decode: Разбор тела ответа (по умолчанию весь JSON, для страниц товаров - только нужные поля)
+            - context: Узел, страница или артикул запроса для логов (задают методы API)
+        """
         current_requests = self.max_try
         
-        if (node := find_first_key(kwargs, 'NodeId')):
-            current_node = "ветки: {}".format(node)
-        elif (product := find_first_key(kwargs, 'nodeId')):
-            current_node = "{}: {}, page: {}".format(url, product, find_first_key(kwargs, 'pageNumberIndex'))
-        elif (product := find_first_key(kwargs, 'articleNumber')):
-            current_node = "артикула: {}".format(product)
-        else:
-            current_node = url
+        endpoint = endpoint_name(url)
+        if context is None:
+            context = RequestContext(endpoint)
+        elif context.endpoint is None:
+            context.endpoint = endpoint
+        self.total_requests += 1
+        cache_key = entry = None
+        if self.cache is not None and self.cache.enabled_for(endpoint):
+            cache_key = self.cache.key(method, url, kwargs.get('params'), kwargs.get('json'))
+            entry = await self.cache.get(cache_key, endpoint)
+            if entry is not None and (entry.fresh or self.cache.offline):
+                METRICS.results.inc(endpoint=endpoint, result='cache')
+                return self._decode(decode, entry.body, endpoint)
+            if self.cache.offline:
+                self.error_requests += 1
+                METRICS.results.inc(endpoint=endpoint, result='failed')
+                return None
         
+        breaker = self.retry_policy.breaker(endpoint)
+        self.retry_policy.budget.deposit()
+        hedge = self.hedge if self.hedge is not None and self.hedge.enabled_for(endpoint) else None
+        if hedge is not None:
+            hedge.deposit()
+        attempt = 0
         while current_requests != 0:
             current_requests -= 1
+            attempt += 1
+            if not breaker.allow():
+                # Разомкнутый предохранитель не отменяет запрос: ждём пробного окна, попытка не тратится
+                waited = await breaker.wait()
+                logger.debug("Предохранитель '%s': '%s' ждал %.1f сек.", endpoint, context, waited)
+            
+            proxy = None
+            limits = []
+            started = time.monotonic()
+            ok = banned = throttled = False
+            status = NETWORK_ERROR
+            retry_after = None
+            attempt_sent = False
+            code = NETWORK_ERROR  # Статус ответа для метрик
             try:
-                self.total_requests += 1
-                async with self.session.request(
-                    method, 
-                    url, 
-                    *args, **kwargs,
-                    proxy = self.current_proxy,
-                    headers = await self.token.get_headers(self.current_proxy)
-                ) as response:
-                    response.raise_for_status()
-                    logger.info(f"200 - для '{current_node}'")
-                    return await response.json()
+                if self.controller is not None:
+                    limits.append(await self.controller.acquire('endpoint', endpoint))
+                proxy = await self.proxy_pool.acquire() if self.use_proxy else None
+                if self.controller is not None and proxy is not None:
+                    limits.append(await self.controller.acquire('proxy', proxy))
+                
+                token = self.tokens.get(self.session, proxy)
+                headers = await token.get_headers()
+                if entry is not None:
+                    # Устаревшая запись кэша - просим сервер подтвердить её вместо полного ответа
+                    if entry.etag:
+                        headers['If-None-Match'] = entry.etag
+                    if entry.last_modified:
+                        headers['If-Modified-Since'] = entry.last_modified
+                if self.transport is not None:
+                    headers |= self.transport.headers()
+                    kwargs.setdefault('timeout', self.transport.timeout_for(endpoint))
+                self.attempts += 1
+                attempt_sent = True
+                started = time.monotonic()
+                hedge_delay = hedge.delay(endpoint) if hedge is not None else None
+                if hedge_delay is not None:
+                    response, proxy = await self._hedged(method, url, proxy, headers, hedge_delay, endpoint, kwargs)
+                else:
+                    response = await self.backend.request(method, url, proxy = proxy, headers = headers, **kwargs)
+                code = response.status
+                if response.status == HTTPStatus.NOT_MODIFIED and entry is not None:
+                    ok = True
+                    await self.cache.touch(cache_key)
+                    METRICS.results.inc(endpoint=endpoint, result='cache')
+                    return self._decode(decode, entry.body, endpoint)
+                if response.status >= 400:
+                    raise HttpStatusError(response.status, response.headers)
+                SUCCESS_LOG("200 - для '%s'", context)
+                body = response.body
+                METRICS.bytes.inc(len(body), endpoint=endpoint)
+                if proxy is not None:
+                    METRICS.proxy_bytes.inc(len(body), proxy=proxy_label(proxy))
+                data = self._decode(decode, body, endpoint)
+                ok = True
+                METRICS.results.inc(endpoint=endpoint, result='ok')
+                if cache_key is not None and data is not None:
+                    await self.cache.put(cache_key, endpoint, body, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+                return data
                 
-            except aiohttp.ClientResponseError as error:
+            except HttpStatusError as error:
+                status = error.status
+                retry_after = parse_retry_after(error.headers.get('Retry-After')) if error.headers else None
                 if error.status == HTTPStatus.BAD_REQUEST:
+                    ok = True  # Прокси отработал нормально, ошибка в самом запросе
                     self.error_requests += 1
-                    logger.warning(f"400 - для '{current_node}' попытка {self.max_try - current_requests} из {self.max_try}")
+                    METRICS.results.inc(endpoint=endpoint, result='failed')
+                    logger.warning("400 - для '%s' попытка %d из %d", context, attempt, self.max_try)
                     return None
                 
                 elif error.status == HTTPStatus.UNAUTHORIZED:
-                    logger.info(f"401 - для '{current_node}' попытка {self.max_try - current_requests} из {self.max_try}")
-                    await self.token.update(self.current_proxy)
+                    logger.info("401 - для '%s' попытка %d из %d", context, attempt, self.max_try)
+                    await token.update(stale = headers.get('Authorization'))
                 
                 elif error.status == HTTPStatus.FORBIDDEN:
-                    logger.warning(f"403 - для '{current_node}' попытка {self.max_try - current_requests} из {self.max_try}")
-                    if self.use_proxy and self.proxy_list:
-                        self.current_proxy = next(self.proxy_list)
-                        logger.info(f"Используем прокси: {self.current_proxy}")
-                        try:
-                            self.token.update(self.current_proxy)
-                        except aiohttp.ClientResponseError as e:
-                            if e.status == HTTPStatus.FORBIDDEN:
-                                continue
+                    logger.warning("403 - для '%s' попытка %d из %d", context, attempt, self.max_try)
+                    # Прокси забанен - в карантин, следующая попытка пойдёт через другой
+                    banned = proxy is not None
+                    throttled = True
+                
+                elif error.status == HTTPStatus.TOO_MANY_REQUESTS:
+                    logger.warning("429 - для '%s' попытка %d из %d", context, attempt, self.max_try)
+                    throttled = True
                         
                 elif 500 <= error.status <= 599:
-                    logger.warning(f"Ошибка сервера попытка {self.max_try - current_requests} из {self.max_try} для {current_node}")
+                    logger.warning("Ошибка сервера попытка %d из %d для %s", attempt, self.max_try, context)
+                    throttled = True
                 
                 else:
-                    logger.error(f"Неизвестный код: '{error.status}' для {current_node}")
-                
-                await asyncio.sleep(self.sleep_time)
+                    logger.error("Неизвестный код: '%s' для %s", error.status, context)
             
-            except aiohttp.ClientError as error:
-                logger.warning(f"Ошибка {error} для '{current_node}'")
-                await asyncio.sleep(self.sleep_time)
+            except DecodeError as error:
+                # Ответ получен, прокси и сервер отработали нормально - повтор вернёт то же тело
+                ok = True
+                self.error_requests += 1
+                METRICS.results.inc(endpoint=endpoint, result='failed')
+                logger.error("Ответ для '%s' не разобран: %s", context, error.__cause__)
+                return None
             
             except asyncio.TimeoutError:
-                logger.warning(f"Таймаут для '{current_node}' попытка {self.max_try - current_requests} из {self.max_try}")
-                await asyncio.sleep(self.sleep_time)
+                # Бэкенды поднимают таймаут попытки как asyncio.TimeoutError
+                METRICS.timeouts.inc(endpoint=endpoint)
+                if proxy is not None:
+                    METRICS.proxy_timeouts.inc(proxy=proxy_label(proxy))
+                logger.warning("Таймаут для '%s' попытка %d из %d", context, attempt, self.max_try)
+            
+            except TransportError as error:
+                logger.warning("Ошибка %s для '%s'", error, context)
                 
             except Exception as error:
-                logger.error(f"Неизвестная ошибка {error} для {current_node}")
-                await asyncio.sleep(self.sleep_time)
+                logger.error("Неизвестная ошибка %s для %s", error, context)
+            
+            finally:
+                latency = time.monotonic() - started
+                if attempt_sent:
+                    METRICS.requests.inc(endpoint=endpoint, status=code)
+                    METRICS.latency.observe(latency, endpoint=endpoint)
+                    if proxy is not None:
+                        METRICS.proxy_requests.inc(proxy=proxy_label(proxy), outcome='ok' if ok else 'banned' if banned else 'failed')
+                self.proxy_pool.report(proxy, ok, latency, banned = banned)
+                if limits:
+                    self.controller.release(limits, ok, latency, throttled = throttled)
+                if ok and hedge is not None:
+                    hedge.observe(endpoint, latency)
+                if ok:
+                    breaker.record(True)
+                elif self.retry_policy.policy_for(status).breaker:
+                    breaker.record(False)
+                else:
+                    breaker.release_probe()
+            
+            if not self.retry_policy.policy_for(status).retry or current_requests == 0:
+                break
+            if not self.retry_policy.budget.withdraw():
+                logger.warning("Бюджет повторов исчерпан, '%s' не повторяется", context)
+                break
+            METRICS.retries.inc(endpoint=endpoint, status=status)
+            if proxy is not None:
+                METRICS.proxy_retries.inc(proxy=proxy_label(proxy))
+            # Место под лимитами уже освобождено, ждём вне их
+            await asyncio.sleep(self.retry_policy.delay(attempt, status, retry_after))
         self.error_requests += 1
-        logger.warning(f"{current_node} не был получен за {self.max_try} попытки")
+        METRICS.results.inc(endpoint=endpoint, result='failed')
+        logger.warning("%s не был получен за %d попытки", context, attempt)
+    
+    async def _hedged(
+        self, method: str, url: str, proxy: Optional[str], headers: Dict[str, str], delay: float, endpoint: str, kwargs: Dict[str, Any]
+    ) -> Tuple[HttpResponse, Optional[str]]:
+        """Попытка с подстраховкой: если ответа нет `delay` секунд, та же попытка уходит через другой прокси
+        
+        Побеждает первый успешный ответ, второй запрос отменяется. Если первая завершившаяся попытка
+        неудачна (ошибка или статус >= 400), ждём вторую; неудача - только если неудачны обе, и тогда
+        возвращается результат первой попытки. Возвращает ответ и прокси, через который он получен.
+        """
+        sent = time.monotonic()
+        primary = asyncio.ensure_future(self.backend.request(method, url, proxy = proxy, headers = headers, **kwargs))
+        backup = backup_proxy = None
+        holding = False  # backup_proxy взят из пула и ещё никому не передан
+        try:
+            done, _ = await asyncio.wait((primary,), timeout = delay)
+            if done or not self.hedge.allow():
+                return await primary, proxy
+            
+            backup_proxy = await self.proxy_pool.acquire(exclude = proxy) if self.use_proxy else None
+            if backup_proxy is not None and backup_proxy == proxy:
+                # Другого прокси сейчас нет - копия через тот же не поможет
+                self.proxy_pool.release(backup_proxy)
+                return await primary, proxy
+            holding = True
+            backup_headers = headers | await self.tokens.get(self.session, backup_proxy).get_headers()
+            self.hedge.hedged += 1
+            self.attempts += 1
+            started = time.monotonic()
+            backup = asyncio.ensure_future(self.backend.request(method, url, proxy = backup_proxy, headers = backup_headers, **kwargs))
+            
+            # Обе попытки равноправны: неудача первой завершившейся - повод дождаться второй
+            winner = None
+            pending = {primary, backup}
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when = asyncio.FIRST_COMPLETED)
+                winner = next((task for task in (primary, backup) if task in done and _succeeded(task)), None)
+            
+            holding = False  # Прокси победителя возвращает в пул вызывающий, проигравшего - _settle ниже
+            if winner is backup:
+                self.hedge.won += 1
+                METRICS.hedges.inc(endpoint = endpoint, outcome = 'won')
+                primary.cancel()
+                self._settle(primary, proxy, sent)
+                return backup.result(), backup_proxy
+            
+            if self._settle(backup, backup_proxy, started):
+                METRICS.hedges.inc(endpoint = endpoint, outcome = 'lost')
+            else:
+                self.hedge.failed += 1
+                METRICS.hedges.inc(endpoint = endpoint, outcome = 'failed')
+            # Первая попытка успешна или неудачны обе - результат (или ошибка) первой
+            return primary.result(), proxy
+        finally:
+            for task in (primary, backup):
+                if task is None:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # Ошибка проигравшего запроса не нужна
+            if holding:
+                # Копия не ушла (не получен токен) или ожидание отменено - прокси копии возвращается в пул
+                if backup is not None:
+                    self._settle(backup, backup_proxy, started)
+                else:
+                    self.proxy_pool.release(backup_proxy)
+    
+    def _settle(self, task: asyncio.Future, proxy: Optional[str], started: float) -> bool:
+        """Возвращает в пул прокси проигравшей попытки; False - попытка завершилась неудачей"""
+        if task.done() and not task.cancelled() and not _succeeded(task):
+            status = task.result().status if task.exception() is None else None
+            self.proxy_pool.report(proxy, False, banned = status == HTTPStatus.FORBIDDEN and proxy is not None)
+            return False
+        self.proxy_pool.release(proxy, time.monotonic() - started)
+        return True
+    
+    @staticmethod
+    def _decode(decode: Decoder, body: bytes, endpoint: str) -> Any:
+        started = time.perf_counter()
+        try:
+            data = decode(body)
+        except Exception as error:
+            raise DecodeError(endpoint) from error
+        METRICS.decode.observe(time.perf_counter() - started, endpoint=endpoint)
+        return data
     
-    async def get(self, url: str, *args, **kwargs):
-        return await self.request("GET", url, *args, **kwargs)
+    async def get(self, url: str, **kwargs):
+        return await self.request("GET", url, **kwargs)
     
-    async def post(self, url: str, *args, **kwargs):
-        return await self.request("POST", url, *args, **kwargs)
+    async def post(self, url: str, **kwargs):
+        return await self.request("POST", url, **kwargs)
     
     def get_stats(self) -> Dict[str, int]:
-        """Возвращает статистику запросов"""
+        """Возвращает статистику запросов (подробные метрики - в METRICS)"""
         success_requests = self.total_requests - self.error_requests
         success_rate = (success_requests / self.total_requests * 100) if self.total_requests > 0 else 0
         return {
             "total_requests": self.total_requests,
+            "attempts": self.attempts,
             "error_requests": self.error_requests,
             "success_requests": success_requests,
             "success_rate": round(success_rate, 2)
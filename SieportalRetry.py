@@ -0,0 +1,214 @@
+import time
+import random
+import asyncio
+import logging
+
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Any
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+# Ключ политики для сетевых ошибок и таймаутов (ответа со статусом нет)
+NETWORK_ERROR = 0
+
+@dataclass
+class StatusPolicy:
+    """Как повторять запрос после ответа с определённым статусом"""
+    retry: bool = True
+    base: Optional[float] = None  # Базовая задержка (None - общая из RetryPolicy)
+    breaker: bool = False  # Считать ли ответ отказом эндпоинта для CircuitBreaker
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбирает заголовок Retry-After (секунды или HTTP дата) в секунды ожидания"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+class RetryBudget:
+    """Общий бюджет повторов: не больше `ratio` повторов на каждый живой запрос
+
+    Каждый новый запрос кладёт в бюджет `ratio` токена, каждый повтор забирает один.
+    `minimum` повторов в секунду разрешено всегда, чтобы при малом трафике не остаться без повторов.
+    """
+    def __init__(self, ratio: float = 0.2, *, minimum: float = 5.0, maximum: float = 1000.0):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.maximum = maximum
+        self._tokens = 0.0
+        self._reserve = minimum
+        self._reserve_at = time.monotonic()
+        self.exhausted = 0
+
+    def deposit(self):
+        self._tokens = min(self.maximum, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Возвращает True, если повтор разрешён"""
+        now = time.monotonic()
+        self._reserve = min(self.minimum, self._reserve + (now - self._reserve_at) * self.minimum)
+        self._reserve_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        if self._reserve >= 1:
+            self._reserve -= 1
+            return True
+        self.exhausted += 1
+        return False
+
+
+class CircuitBreaker:
+    """Предохранитель эндпоинта
+
+    После `threshold` отказов подряд размыкается на `reset_timeout` секунд, и запросы
+    ждут (`wait`) вместо отправки. Затем пропускает один пробный запрос: успех замыкает цепь
+    и отпускает ожидающих, отказ снова размыкает её.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, *, threshold: int = 20, reset_timeout: float = 30.0):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probe = False
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос сейчас"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe = False
+        if self.state == self.HALF_OPEN and not self._probe:
+            self._probe = True
+            return True
+        return False
+
+    def retry_in(self) -> float:
+        """Через сколько секунд снова проверить `allow`"""
+        if self.state == self.OPEN:
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic()) + random.uniform(0, 0.1)
+        # Пробный запрос в полёте - ждём его вердикта
+        return random.uniform(0.1, min(1.0, self.reset_timeout))
+
+    async def wait(self) -> float:
+        """Ждёт, пока предохранитель пропустит запрос; возвращает время ожидания (секунды)"""
+        started = time.monotonic()
+        while not self.allow():
+            await asyncio.sleep(self.retry_in())
+        return time.monotonic() - started
+
+    def record(self, success: bool):
+        if success:
+            if self.state != self.CLOSED:
+                logger.info(f"Предохранитель '{self.name}' замкнут")
+            self.state = self.CLOSED
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+                logger.warning(f"Предохранитель '{self.name}' разомкнут на {self.reset_timeout:.0f} сек. после {self.failures} отказов")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Пробный запрос завершился без вердикта (например 403 прокси) - пропустить следующий"""
+        if self.state == self.HALF_OPEN:
+            self._probe = False
+
+
+class RetryPolicy:
+    """Политика повторов: экспоненциальная задержка с полным джиттером, Retry-After,
+    политики по статусам, общий бюджет повторов и предохранители по эндпоинтам
+    """
+    DEFAULT_STATUSES = {
+        400: StatusPolicy(retry=False),
+        401: StatusPolicy(base=0.0),  # Токен уже обновлён, повторяем сразу
+        403: StatusPolicy(base=0.1),  # Следующая попытка пойдёт через другой прокси
+        404: StatusPolicy(retry=False),
+        429: StatusPolicy(base=2.0, breaker=True),
+        NETWORK_ERROR: StatusPolicy(breaker=True),
+    }
+
+    def __init__(
+        self,
+        base: float = 0.5,
+        cap: float = 30.0,
+        *,
+        statuses: Optional[Dict[int, StatusPolicy]] = None,
+        budget: Optional[RetryBudget] = None,
+        max_retry_after: float = 120.0,
+        breaker_threshold: int = 20,
+        breaker_timeout: float = 30.0
+    ):
+        """Инцилизяция политики
+
+        Args:
+            - base: Базовая задержка повтора (секунды), растёт как base * 2 ** попытка
+            - cap: Максимальная задержка повтора (секунды)
+            - statuses: Политики по статусам поверх DEFAULT_STATUSES (5xx по умолчанию повторяются и размыкают предохранитель)
+            - budget: Общий бюджет повторов (по умолчанию 20% от живого трафика)
+            - max_retry_after: Больше этого Retry-After не ждём
+            - breaker_threshold: Отказов подряд до размыкания предохранителя
+            - breaker_timeout: Время разомкнутого состояния (секунды)
+        """
+        self.base = base
+        self.cap = cap
+        self.statuses = self.DEFAULT_STATUSES | (statuses or {})
+        self.budget = budget or RetryBudget()
+        self.max_retry_after = max_retry_after
+        self.breaker_threshold = breaker_threshold
+        self.breaker_timeout = breaker_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def policy_for(self, status: int) -> StatusPolicy:
+        policy = self.statuses.get(status)
+        if policy is None:
+            policy = StatusPolicy(breaker=True) if 500 <= status <= 599 else StatusPolicy()
+        return policy
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = CircuitBreaker(
+                endpoint, threshold=self.breaker_threshold, reset_timeout=self.breaker_timeout
+            )
+        return breaker
+
+    def delay(self, attempt: int, status: int = NETWORK_ERROR, retry_after: Optional[float] = None) -> float:
+        """Задержка перед повтором номер `attempt` (с 1)"""
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after) + random.uniform(0, self.base)
+        base = self.policy_for(status).base
+        base = self.base if base is None else base
+        return random.uniform(0, min(self.cap, base * 2 ** (attempt - 1)))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "budget_exhausted": self.budget.exhausted,
+            "breakers": {name: breaker.state for name, breaker in self._breakers.items()},
+            "breaker_trips": sum(breaker.opened for breaker in self._breakers.values())
+        }
@@ -0,0 +1,107 @@
+import time
+import asyncio
+import itertools
+import logging
+
+from typing import Dict, Optional, Any, Tuple
+
+from SieportalTyping import CrawlTask, TASK_NODE
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+POLICY_BFS = 'bfs'  # По уровням дерева
+POLICY_DFS = 'dfs'  # Сначала вглубь: последняя добавленная задача первой
+POLICY_COUNT = 'count'  # Сначала узлы и страницы с наибольшим известным productCount, при равном - более глубокие
+POLICY_FLAGGED = 'flagged'  # Сначала страницы товаров, затем узлы с товарами (containsProducts), затем остальные
+POLICIES = (POLICY_BFS, POLICY_DFS, POLICY_COUNT, POLICY_FLAGGED)
+
+class Frontier(asyncio.PriorityQueue):
+    """Очередь задач обхода в порядке политики `policy`
+
+    Элементы очереди - (приоритет, порядковый номер, задача): при равном приоритете
+    задачи идут в порядке добавления. Подсказки `count` и `flagged` известны только
+    при добавлении из ответа родителя; для задач из журнала берутся `counts`.
+    """
+    def __init__(self, policy: str = POLICY_BFS, counts: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            - policy: Порядок обхода (bfs, dfs, count, flagged)
+            - counts: Известные productCount поддеревьев по узлам (например, из прошлого обхода в CatalogStore)
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Неизвестная политика обхода: {policy}")
+        super().__init__()
+        self.policy = policy
+        self.counts = counts or {}
+        self._order = itertools.count()
+
+    def push(self, task: CrawlTask, *, count: Optional[int] = None, flagged: Optional[bool] = None):
+        """Добавляет задачу
+
+        Args:
+            - count: productCount, если известен (для страниц - из первой страницы узла)
+            - flagged: У узла есть товары (containsProducts из ответа родителя)
+        """
+        order = next(self._order)
+        self.put_nowait((self.priority(task, order, count, flagged), order, task))
+
+    def priority(self, task: CrawlTask, order: int, count: Optional[int], flagged: Optional[bool]) -> Tuple[int, ...]:
+        if self.policy == POLICY_DFS:
+            return (-order,)
+        if self.policy == POLICY_COUNT:
+            # Без истории обхода counts пуст, и порядок сводится к обходу вглубь: листья с товарами раньше
+            return (-(count if count is not None else self.counts.get(str(task.node_id), 0)), -task.depth)
+        if self.policy == POLICY_FLAGGED:
+            if task.kind != TASK_NODE:
+                return (0,)
+            if flagged is None:
+                flagged = self.counts.get(str(task.node_id), 0) > 0
+            return (1 if flagged else 2,)
+        return (task.depth,)
+
+
+class CrawlQuota:
+    """Ограничение обхода по времени и числу запросов, общее для всех обходов процесса
+
+    Каждая задача очереди - один запрос к API, поэтому запросы считаются по взятым задачам.
+    """
+    def __init__(self, seconds: Optional[float] = None, requests: Optional[int] = None):
+        """
+        Args:
+            - seconds: Сколько секунд можно обходить (от создания квоты)
+            - requests: Сколько задач (запросов к API) можно выполнить
+        """
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds if seconds else None
+        self.requests = requests
+        self.used = 0
+
+    def remaining(self) -> Optional[float]:
+        """Оставшееся время в секундах (None - без ограничения)"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def exhausted(self) -> bool:
+        if self.requests is not None and self.used >= self.requests:
+            return True
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def take(self) -> bool:
+        """Разрешает ещё один запрос; False - квота исчерпана"""
+        if self.exhausted():
+            return False
+        self.used += 1
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "requests_used": self.used,
+            "requests_budget": self.requests,
+            "time_left": round(self.remaining(), 1) if self.deadline is not None else None
+        }
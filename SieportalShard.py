@@ -0,0 +1,343 @@
+import sys
+import time
+import socket
+import sqlite3
+import asyncio
+import logging
+import threading
+
+from pathlib import Path
+from typing import List, Dict, Optional, Callable, Awaitable, Sequence, Any
+
+from SieportalTyping import CrawlTask, TASK_NODE
+from SieportalSeen import SeenSet
+from SieportalWriter import Writer
+from SieportalCrawler import Crawler
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+STATE_PENDING = 'pending'
+STATE_LEASED = 'leased'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+class LeaseQueue:
+    """Общая очередь поддеревьев для нескольких процессов в SQLite
+
+    Задача - узел дерева, который процесс обходит целиком вместе со всеми потомками.
+    Процесс берёт задачу в аренду на `ttl` секунд и продлевает её, пока жив; аренда
+    упавшего процесса истекает, и задачу забирает другой. Задача, аренда которой
+    истекала `max_attempts` раз, помечается failed, чтобы одно "ядовитое" поддерево
+    не роняло процессы по кругу. Файл можно положить на общую файловую систему:
+    журнал SQLite в режиме DELETE не требует общей памяти, как WAL.
+    """
+    def __init__(self, fp: str | Path, *, ttl: float = 120.0, max_attempts: int = 3):
+        self.fp = Path(fp)
+        self.fp.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # isolation_level=None - транзакции открываются явно через BEGIN IMMEDIATE
+        self._db = sqlite3.connect(self.fp, check_same_thread=False, timeout=60, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=DELETE")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS tasks (
+                kind TEXT NOT NULL,
+                node_id TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                depth INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                owner TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (kind, node_id, page)
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS tasks_state ON tasks(state, lease_until)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS workers (owner TEXT PRIMARY KEY, heartbeat REAL NOT NULL)")
+
+    def _transaction(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def reset(self):
+        """Очищает очередь перед новым обходом"""
+        self._transaction(lambda db: (db.execute("DELETE FROM tasks"), db.execute("DELETE FROM workers")))
+
+    def put(self, tasks: Sequence[CrawlTask]):
+        """Добавляет задачи; уже известные (в том числе завершённые) пропускаются"""
+        if tasks:
+            self._transaction(lambda db: db.executemany(
+                "INSERT OR IGNORE INTO tasks (kind, node_id, page, depth, state) VALUES (?, ?, ?, ?, ?)",
+                [(task.kind, str(task.node_id), task.page, task.depth, STATE_PENDING) for task in tasks]
+            ))
+
+    def lease(self, owner: str, limit: int = 1) -> List[CrawlTask]:
+        """Берёт в аренду до `limit` задач, заодно возвращая в очередь задачи с истёкшей арендой"""
+        def lease(db: sqlite3.Connection) -> List[CrawlTask]:
+            now = time.time()
+            db.execute(
+                "UPDATE tasks SET state = ?, owner = NULL WHERE state = ? AND lease_until < ? AND attempts >= ?",
+                (STATE_FAILED, STATE_LEASED, now, self.max_attempts)
+            )
+            db.execute(
+                "UPDATE tasks SET state = ?, owner = NULL WHERE state = ? AND lease_until < ?",
+                (STATE_PENDING, STATE_LEASED, now)
+            )
+            rows = db.execute(
+                "SELECT kind, node_id, page, depth FROM tasks WHERE state = ? ORDER BY depth, rowid LIMIT ?",
+                (STATE_PENDING, limit)
+            ).fetchall()
+            db.executemany(
+                "UPDATE tasks SET state = ?, owner = ?, lease_until = ?, attempts = attempts + 1 WHERE kind = ? AND node_id = ? AND page = ?",
+                [(STATE_LEASED, owner, now + self.ttl, kind, node_id, page) for kind, node_id, page, _ in rows]
+            )
+            db.execute("INSERT OR REPLACE INTO workers VALUES (?, ?)", (owner, now))
+            return [CrawlTask(*row) for row in rows]
+        return self._transaction(lease)
+
+    def renew(self, owner: str):
+        """Продлевает аренду всех задач процесса"""
+        def renew(db: sqlite3.Connection):
+            now = time.time()
+            db.execute("UPDATE tasks SET lease_until = ? WHERE state = ? AND owner = ?", (now + self.ttl, STATE_LEASED, owner))
+            db.execute("INSERT OR REPLACE INTO workers VALUES (?, ?)", (owner, now))
+        self._transaction(renew)
+
+    def complete(self, owner: str, task: CrawlTask, spilled: Sequence[CrawlTask] = (), failed: Sequence[CrawlTask] = ()):
+        """Отмечает поддерево обойдённым; отданные другим процессам узлы добавляются той же транзакцией
+
+        Невыполненные задачи поддерева (`failed`) тоже возвращаются в очередь отдельными задачами.
+        Если не удался сам корень поддерева, оно остаётся ожидающим, а после `max_attempts`
+        попыток помечается failed.
+        """
+        def complete(db: sqlite3.Connection):
+            db.executemany(
+                "INSERT OR IGNORE INTO tasks (kind, node_id, page, depth, state) VALUES (?, ?, ?, ?, ?)",
+                [(child.kind, str(child.node_id), child.page, child.depth, STATE_PENDING) for child in (*spilled, *failed)]
+            )
+            key = (task.kind, str(task.node_id), task.page)
+            if any((child.kind, str(child.node_id), child.page) == key for child in failed):
+                db.execute(
+                    "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, owner = NULL, lease_until = NULL "
+                    "WHERE kind = ? AND node_id = ? AND page = ?",
+                    (self.max_attempts, STATE_FAILED, STATE_PENDING, *key)
+                )
+                return
+            db.execute(
+                "UPDATE tasks SET state = ?, owner = ?, lease_until = NULL WHERE kind = ? AND node_id = ? AND page = ?",
+                (STATE_DONE, owner, *key)
+            )
+        self._transaction(complete)
+
+    def retry_failed(self):
+        """Возвращает задачи, помеченные failed, в очередь с обнулённым числом попыток (при --resume)"""
+        def retry(db: sqlite3.Connection):
+            db.execute("UPDATE tasks SET state = ?, attempts = 0 WHERE state = ?", (STATE_PENDING, STATE_FAILED))
+        self._transaction(retry)
+
+    def release(self, owner: str):
+        """Возвращает в очередь незавершённые задачи процесса (при штатной остановке)"""
+        def release(db: sqlite3.Connection):
+            db.execute(
+                "UPDATE tasks SET state = ?, owner = NULL, lease_until = NULL, attempts = MAX(attempts - 1, 0) WHERE state = ? AND owner = ?",
+                (STATE_PENDING, STATE_LEASED, owner)
+            )
+            db.execute("DELETE FROM workers WHERE owner = ?", (owner,))
+        self._transaction(release)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self._db.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+        return {state: counts.get(state, 0) for state in (STATE_PENDING, STATE_LEASED, STATE_DONE, STATE_FAILED)}
+
+    def workers(self) -> int:
+        """Процессы, подававшие признаки жизни в пределах ttl"""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM workers WHERE heartbeat >= ?", (time.time() - self.ttl,)).fetchone()[0]
+
+    def finished(self) -> bool:
+        counts = self.counts()
+        return not counts[STATE_PENDING] and not counts[STATE_LEASED]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ShardWorker:
+    """Процесс шардированного обхода: берёт поддеревья из LeaseQueue и обходит до `leases` из них одновременно
+
+    Пока в общей очереди задач меньше, чем живых процессов, часть дочерних узлов текущего
+    поддерева отдаётся (`spill`) в очередь, чтобы свободные процессы не простаивали на
+    одном большом поддереве. Поддерево отмечается обойдённым только после того, как
+    его строки сброшены на диск, так что после падения процесса теряется не больше
+    незавершённых поддеревьев; их повторный обход даёт дубликаты, которые убирает слияние.
+    """
+    def __init__(
+        self,
+        queue: LeaseQueue,
+        owner: str,
+        crawl: Callable[[CrawlTask, Callable[[CrawlTask], bool]], Awaitable[Crawler]],
+        writer: Writer,
+        *,
+        leases: int = 2,
+        poll: float = 2.0
+    ):
+        """
+        Args:
+            - queue: Общая очередь поддеревьев
+            - owner: Имя процесса (уникальное в пределах очереди, например host-1)
+            - crawl: Обход одного поддерева: crawl(task, spill); невыполненные задачи обхода (failed) возвращаются в очередь
+            - writer: Вывод процесса; сохраняется перед отметкой поддерева
+            - leases: Сколько поддеревьев обходить одновременно (чтобы хвост одного не простаивал)
+            - poll: Пауза между проверками пустой очереди (секунды)
+        """
+        self.queue = queue
+        self.owner = owner
+        self.crawl = crawl
+        self.writer = writer
+        self.leases = max(1, leases)
+        self.poll = poll
+
+        self._spilled: List[CrawlTask] = []
+        self._spill_budget = 0
+        self.completed = 0
+        self.spilled = 0
+        self.failed = 0
+
+    def spill(self, task: CrawlTask) -> bool:
+        """Отдаёт узел другим процессам, если им не хватает работы"""
+        if task.kind != TASK_NODE or self._spill_budget <= 0:
+            return False
+        self._spill_budget -= 1
+        self._spilled.append(task)
+        self.spilled += 1
+        return True
+
+    async def _heartbeat(self):
+        # Отданные узлы публикуются не реже, чем другие процессы опрашивают очередь
+        interval = min(self.poll, self.queue.ttl / 4)
+        while True:
+            await self._share()
+            await asyncio.sleep(interval)
+
+    async def _share(self):
+        """Продлевает аренду, отдаёт накопленные узлы и пересчитывает, сколько ещё можно отдать"""
+        spilled, self._spilled = self._spilled, []
+        await asyncio.to_thread(self.queue.put, spilled)
+        await asyncio.to_thread(self.queue.renew, self.owner)
+        counts = await asyncio.to_thread(self.queue.counts)
+        workers = await asyncio.to_thread(self.queue.workers)
+        self._spill_budget = max(0, workers * self.leases - counts[STATE_PENDING] - counts[STATE_LEASED])
+
+    async def _loop(self):
+        while True:
+            tasks = await asyncio.to_thread(self.queue.lease, self.owner, 1)
+            if not tasks:
+                if await asyncio.to_thread(self.queue.finished):
+                    return
+                await asyncio.sleep(self.poll)
+                continue
+            task = tasks[0]
+            logger.info(f"{self.owner}: поддерево {task.node_id} (глубина {task.depth})")
+            crawler = await self.crawl(task, self.spill)
+            await self.writer.save()
+            # Узлы, отданные во время обхода, должны попасть в очередь не позже отметки поддерева
+            spilled, self._spilled = self._spilled, []
+            failed = crawler.failed
+            await asyncio.to_thread(self.queue.complete, self.owner, task, spilled, failed)
+            if failed:
+                self.failed += len(failed)
+                logger.warning(f"{self.owner}: в поддереве {task.node_id} не выполнено {len(failed)} задач, они возвращены в очередь")
+            else:
+                self.completed += 1
+
+    async def run(self):
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            await asyncio.gather(*(self._loop() for _ in range(self.leases)))
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+            await asyncio.to_thread(self.queue.put, self._spilled)
+            await asyncio.to_thread(self.queue.release, self.owner)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"subtrees": self.completed, "spilled": self.spilled, "failed_tasks": self.failed}
+
+
+def part_path(output: Path, owner: str) -> Path:
+    """Вывод процесса шардированного обхода"""
+    return output.with_name(f"{output.stem}.part-{owner}{output.suffix}")
+
+def part_paths(output: Path) -> List[Path]:
+    return sorted(output.parent.glob(f"{output.stem}.part-*{output.suffix}"))
+
+async def merge_parts(output: Path, parts: Sequence[Path], *, format: Optional[str] = None, columns: Sequence[str] = ('article',)) -> int:
+    """Сливает выводы процессов в `output`, оставляя первую строку каждого артикула; возвращает число строк"""
+    seen = SeenSet()
+    written = 0
+    async with Writer(output, 10_000, format=format, columns=columns) as writer:
+        for part in parts:
+            sink = Writer(part, format=format, columns=columns).sink
+            try:
+                for row in sink.rows():
+                    if row and row[0] and seen.add(row[0]):
+                        writer.extend([row])
+                        written += 1
+                        if writer.full():
+                            await writer.submit()
+            finally:
+                sink.close()
+    return written
+
+
+async def coordinate(argv: Sequence[str], queues: Sequence[LeaseQueue], shards: int, *, max_restarts: int = 3, report_interval: float = 30.0):
+    """Запускает `shards` процессов с аргументами `argv` и перезапускает упавшие, пока очереди не разобраны
+
+    Процессы на других машинах (с тем же файлом очереди) просто подключаются к тем же очередям,
+    поэтому координатор ждёт именно опустошения очередей, а не только своих процессов.
+    """
+    async def spawn(index: int) -> asyncio.subprocess.Process:
+        return await asyncio.create_subprocess_exec(sys.executable, *argv, '--shard-worker', f"{socket.gethostname()}-{index}")
+
+    processes = {index: await spawn(index) for index in range(shards)}
+    restarts = {index: 0 for index in range(shards)}
+    last_report = time.monotonic()
+    try:
+        while True:
+            finished = all([await asyncio.to_thread(queue.finished) for queue in queues])
+            for index, process in list(processes.items()):
+                if process.returncode is None:
+                    continue
+                if process.returncode != 0 and not finished and restarts[index] < max_restarts:
+                    restarts[index] += 1
+                    logger.warning(f"Процесс {index} завершился с кодом {process.returncode}, перезапуск {restarts[index]} из {max_restarts}")
+                    processes[index] = await spawn(index)
+                else:
+                    del processes[index]
+            if not processes and (finished or all(count >= max_restarts for count in restarts.values())):
+                break
+            if time.monotonic() - last_report >= report_interval:
+                last_report = time.monotonic()
+                for queue in queues:
+                    logger.info(f"Очередь {queue.fp}: {await asyncio.to_thread(queue.counts)}, процессов {await asyncio.to_thread(queue.workers)}")
+            await asyncio.sleep(1.0)
+    finally:
+        for process in processes.values():
+            if process.returncode is None:
+                process.terminate()
+        await asyncio.gather(*(process.wait() for process in processes.values()))
@@ -1,18 +1,38 @@
 import os
+import sys
+import shutil
 import logging
 import asyncio
 
-from typing import Awaitable
+from typing import Iterable, Dict, List, Optional, Any
 from pathlib import Path
 
-import aiohttp
 import dotenv
 import argparse
 
 from SieportalGetTreeAPI import GetTreeAPI as TreeAPI
 from SieportalGetProductAPI import GetProductAPI as ProductAPI
-from SieportalTyping import NodeProduct
-from SieportalWriter import CsvWriter
+from SieprotalPrice import GetPriceAPI as PriceAPI
+from SieportalWriter import Writer, FORMATS, with_format
+from SieportalToken import Token, TOKENS
+from SieportalProxy import ProxyPool
+from SieportalLimiter import AdaptiveController
+from SieportalRetry import RetryPolicy, RetryBudget
+from SieportalHedge import HedgePolicy, HEDGE_ENDPOINTS
+from SieportalCache import ResponseCache
+from SieportalCrawler import Crawler, SharedTree, PAGINATION_COUNT, PAGINATION_SERIAL
+from SieportalJournal import CrawlJournal
+from SieportalTyping import CrawlTask, BaseAPI, TASK_NODE
+from SieportalSeen import SeenSet, BloomFilter
+from SieportalPipeline import PricePipeline
+from SieportalDelta import TreeSnapshot, DeltaCrawl
+from SieportalCatalog import CatalogStore
+from SieportalSchedule import CrawlQuota, POLICIES, POLICY_BFS, POLICY_COUNT, POLICY_FLAGGED
+from SieportalShard import LeaseQueue, ShardWorker, coordinate, merge_parts, part_path, part_paths, STATE_FAILED
+from SieportalMetrics import METRICS, MetricsServer
+from SieportalRequests import SUCCESS_LOG
+from SieportalLog import QueueLogging
+from SieportalTransport import Transport, add_arguments as add_transport_arguments, config_from_args as transport_config
 
 dotenv.load_dotenv()
 
@@ -35,119 +55,454 @@ def parse():
         python SieportalStart.py --region cn --language en
         python SieportalStart.py -r de -l de -n 10045207 10313567 -c 5
         python SieportalStart.py --proxy --max-try 10 --sleep 2.0
+        python SieportalStart.py -r de -l de --resume
+        python SieportalStart.py -r de -l de --prices EUR --price-concurrent 4
+        python SieportalStart.py -r de at ch -l de en -c 8 --total-concurrent 32 --share-tree
+        python SieportalStart.py -r de -l de --delta -o files/de-de-delta.csv
+        python SieportalStart.py -r de -l de --catalog files/catalog.sqlite
+        python SieportalStart.py -r de -l de --shards 4 -c 16
+        python SieportalStart.py -r de -l de --policy count --catalog files/catalog.sqlite --time-budget 3600
+        python SieportalStart.py -r de -l de --shard-worker host2-1 --queue /mnt/shared/de-de.queue -o /mnt/shared/de-de.csv
+        python SieportalStart.py -r de -l de -o files/{language}-{region}.parquet --buffer 20000 --checkpoint-interval 300
     '''
     )
 
     # Обязательные аргументы
-    parser.add_argument('--region', '-r', type=str, required=True,
-                       help='Регион (например: cn, de, us)')
-    parser.add_argument('--language', '-l', type=str, required=True,
-                       help='Язык (например: en, de, zh)')
+    parser.add_argument('--region', '-r', type=str, nargs='+', required=True,
+                       help='Регион или несколько регионов (например: cn, de, us)')
+    parser.add_argument('--language', '-l', type=str, nargs='+', required=True,
+                       help='Язык или несколько языков (например: en, de, zh), обходятся все пары язык-регион')
 
     # Опциональные аргументы
-    parser.add_argument('--nodes', '-n', type=int, nargs='+', default=[9990173, 10045207, 10313567, 10047631, 9990301, 10008397, 9990314, 10008397, 1000000],
+    parser.add_argument('--nodes', '-n', type=int, nargs='+', default=[9990173, 10045207, 10313567, 10047631, 9990301, 10008397, 9990314, 1000000],
                        help='ID начальных узлов для парсинга')
     parser.add_argument('--concurrent', '-c', type=int, default=8,
                        help='Максимальное количество одновременных запросов')
+    parser.add_argument('--total-concurrent', type=int,
+                       help='Общий лимит запросов в полёте на все пары язык-регион (по умолчанию: --concurrent)')
+    parser.add_argument('--share-tree', action='store_true',
+                       help='Запрашивать каждый узел дерева один раз и использовать его структуру во всех парах язык-регион')
+    parser.add_argument('--adaptive', action='store_true',
+                       help='Адаптивно (AIMD) подбирать количество запросов в полёте по ответам сервера, --concurrent - потолок')
+    parser.add_argument('--min-concurrent', type=int, default=1,
+                       help='Нижняя граница адаптивного лимита')
     parser.add_argument('--max-try', '-m', type=int, default=3,
                        help='Максимальное количество попыток для запроса')
     parser.add_argument('--sleep', '-s', type=float, default=1.0,
-                       help='Время ожидания между запросами (секунды)')
-    parser.add_argument('--output', '-o', type=str,
-                       help='Путь к выходному файлу (по умолчанию: files/{language}-{region}.csv)')
+                       help='Базовая задержка повтора (секунды), растёт экспоненциально со случайным джиттером')
+    parser.add_argument('--retry-budget', type=float, default=0.2,
+                       help='Доля повторов от живого трафика, сверх которой запросы не повторяются')
+    parser.add_argument('--hedge', action='store_true',
+                       help='Подстраховывать медленные запросы каталога копией через другой прокси (первый ответ побеждает)')
+    parser.add_argument('--hedge-quantile', type=float, default=0.95,
+                       help='Квантиль недавних задержек эндпоинта, после которого отправляется подстраховка')
+    parser.add_argument('--hedge-ratio', type=float, default=0.05,
+                       help='Максимальная доля подстраховочных запросов от всех запросов')
+    parser.add_argument('--hedge-endpoints', type=str, nargs='+', default=list(HEDGE_ENDPOINTS),
+                       help='Эндпоинты, которые можно подстраховывать (только идемпотентные)')
+    parser.add_argument('--output', '-o', type=str, default='files/{language}-{region}.csv',
+                       help='Путь к выходному файлу, {language} и {region} подставляются, формат по расширению: .csv, .jsonl, .sqlite, .parquet (по умолчанию: files/{language}-{region}.csv)')
+    parser.add_argument('--format', type=str, choices=FORMATS,
+                       help='Формат выходного файла (по умолчанию по расширению --output); Parquet пишется каталогом частей')
+    parser.add_argument('--buffer', type=int, default=500,
+                       help='Сколько строк копить перед отправкой на запись')
+    parser.add_argument('--flush-interval', type=float, default=5.0,
+                       help='Через сколько секунд без полных буферов записать неполный (секунды)')
+    parser.add_argument('--pagination', type=str, choices=[PAGINATION_COUNT, PAGINATION_SERIAL], default=PAGINATION_COUNT,
+                       help='Режим пагинации: count - все страницы по productCount параллельно, serial - по одной до пустой')
+    parser.add_argument('--policy', type=str, choices=POLICIES, default=POLICY_BFS,
+                       help='Порядок обхода: bfs - по уровням, dfs - вглубь, count - больший productCount первым '
+                            '(по прошлому обходу из --catalog), flagged - сначала страницы товаров и узлы с товарами')
+    parser.add_argument('--time-budget', type=float,
+                       help='Остановиться через столько секунд, сохранив оставшуюся очередь в журнал (продолжить - --resume)')
+    parser.add_argument('--request-budget', type=int,
+                       help='Остановиться после стольких запросов к API, сохранив оставшуюся очередь в журнал')
     parser.add_argument('--proxy', action='store_true',
                        help='Использовать прокси из переменной окружения PROXY')
+    parser.add_argument('--cache', type=str, nargs='?', const='files/cache.sqlite',
+                       help='Постоянный кэш ответов (по умолчанию: files/cache.sqlite)')
+    parser.add_argument('--cache-ttl', type=str, nargs='+', default=[],
+                       help='Время жизни кэша по эндпоинтам в секундах, например: tree=604800 products=86400')
+    parser.add_argument('--cache-max-mb', type=int, default=2048,
+                       help='Максимальный размер кэша (МБ)')
+    parser.add_argument('--offline', action='store_true',
+                       help='Работать только из кэша, без запросов в сеть')
+    parser.add_argument('--dedupe', type=str, choices=['exact', 'bloom', 'off'], default='exact',
+                       help='Дедупликация артикулов: exact - компактное хеш-множество, bloom - фильтр Блума фиксированного размера, off - без неё')
+    parser.add_argument('--seen-capacity', type=int, default=1 << 16,
+                       help='Ожидаемое количество артикулов для --dedupe exact: таблица сразу создаётся нужного размера '
+                            '(до ~23 байт на артикул) и не перестраивается во время обхода (на 3 млн это пауза ~0.7 сек.)')
+    parser.add_argument('--bloom-capacity', type=int, default=50_000_000,
+                       help='Ожидаемое количество артикулов для фильтра Блума')
+    parser.add_argument('--bloom-error', type=float, default=0.001,
+                       help='Допустимая доля ложных срабатываний фильтра Блума (артикул ошибочно считается дублем)')
+    parser.add_argument('--resume', action='store_true',
+                       help='Продолжить прерванный обход с последней контрольной точки журнала')
+    parser.add_argument('--journal', type=str,
+                       help='Путь к журналу обхода, {language} и {region} подставляются (по умолчанию: рядом с выходным файлом, *.journal)')
+    parser.add_argument('--checkpoint-interval', type=float, default=30.0,
+                       help='Как часто сохранять контрольную точку (секунды)')
+    parser.add_argument('--prices', type=str, metavar='CURRENCY',
+                       help='Сразу получать цены найденных артикулов в этой валюте (например: EUR), в файл пишется артикул и цена')
+    parser.add_argument('--price-concurrent', type=int, default=4,
+                       help='Количество одновременных запросов цен (отдельно от --concurrent)')
+    parser.add_argument('--price-batch', type=int, default=PriceAPI.BATCH_SIZE,
+                       help='Артикулов в одном запросе цен')
+    parser.add_argument('--delta', action='store_true',
+                       help='Сравнить с прошлым снимком дерева: страницы неизменённых узлов не запрашиваются, в файл пишется артикул и added/unchanged/removed')
+    parser.add_argument('--snapshot', type=str,
+                       help='Путь к снимку дерева, {language} и {region} подставляются (по умолчанию: рядом с выходным файлом, *.snapshot)')
+    parser.add_argument('--catalog', type=str, nargs='?', const='files/catalog.sqlite',
+                       help='Сохранять структуру дерева и артикулы каждого узла в локальный каталог SQLite (по умолчанию: files/catalog.sqlite), запросы - SieportalCatalog.py')
+    parser.add_argument('--shards', type=int,
+                       help='Шардированный обход: столько процессов делят дерево через общую очередь поддеревьев, результаты сливаются без дубликатов')
+    parser.add_argument('--shard-worker', type=str, metavar='NAME',
+                       help='Запуститься процессом шардированного обхода с этим именем (координатор делает это сам, вручную - для других машин)')
+    parser.add_argument('--queue', type=str,
+                       help='Путь к очереди поддеревьев, {language} и {region} подставляются (по умолчанию: рядом с выходным файлом, *.queue)')
+    parser.add_argument('--shard-leases', type=int, default=2,
+                       help='Сколько поддеревьев процесс обходит одновременно')
+    parser.add_argument('--lease-ttl', type=float, default=120.0,
+                       help='Через сколько секунд без продления аренда упавшего процесса переходит к другим')
+    parser.add_argument('--metrics-port', type=int,
+                       help='Отдавать метрики в формате Prometheus на http://127.0.0.1:PORT/metrics')
+    parser.add_argument('--metrics-interval', type=float, default=60.0,
+                       help='Как часто писать сводку метрик в лог (секунды, 0 - не писать)')
+    add_transport_arguments(parser)
+    parser.add_argument('--base-url', type=str,
+                       help='Адрес SiePortal (например, локального стенда SieportalMock.py), токен запрашивается там же')
+    parser.add_argument('--log-rate', type=float, default=SUCCESS_LOG.rate,
+                       help='Сколько успешных ответов в секунду писать в лог (0 - все), ошибки пишутся всегда')
     parser.add_argument('--verbose', '-v', action='store_true',
-                       help='Подробный вывод')
+                       help='Подробный вывод (все успешные ответы)')
 
     # Парсим аргументы
     return parser.parse_args()
 
-async def getter_items(node_id: int | str, func: Awaitable, writer: CsvWriter):
-    page = 0
-    while True:
-        response: NodeProduct = await func(node_id, page)
-        if not response or not response.products or not response.product_count:
-            break
-        for article in response.products:
-            await writer.add(article.node_id)
-        page += 1
-
-async def process_node(node_id: str | int, tree_api: TreeAPI, product_api: ProductAPI, writer: CsvWriter):
-    """Обрабатывает один узел и возвращает список дочерних узлов"""
-    node_info = await tree_api.get_node_info(node_id)
-    if node_info is None:
-        return
-    if node_info.save_product:
-        await getter_items(node_id, product_api.get_node_products, writer)
-    if node_info.save_accessory:
-        await getter_items(node_id, product_api.get_node_accessories, writer)
-    
-    return [child.node_id for child in node_info.children]
+def load_articles(writer: Writer, seen: SeenSet | BloomFilter):
+    """Добавляет в `seen` артикулы, уже записанные в выходной файл"""
+    for article in writer.articles():
+        seen.add(article)
+
+def parse_ttl(values: Iterable[str]) -> Dict[str, float]:
+    """Разбирает пары endpoint=секунды из --cache-ttl"""
+    ttl = {}
+    for value in values:
+        endpoint, _, seconds = value.partition('=')
+        ttl[endpoint] = float(seconds)
+    return ttl
 
-async def spider(node_id: str | int, tree_api: TreeAPI, product_api: ProductAPI, writer: CsvWriter, max_concurrent: int = 10):
-    """Рекурсивно обрабатывает дерево каталога с ограничением количества одновременных запросов"""
-    # Обрабатываем текущий узел и получаем дочерние узлы
-    child_nodes = await process_node(node_id, tree_api, product_api, writer)
+async def spider(nodes: Iterable[int | str], tree_api: TreeAPI, product_api: ProductAPI, writer: Writer, max_concurrent: int = 10,
+                 resume: Optional[List[CrawlTask]] = None, **options) -> Crawler:
+    """Обходит дерево каталога от узлов `nodes`, держа не больше `max_concurrent` запросов в полёте
     
-    # Обрабатываем дочерние узлы параллельно с ограничением количества одновременных задач
-    while child_nodes:
-        # Берем первую порцию узлов для параллельной обработки
-        batch, child_nodes = child_nodes[:max_concurrent], child_nodes[max_concurrent:]
-        
-        # Создаем задачи для параллельного выполнения
-        tasks = [
-            spider(child_id, tree_api, product_api, writer, max_concurrent)
-            for child_id in batch
-        ]
-        
-        # Запускаем все задачи параллельно и ждем их завершения
-        await asyncio.gather(*tasks)
+    `options` передаются в Crawler (pagination, journal, checkpoint_interval, seen_articles, seen_nodes, pricer, budget, shared_tree, delta, catalog,
+    spill, policy, known_counts, quota)
+    """
+    crawler = Crawler(tree_api, product_api, writer, workers=max_concurrent, **options)
+    await crawler.run(nodes, resume=resume)
+    return crawler
 
-async def main():
-    global writer
-    args = parse()
+def output_path(args, language: str, region: str) -> Path:
+    return with_format(args.output.format(language=language, region=region), args.format)
+
+def output_columns(args) -> tuple:
+    if args.prices:
+        return ('article', 'price')
+    if args.delta:
+        return ('article', 'status')
+    return ('article',)
 
-    DEFAULT_REGION: str = args.region
-    DEFAULT_LANGUAGE = args.language
-    FILE_PATH = Path("files") / f"{DEFAULT_LANGUAGE}-{DEFAULT_REGION}.csv"
+def queue_path(args, language: str, region: str) -> Path:
+    return Path(args.queue.format(language=language, region=region)) if args.queue else output_path(args, language, region).with_suffix('.queue')
+
+def new_seen_articles(args) -> Optional[SeenSet | BloomFilter]:
+    if args.dedupe == 'exact':
+        return SeenSet(args.seen_capacity)
+    if args.dedupe == 'bloom':
+        return BloomFilter(args.bloom_capacity, args.bloom_error)
+    return None
+
+def api_setting(args, language: str, region: str, shared: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'session': shared['session'],
+        'language': language,
+        'region': region,
+        'proxy_list': PROXY_LIST,
+        'proxy_pool': shared['proxy_pool'],
+        'controller': shared['controller'],
+        'use_proxy': args.proxy,
+        'max_try': args.max_try,
+        'sleep_time': args.sleep,
+        'retry_policy': shared['retry_policy'],
+        'cache': shared['cache'],
+        'transport': shared['transport'],
+        'hedge': shared['hedge']
+    }
+
+async def crawl_locale(args, language: str, region: str, shared: Dict[str, Any]) -> Optional[Crawler]:
+    """Обход одной пары язык-регион; `shared` - общие для всех пар сессия, прокси, лимиты, политика повторов и кэш"""
+    FILE_PATH = output_path(args, language, region)
+    columns = output_columns(args)
 
     try:
-        writer = CsvWriter(FILE_PATH)
+        writer = Writer(FILE_PATH, args.buffer, format=args.format, columns=columns, flush_interval=args.flush_interval)
     except Exception as e:
         logger.exception(f"Ошибка при инициализации {e}")
         raise e
 
+    seen_articles = new_seen_articles(args)
+    if seen_articles is None and args.delta:
+        # Удалённые артикулы считаются по найденным, поэтому при --delta множество нужно и с --dedupe off
+        seen_articles = SeenSet(args.seen_capacity)
+    seen_nodes = SeenSet()
+
+    delta = None
+    if args.delta:
+        snapshot_fp = Path(args.snapshot.format(language=language, region=region)) if args.snapshot else FILE_PATH.with_suffix('.snapshot')
+        # Новый снимок пишется рядом и заменяет старый только после полного обхода
+        next_fp = snapshot_fp.with_name(snapshot_fp.name + '.new')
+        if not args.resume:
+            next_fp.unlink(missing_ok=True)
+        delta = DeltaCrawl(TreeSnapshot.load(snapshot_fp), next_fp)
+
+    catalog = CatalogStore(args.catalog, language, region) if args.catalog else None
+    known_counts = None
+    if catalog is not None and args.policy in (POLICY_COUNT, POLICY_FLAGGED):
+        known_counts = catalog.product_counts()
+
+    journal = CrawlJournal(args.journal.format(language=language, region=region) if args.journal else FILE_PATH.with_suffix('.journal'))
+    resume = None
+    if args.resume:
+        state = CrawlJournal.load(journal.fp)
+        if state.finished:
+            logger.info(f"Обход по журналу {journal.fp} уже завершён")
+        # Всё, что записано после последней контрольной точки, будет получено заново
+        writer.truncate(state.size)
+        resume = state.pending
+        seen_nodes.update(state.nodes)
+        if seen_articles is not None:
+            load_articles(writer, seen_articles)
+        logger.info(f"Возобновление {language}-{region}: в очереди {len(resume)} задач, завершено {state.done}")
+    else:
+        await journal.reset(writer.size())
+
     try:
-        async with aiohttp.ClientSession() as session:
-            SETTING = {
-                'session': session, 
-                'language': DEFAULT_LANGUAGE, 
-                'region': DEFAULT_REGION,
-                'proxy_list': PROXY_LIST,
-                'use_proxy': args.proxy,
-                'max_try': args.max_try,
-                'sleep_time': args.sleep
-            }
-            tree_api = TreeAPI(**SETTING)
-            product_api = ProductAPI(**SETTING)
-            for node_id in args.nodes:
-                logger.info(f"Старт обработки узла {node_id}!")
-                await spider(node_id, tree_api, product_api, writer, max_concurrent= args.concurrent)
-            
-            logger.info(f"РЕЗУЛЬТАТ: {tree_api.requests.get_stats()}, {product_api.requests.get_stats()}!")
-    
+        SETTING = api_setting(args, language, region, shared)
+        tree_api = TreeAPI(**SETTING)
+        product_api = ProductAPI(**SETTING)
+        pricer = None
+        if args.prices:
+            # Сессия, токены, прокси и политика повторов общие, воркеры у цен свои
+            price_api = PriceAPI(**SETTING)
+            pricer = PricePipeline(price_api, writer, args.prices, workers=args.price_concurrent,
+                                   batch_size=args.price_batch, keep_unpriced=True)
+        logger.info(f"Старт обработки {language}-{region}, узлы {args.nodes}!")
+        if catalog is not None:
+            catalog.start()
+        crawler = await spider(args.nodes, tree_api, product_api, writer, max_concurrent= args.concurrent, resume=resume,
+                               pagination=args.pagination, journal=journal, checkpoint_interval=args.checkpoint_interval,
+                               seen_articles=seen_articles, seen_nodes=seen_nodes, pricer=pricer,
+                               budget=shared['budget'], shared_tree=shared['shared_tree'], delta=delta, catalog=catalog,
+                               policy=args.policy, known_counts=known_counts, quota=shared['quota'])
+        if delta is not None:
+            logger.info(f"Изменения {language}-{region}: {delta.get_stats()}")
+            if crawler.finished:
+                os.replace(delta.fp, snapshot_fp)
+        if catalog is not None:
+            if crawler.finished:
+                catalog.finish()
+            logger.info(f"Каталог {language}-{region}: {catalog.get_stats()} в {catalog.fp}")
+
+        logger.info(f"РЕЗУЛЬТАТ {language}-{region}: {tree_api.requests.get_stats()}, {product_api.requests.get_stats()}, {crawler.get_stats()}!")
+        if pricer is not None:
+            logger.info(f"Цены {language}-{region}: {price_api.requests.get_stats()}, {pricer.get_stats()}")
+        return crawler
+
     except Exception as e:
-        logger.exception(e)
-        await writer.save()
-        raise e
-   
+        logger.exception(f"Ошибка обхода {language}-{region}: {e}")
+        return None
+
+    finally:
+        await writer.close()
+        if catalog is not None:
+            catalog.close()
+
+async def shard_locale(args, language: str, region: str, shared: Dict[str, Any]):
+    """Процесс шардированного обхода одной пары язык-регион: обходит поддеревья из общей очереди в свой файл"""
+    writer = Writer(part_path(output_path(args, language, region), args.shard_worker), args.buffer, format=args.format,
+                    columns=output_columns(args), flush_interval=args.flush_interval)
+    queue = LeaseQueue(queue_path(args, language, region), ttl=args.lease_ttl)
+    # Процессы могут работать на разных машинах с общим файлом каталога, а WAL там не работает
+    catalog = CatalogStore(args.catalog, language, region, journal_mode='DELETE') if args.catalog else None
+    # Артикулы и узлы дедуплицируются в пределах процесса, между процессами - при слиянии
+    seen_articles = new_seen_articles(args)
+    seen_nodes = SeenSet()
+    SETTING = api_setting(args, language, region, shared)
+    tree_api = TreeAPI(**SETTING)
+    product_api = ProductAPI(**SETTING)
+    price_api = PriceAPI(**SETTING) if args.prices else None
+
+    async def crawl(task: CrawlTask, spill) -> Crawler:
+        pricer = None
+        if price_api is not None:
+            pricer = PricePipeline(price_api, writer, args.prices, workers=args.price_concurrent,
+                                   batch_size=args.price_batch, keep_unpriced=True)
+        return await spider([], tree_api, product_api, writer, max_concurrent=args.concurrent, resume=[task],
+                            pagination=args.pagination, checkpoint_interval=args.checkpoint_interval,
+                            seen_articles=seen_articles, seen_nodes=seen_nodes, pricer=pricer,
+                            budget=shared['budget'], shared_tree=shared['shared_tree'], catalog=catalog, spill=spill,
+                            policy=args.policy)
+
+    worker = ShardWorker(queue, args.shard_worker, crawl, writer, leases=args.shard_leases)
+    try:
+        if catalog is not None:
+            catalog.start()
+        await worker.run()
+        if catalog is not None:
+            counts = queue.counts()
+            # Обход процесса завершён, только если вся общая очередь обойдена без отказов
+            if queue.finished() and not counts[STATE_FAILED]:
+                catalog.finish()
+            logger.info(f"Каталог {args.shard_worker} {language}-{region}: {catalog.get_stats()} в {catalog.fp}")
+        logger.info(f"РЕЗУЛЬТАТ {args.shard_worker} {language}-{region}: {worker.get_stats()}, {tree_api.requests.get_stats()}, {product_api.requests.get_stats()}!")
+    finally:
+        await writer.close()
+        queue.close()
+        if catalog is not None:
+            catalog.close()
+
+def _remove(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+
+def _worker_argv(argv: List[str]) -> List[str]:
+    """Аргументы координатора без --shards и --metrics-port (порт метрик занят самим координатором)"""
+    result = []
+    skip = False
+    for value in argv:
+        if skip:
+            skip = False
+            continue
+        if value in ('--shards', '--metrics-port'):
+            skip = True
+            continue
+        if value.startswith(('--shards=', '--metrics-port=')):
+            continue
+        result.append(value)
+    return result
+
+async def run_shards(args, locales: List[tuple]):
+    """Координатор: раздаёт корневые узлы через очереди, держит --shards процессов и сливает их результаты"""
+    queues = []
+    for language, region in locales:
+        queue = LeaseQueue(queue_path(args, language, region), ttl=args.lease_ttl)
+        if not args.resume:
+            queue.reset()
+            for part in part_paths(output_path(args, language, region)):
+                _remove(part)
+        else:
+            queue.retry_failed()
+        queue.put([CrawlTask(TASK_NODE, node) for node in args.nodes])
+        queues.append(queue)
+
+    logger.info(f"Шардированный обход {locales}: {args.shards} процессов")
+    try:
+        await coordinate(_worker_argv(sys.argv), queues, args.shards)
+        for (language, region), queue in zip(locales, queues):
+            output = output_path(args, language, region)
+            counts = queue.counts()
+            parts = part_paths(output)
+            if not queue.finished() or counts[STATE_FAILED]:
+                logger.error(f"Обход {language}-{region} не завершён: {counts}; продолжить - тот же запуск с --resume")
+                continue
+            rows = await merge_parts(output, parts, format=args.format, columns=output_columns(args))
+            for part in parts:
+                _remove(part)
+            logger.info(f"РЕЗУЛЬТАТ {language}-{region}: {counts}, слито {len(parts)} частей, {rows} строк в {output}")
+    finally:
+        for queue in queues:
+            queue.close()
+
+async def main():
+    args = parse()
+    SUCCESS_LOG.rate = 0 if args.verbose else args.log_rate
+    if args.base_url:
+        BaseAPI.BASE_URL = args.base_url.rstrip('/')
+        Token.URL = f"{BaseAPI.BASE_URL}/connect/token"
+    locales = [(language, region) for language in args.language for region in args.region]
+    if args.delta and args.prices:
+        raise SystemExit("--delta и --prices нельзя использовать вместе")
+    if len(locales) > 1 and any(path and '{' not in path for path in (args.output, args.journal, args.snapshot)):
+        raise SystemExit("При нескольких регионах или языках --output, --journal и --snapshot должны содержать {language} и {region}")
+    if (args.shards or args.shard_worker) and args.delta:
+        raise SystemExit("--delta нельзя использовать с шардированным обходом")
+    if (args.shards or args.shard_worker) and (args.time_budget or args.request_budget):
+        raise SystemExit("--time-budget и --request-budget нельзя использовать с шардированным обходом")
+    if args.shards:
+        await run_shards(args, locales)
+        return
+
+    cache = None
+    if args.cache or args.offline:
+        cache = ResponseCache(
+            args.cache or 'files/cache.sqlite',
+            ttl=parse_ttl(args.cache_ttl),
+            max_bytes=args.cache_max_mb * 1024 ** 2,
+            offline=args.offline
+        )
+
+    metrics_server = MetricsServer(METRICS, port=args.metrics_port) if args.metrics_port else None
+    monitor = asyncio.create_task(METRICS.monitor(args.metrics_interval))
+    try:
+        if metrics_server is not None:
+            await metrics_server.start()
+        # Одна сессия (и один пул соединений), один реестр токенов и общий лимит запросов на все пары
+        async with Transport(transport_config(args)) as transport:
+            shared = {
+                'session': transport.session,
+                'transport': transport,
+                'proxy_pool': ProxyPool(PROXY_LIST),
+                'controller': AdaptiveController(args.concurrent, minimum=args.min_concurrent) if args.adaptive else None,
+                'retry_policy': RetryPolicy(args.sleep, budget=RetryBudget(args.retry_budget)),
+                'hedge': HedgePolicy(args.hedge_quantile, ratio=args.hedge_ratio, endpoints=args.hedge_endpoints) if args.hedge else None,
+                'cache': cache,
+                'budget': asyncio.Semaphore(args.total_concurrent or args.concurrent),
+                'shared_tree': SharedTree() if args.share_tree and len(locales) > 1 else None,
+                # Квота общая на все пары: время считается от старта, запросы - суммарно
+                'quota': CrawlQuota(args.time_budget, args.request_budget) if args.time_budget or args.request_budget else None
+            }
+            logger.info(f"Обход {len(locales)} пар язык-регион: {locales}")
+            locale_task = shard_locale if args.shard_worker else crawl_locale
+            await asyncio.gather(*(locale_task(args, language, region, shared) for language, region in locales))
+
+            logger.info(f"ИТОГ: {shared['proxy_pool'].get_stats()}, {shared['retry_policy'].get_stats()}, {TOKENS.get_stats()}!")
+            if shared['shared_tree'] is not None:
+                logger.info(f"Общее дерево: {shared['shared_tree'].get_stats()}")
+            if shared['hedge'] is not None:
+                logger.info(f"Подстраховка: {shared['hedge'].get_stats()}")
+            if shared['quota'] is not None:
+                logger.info(f"Квота обхода: {shared['quota'].get_stats()}")
+            if cache is not None:
+                logger.info(f"Кэш: {cache.get_stats()}")
+
+            logger.info(METRICS.summary())
+
     finally:
-        await writer.save()
+        monitor.cancel()
+        if metrics_server is not None:
+            await metrics_server.close()
+        TOKENS.close()
+        if cache is not None:
+            cache.close()
         logger.info("Парсинг завершен!")
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        # Логи пишутся в консоль из отдельного потока, а не из цикла событий
+        with QueueLogging():
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Парсинг остоновлен досрочно пользователем!")
\ No newline at end of file
@@ -8,6 +8,7 @@ import dotenv
 from fake_headers import Headers
 
 from SieprotalTools import second_readable
+from SieportalMetrics import METRICS
 
 dotenv.load_dotenv()
 
@@ -23,6 +24,7 @@ class Token:
     Класс Token для управления аутентификационными токенами
     """
     URL = "https://auth.sieportal.siemens.com/connect/token"
+    REFRESH_AHEAD = 60  # За сколько секунд до истечения токен обновляется в фоне
     
     def __init__(self, session: aiohttp.ClientSession, proxy: Optional[str] = None):
         """Инициализация токена
@@ -36,8 +38,12 @@ class Token:
         self._headers_generator = Headers()
         self._token: Optional[str] = None
         self._expires_at: Optional[float] = None
+        self._lifetime: float = 3600
         self.proxy = proxy
         self._session = session
+        self._lock = asyncio.Lock()
+        self._refresher: Optional[asyncio.Task] = None
+        self.refresh_count = 0
         
         # Данные для запроса токена
         self._data = {
@@ -61,11 +67,23 @@ class Token:
         
         return time.time() < (self._expires_at - 10)
 
-    async def update(self, proxy: str = None) -> bool:
-        """Принудительно обновляет токен не зависимо от его времени 'Жизни'"""
-        self._token = None  # Сбрасываем текущий токен
-        self._expires_at = None
-        return await self.get_token(proxy = proxy or self.proxy)
+    async def update(self, proxy: str = None, stale: Optional[str] = None) -> str:
+        """Принудительно обновляет токен не зависимо от его времени 'Жизни'
+        
+        Обновление выполняется одно на всех: остальные корутины ждут его результат.
+        
+        Args:
+            proxy: Прокси сервер (опционально)
+            stale: Токен, с которым получили 401. Если он уже заменён другой корутиной,
+                повторного запроса не будет
+        """
+        async with self._lock:
+            if stale is not None and self._token is not None and self._token != stale and self.is_token_valid():
+                logger.debug("Токен уже обновлён другой корутиной")
+                return self._token
+            self._token = None  # Сбрасываем текущий токен
+            self._expires_at = None
+            return await self._fetch(proxy = proxy)
     
     async def get_token(self, check_valid: bool = True, proxy: str = None) -> str:
         """Получает новый токен или возвращает существующий валидный
@@ -77,6 +95,14 @@ class Token:
             logger.debug("Используется существующий валидный токен")
             return self._token
         
+        async with self._lock:
+            # Пока ждали блокировку, токен мог получить кто-то другой
+            if self.is_token_valid() and check_valid:
+                return self._token
+            return await self._fetch(proxy = proxy)
+    
+    async def _fetch(self, proxy: str = None) -> Optional[str]:
+        """Запрашивает новый токен (вызывается только под self._lock)"""
         logger.info("Запрос нового токена...")
         
         try:
@@ -91,19 +117,50 @@ class Token:
                 response.raise_for_status()
                 json_response: Dict[str, Any] = await response.json()
                 
-                self._expires_at = time.time() + json_response.get('expires_in', 3600)
+                self._lifetime = json_response.get('expires_in', 3600)
+                self._expires_at = time.time() + self._lifetime
                 token_type = json_response.get('token_type', 'Bearer')
                 access_token = json_response['access_token']
                 self._token = f"{token_type} {access_token}"
+                self.refresh_count += 1
+                METRICS.token_refreshes.inc()
                 
                 logger.info(f"Токен успешно получен! Срок действия: {second_readable(self._expires_at - time.time())}")
+                self._schedule_refresh()
                 return self._token
                 
         except aiohttp.ClientError as e:
             logger.error(f"Ошибка при получении токена: {e}")
         
         except asyncio.TimeoutError:
-            logger.error(f"Таймаут при получении токена: {e}")
+            logger.error("Таймаут при получении токена")
+    
+    def _schedule_refresh(self):
+        """Запускает фоновое обновление токена незадолго до истечения срока"""
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.get_running_loop().create_task(self._refresh_loop())
+    
+    async def _refresh_loop(self):
+        while self._expires_at is not None and not self._session.closed:
+            # Для короткоживущих токенов обновляемся на середине срока
+            ahead = min(self.REFRESH_AHEAD, self._lifetime / 2)
+            delay = self._expires_at - ahead - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            async with self._lock:
+                if self._expires_at is not None and self._expires_at - ahead - time.time() > 0:
+                    continue  # Токен уже обновил кто-то другой
+                # Старый токен не сбрасываем: пока идёт запрос, запросы работают с ним
+                token = await self._fetch()
+            if token is None:
+                await asyncio.sleep(min(ahead / 4, 15))
+    
+    def close(self):
+        """Останавливает фоновое обновление токена"""
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
 
     async def get_headers(self, proxy: Optional[str] = None) -> Dict[str, str]:
         """Возвращает заголовки с актуальным токеном
@@ -112,4 +169,39 @@ class Token:
             Dict[str, str]: Заголовки для HTTP запросов
         """
         token = await self.get_token(proxy = proxy)
-        return self._headers_generator.generate() | {'Authorization': token}
\ No newline at end of file
+        return self._headers_generator.generate() | {'Authorization': token}
+
+
+class TokenRegistry:
+    """Общий на процесс реестр токенов: один токен на каждый прокси
+    
+    Все API клиенты берут токены отсюда, поэтому токен для одного и того же прокси
+    запрашивается и обновляется один раз на весь процесс.
+    """
+    def __init__(self):
+        self._tokens: Dict[Optional[str], Token] = {}
+    
+    def get(self, session: aiohttp.ClientSession, proxy: Optional[str] = None) -> Token:
+        """Возвращает токен для прокси `proxy` (None - без прокси)"""
+        token = self._tokens.get(proxy)
+        if token is None or token._session.closed:
+            if token is not None:
+                token.close()
+            token = self._tokens[proxy] = Token(session, proxy)
+        return token
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Возвращает статистику по токенам"""
+        return {
+            "tokens": len(self._tokens),
+            "token_refreshes": sum(token.refresh_count for token in self._tokens.values())
+        }
+    
+    def close(self):
+        """Останавливает фоновое обновление всех токенов"""
+        for token in self._tokens.values():
+            token.close()
+        self._tokens.clear()
+
+
+TOKENS = TokenRegistry()
\ No newline at end of file
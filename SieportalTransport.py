@@ -0,0 +1,173 @@
+import logging
+
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Iterable
+
+import aiohttp
+
+from SieportalBackend import Timeouts, HttpBackend, AiohttpBackend, HttpxBackend, BACKEND_AIOHTTP, BACKEND_HTTPX, BACKENDS
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli  # noqa: F401 - aiohttp сам распаковывает br, если модуль установлен
+    BROTLI = True
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        BROTLI = True
+    except ImportError:
+        BROTLI = False
+
+COMPRESSION_OFF = 'off'
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_BR = 'br'
+
+@dataclass
+class TransportConfig:
+    """Настройки пула соединений и таймаутов"""
+    limit: int = 100  # Всего соединений (0 - без ограничения)
+    limit_per_host: int = 32
+    proxy_limit: int = 8  # Соединений на каждый прокси при proxy_sessions
+    proxy_sessions: bool = False  # Отдельный пул соединений на каждый прокси
+    keepalive_timeout: float = 30.0
+    dns_ttl: Optional[int] = 300
+    compression: str = COMPRESSION_GZIP
+    backend: str = BACKEND_AIOHTTP  # HTTP клиент запросов к API: aiohttp или httpx (HTTP/2)
+    timeouts: Timeouts = field(default_factory=Timeouts)
+    endpoint_timeouts: Dict[str, Timeouts] = field(default_factory=dict)
+
+    def timeouts_for(self, endpoint: str) -> Timeouts:
+        return self.endpoint_timeouts.get(endpoint, self.timeouts)
+
+
+class Transport:
+    """Сессии aiohttp с настроенным пулом соединений и HTTP бэкенд запросов к API
+
+    Основная сессия общая для всех запросов без прокси. При `proxy_sessions` каждый
+    прокси получает свою сессию с отдельным небольшим пулом, поэтому медленный или
+    зависший прокси не занимает соединения остальных. Таймауты задаются по эндпоинтам,
+    так что зависший сокет освобождает слот параллельности через read/total секунд.
+    Запросы к API идут через `backend`; сессия aiohttp остаётся и для токенов.
+    """
+    def __init__(self, config: Optional[TransportConfig] = None):
+        self.config = config or TransportConfig()
+        if self.config.compression == COMPRESSION_BR and not BROTLI:
+            logger.warning("Модуль brotli не установлен, сжатие br недоступно - используется gzip")
+            self.config.compression = COMPRESSION_GZIP
+        self.session = self._create_session(self.config.limit, self.config.limit_per_host)
+        self._proxy_sessions: Dict[str, aiohttp.ClientSession] = {}
+        self.backend = self._create_backend()
+
+    def _create_session(self, limit: int, limit_per_host: int) -> aiohttp.ClientSession:
+        config = self.config
+        connector = aiohttp.TCPConnector(
+            limit=limit,
+            limit_per_host=limit_per_host,
+            keepalive_timeout=config.keepalive_timeout,
+            use_dns_cache=config.dns_ttl is not None,
+            ttl_dns_cache=config.dns_ttl,
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=config.timeouts.client_timeout())
+
+    def _create_backend(self) -> HttpBackend:
+        config = self.config
+        if config.backend == BACKEND_HTTPX:
+            # Прокси у httpx задаётся на клиента, так что пулы по прокси раздельные всегда
+            return HttpxBackend(limit=config.limit, keepalive_timeout=config.keepalive_timeout)
+        if config.backend != BACKEND_AIOHTTP:
+            raise ValueError(f"Неизвестный HTTP бэкенд: {config.backend}")
+        return AiohttpBackend(self.session, self.session_for)
+
+    def session_for(self, proxy: Optional[str] = None) -> aiohttp.ClientSession:
+        if proxy is None or not self.config.proxy_sessions:
+            return self.session
+        session = self._proxy_sessions.get(proxy)
+        if session is None:
+            session = self._proxy_sessions[proxy] = self._create_session(self.config.proxy_limit, self.config.proxy_limit)
+        return session
+
+    def timeout_for(self, endpoint: str) -> Timeouts:
+        return self.config.timeouts_for(endpoint)
+
+    def headers(self) -> Dict[str, str]:
+        """Заголовки согласования сжатия"""
+        if self.config.compression == COMPRESSION_OFF:
+            return {'Accept-Encoding': 'identity'}
+        if self.config.compression == COMPRESSION_BR:
+            return {'Accept-Encoding': 'br, gzip, deflate'}
+        return {'Accept-Encoding': 'gzip, deflate'}
+
+    async def close(self):
+        await self.backend.close()
+        for session in (self.session, *self._proxy_sessions.values()):
+            await session.close()
+        self._proxy_sessions.clear()
+
+    async def __aenter__(self) -> 'Transport':
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+def parse_timeouts(values: Iterable[str], default: Timeouts) -> Dict[str, Timeouts]:
+    """Разбирает --timeout endpoint=connect,read,total; пропущенные значения берутся из `default`, 0 - без ограничения"""
+    timeouts = {}
+    for value in values:
+        endpoint, _, raw = value.partition('=')
+        current = [default.connect, default.read, default.total]
+        for index, part in enumerate(raw.split(',')[:3]):
+            if part:
+                current[index] = float(part) or None
+        timeouts[endpoint] = Timeouts(*current)
+    return timeouts
+
+def add_arguments(parser):
+    """Параметры TransportConfig для командной строки"""
+    defaults = TransportConfig()
+    parser.add_argument('--conn-limit', type=int, default=defaults.limit,
+                       help='Максимум открытых соединений (0 - без ограничения)')
+    parser.add_argument('--conn-per-host', type=int, default=defaults.limit_per_host,
+                       help='Максимум соединений к одному хосту')
+    parser.add_argument('--proxy-sessions', action='store_true',
+                       help='Отдельный пул соединений на каждый прокси')
+    parser.add_argument('--conn-per-proxy', type=int, default=defaults.proxy_limit,
+                       help='Максимум соединений через один прокси (с --proxy-sessions)')
+    parser.add_argument('--keepalive', type=float, default=defaults.keepalive_timeout,
+                       help='Сколько держать простаивающее соединение открытым (секунды)')
+    parser.add_argument('--dns-ttl', type=int, default=defaults.dns_ttl,
+                       help='Время жизни кэша DNS (секунды, 0 - без кэша)')
+    parser.add_argument('--connect-timeout', type=float, default=defaults.timeouts.connect,
+                       help='Таймаут установки соединения (секунды, 0 - без ограничения)')
+    parser.add_argument('--read-timeout', type=float, default=defaults.timeouts.read,
+                       help='Таймаут чтения из сокета (секунды, 0 - без ограничения)')
+    parser.add_argument('--total-timeout', type=float, default=defaults.timeouts.total,
+                       help='Общий таймаут попытки (секунды, 0 - без ограничения)')
+    parser.add_argument('--timeout', type=str, nargs='+', default=[],
+                       help='Таймауты по эндпоинтам: endpoint=connect,read,total, например: products=5,20,40 prices=,60,90')
+    parser.add_argument('--compression', type=str, choices=[COMPRESSION_OFF, COMPRESSION_GZIP, COMPRESSION_BR], default=defaults.compression,
+                       help='Сжатие ответов: off, gzip или br (нужен модуль brotli)')
+    parser.add_argument('--backend', type=str, choices=BACKENDS, default=defaults.backend,
+                       help='HTTP клиент запросов к API: aiohttp (быстрее, по умолчанию) или httpx (HTTP/2, нужен пакет httpx[http2]; '
+                            'медленнее по CPU, имеет смысл, когда прокси или сервер ограничивают число соединений)')
+
+def config_from_args(args) -> TransportConfig:
+    timeouts = Timeouts(args.connect_timeout or None, args.read_timeout or None, args.total_timeout or None)
+    return TransportConfig(
+        limit=args.conn_limit,
+        limit_per_host=args.conn_per_host,
+        proxy_limit=args.conn_per_proxy,
+        proxy_sessions=args.proxy_sessions,
+        keepalive_timeout=args.keepalive,
+        dns_ttl=args.dns_ttl or None,
+        compression=args.compression,
+        backend=args.backend,
+        timeouts=timeouts,
+        endpoint_timeouts=parse_timeouts(args.timeout, timeouts),
+    )
@@ -3,11 +3,19 @@ import aiohttp
 from dataclasses import dataclass
 from typing import List, Optional, Dict, Any
 
-from SieportalToken import Token
+from SieportalToken import TokenRegistry, TOKENS
 from SieportalRequests import requests
+from SieportalProxy import ProxyPool
+from SieportalLimiter import AdaptiveController
+from SieportalRetry import RetryPolicy
+from SieportalCache import ResponseCache
+from SieportalTransport import Transport
+from SieportalHedge import HedgePolicy
 
 
 class BaseAPI:
+    BASE_URL = 'https://sieportal.siemens.com'
+
     def __init__(
         self, 
         session: aiohttp.ClientSession,
@@ -17,7 +25,14 @@ class BaseAPI:
         proxy_list: Optional[List[str]] = None,
         use_proxy: bool = False,
         sleep_time: float | int = 1.0,
-        max_try: int = 3
+        max_try: int = 3,
+        tokens: Optional[TokenRegistry] = None,
+        proxy_pool: Optional[ProxyPool] = None,
+        controller: Optional[AdaptiveController] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        cache: Optional[ResponseCache] = None,
+        transport: Optional[Transport] = None,
+        hedge: Optional[HedgePolicy] = None
     ):
         self._session: aiohttp.ClientSession = session
         self.proxy_list: list[str] = proxy_list
@@ -25,8 +40,8 @@ class BaseAPI:
         
         self.language = language
         self.region = region
-        self.token = Token(session)
-        self.requests = requests(self._session, self.token, max_try = max_try, proxy_list=proxy_list, use_proxy=use_proxy, sleep_time=sleep_time)
+        self.tokens = tokens or TOKENS
+        self.requests = requests(self._session, self.tokens, max_try = max_try, proxy_list=proxy_list, use_proxy=use_proxy, sleep_time=sleep_time, proxy_pool=proxy_pool, controller=controller, retry_policy=retry_policy, cache=cache, transport=transport, hedge=hedge)
 
     
     def _default_params(self, new_dict: Dict[str, Any]):
@@ -58,4 +73,16 @@ class NodeInfo:
 @dataclass
 class NodeProduct:
     products: List[BaseChild]
-    product_count: int
\ No newline at end of file
+    product_count: int
+
+TASK_NODE = 'node'
+TASK_PRODUCTS = 'products'
+TASK_ACCESSORIES = 'accessories'
+
+@dataclass
+class CrawlTask:
+    """Задача очереди обхода: один запрос к API (узел дерева или страница товаров)"""
+    kind: str
+    node_id: int | str
+    page: int = 0
+    depth: int = 0
@@ -1,10 +1,16 @@
+import os
+import csv
+import json
+import time
+import asyncio
 import logging
+import sqlite3
 
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Iterable, Iterator, Optional, Sequence, Any
 from pathlib import Path
 
-import aiocsv
-import aiofiles
+from SieportalMetrics import METRICS
 
 logging.basicConfig(
     level=logging.INFO,
@@ -13,33 +19,453 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-class CsvWriter:
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+FORMAT_SQLITE = 'sqlite'
+FORMAT_PARQUET = 'parquet'
+FORMATS = (FORMAT_CSV, FORMAT_JSONL, FORMAT_SQLITE, FORMAT_PARQUET)
+
+EXTENSIONS = {
+    '.csv': FORMAT_CSV,
+    '.jsonl': FORMAT_JSONL,
+    '.sqlite': FORMAT_SQLITE,
+    '.db': FORMAT_SQLITE,
+    '.parquet': FORMAT_PARQUET,
+}
+
+def format_for(fp: str | Path) -> str:
+    """Формат выходного файла по расширению (по умолчанию CSV)"""
+    return EXTENSIONS.get(Path(fp).suffix.lower(), FORMAT_CSV)
+
+def with_format(fp: str | Path, format: Optional[str]) -> Path:
+    """Меняет расширение на расширение формата, если оно ему не соответствует"""
+    fp = Path(fp)
+    if format is None or format_for(fp) == format:
+        return fp
+    return fp.with_suffix(f'.{format}')
+
+def _fsync_dir(path: Path):
+    # В Windows каталог нельзя открыть через os.open, а переименование и так надёжно
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Sink:
+    """Синхронная запись строк в файл одного формата
+
+    Все методы, кроме size/truncate/articles до начала записи, вызываются только из потока writer-а.
+    `size` - позиция, до которой можно обрезать вывод при возобновлении (для журнала),
+    после `sync` всё до этой позиции гарантированно на диске.
+    """
+    def __init__(self, fp: Path, columns: Sequence[str]):
+        self.fp = fp
+        self.columns = list(columns)
+
+    def write(self, rows: List[List[Any]]):
+        raise NotImplementedError
+
+    def sync(self):
+        raise NotImplementedError
+
+    def size(self) -> int:
+        raise NotImplementedError
+
+    def truncate(self, size: int):
+        raise NotImplementedError
+
+    def rows(self) -> Iterator[List[Any]]:
+        """Уже записанные строки"""
+        raise NotImplementedError
+
+    def articles(self) -> Iterator[str]:
+        """Первая колонка уже записанных строк"""
+        for row in self.rows():
+            if row and row[0]:
+                yield row[0]
+
+    def close(self):
+        pass
+
+
+class _FileSink(Sink):
+    """Текстовый файл, открытый на дозапись на всё время работы"""
+    def __init__(self, fp: Path, columns: Sequence[str]):
+        super().__init__(fp, columns)
+        self._file = None
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.fp, 'a', newline='', encoding='utf-8')
+        return self._file
+
+    def sync(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def size(self) -> int:
+        if self._file is not None:
+            self._file.flush()
+        return self.fp.stat().st_size if self.fp.exists() else 0
+
+    def truncate(self, size: int):
+        if self.fp.exists() and self.fp.stat().st_size > size:
+            with open(self.fp, 'r+b') as file:
+                file.truncate(size)
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+
+class CsvSink(_FileSink):
+    def write(self, rows: List[List[Any]]):
+        file = self._open()
+        csv.writer(file).writerows(rows)
+        file.flush()
+
+    def rows(self) -> Iterator[List[Any]]:
+        if not self.fp.exists():
+            return
+        with open(self.fp, 'r', newline='', encoding='utf-8') as file:
+            yield from csv.reader(file)
+
+
+class JsonlSink(_FileSink):
+    def write(self, rows: List[List[Any]]):
+        file = self._open()
+        file.writelines(json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + '\n' for row in rows)
+        file.flush()
+
+    def rows(self) -> Iterator[List[Any]]:
+        if not self.fp.exists():
+            return
+        with open(self.fp, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                yield [record.get(column) for column in self.columns]
+
+
+class SqliteSink(Sink):
+    """Таблица articles; размер для журнала - последний rowid"""
+    TABLE = 'articles'
+
+    def __init__(self, fp: Path, columns: Sequence[str]):
+        super().__init__(fp, columns)
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.fp, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            columns = ', '.join(f'"{column}" TEXT' for column in self.columns)
+            self._db.execute(f"CREATE TABLE IF NOT EXISTS {self.TABLE} ({columns})")
+            self._db.commit()
+        return self._db
+
+    def write(self, rows: List[List[Any]]):
+        db = self._connect()
+        placeholders = ', '.join('?' * len(self.columns))
+        width = len(self.columns)
+        db.executemany(
+            f"INSERT INTO {self.TABLE} VALUES ({placeholders})",
+            (list(row[:width]) + [None] * (width - len(row)) for row in rows)
+        )
+        db.commit()
+
+    def sync(self):
+        if self._db is not None:
+            # Переносит WAL в основной файл с fsync
+            self._db.execute("PRAGMA wal_checkpoint(FULL)")
+
+    def size(self) -> int:
+        if self._db is None and not self.fp.exists():
+            return 0
+        return self._connect().execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {self.TABLE}").fetchone()[0]
+
+    def truncate(self, size: int):
+        if not self.fp.exists():
+            return
+        db = self._connect()
+        db.execute(f"DELETE FROM {self.TABLE} WHERE rowid > ?", (size,))
+        db.commit()
+
+    def rows(self) -> Iterator[List[Any]]:
+        if not self.fp.exists():
+            return
+        columns = ', '.join(f'"{column}"' for column in self.columns)
+        for row in self._connect().execute(f"SELECT {columns} FROM {self.TABLE} ORDER BY rowid"):
+            yield list(row)
+
+    def close(self):
+        if self._db is not None:
+            self.sync()
+            self._db.close()
+            self._db = None
+
+
+class ParquetSink(Sink):
+    """Каталог из частей part-NNNNN.parquet
+
+    Parquet нельзя дописать или обрезать, поэтому каждая контрольная точка закрывает
+    текущую часть. Пока часть пишется, у неё суффикс .tmp; размер для журнала - число
+    закрытых частей, при возобновлении незакрытая часть удаляется. Строки между
+    контрольными точками копятся в одной части как группы строк, так что при
+    журнале стоит увеличить --checkpoint-interval и размер буфера.
+    """
+    def __init__(self, fp: Path, columns: Sequence[str]):
+        # pyarrow тяжёлый, поэтому импортируется только при записи в Parquet
+        global pyarrow
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Для записи в Parquet установите пакет: pip install pyarrow")
+        super().__init__(fp, columns)
+        self.schema = pyarrow.schema([(column, pyarrow.string()) for column in self.columns])
+        self._writer = None
+        self._part: Optional[Path] = None
+
+    def _parts(self) -> List[Path]:
+        return sorted(self.fp.glob('part-*.parquet')) if self.fp.is_dir() else []
+
+    def write(self, rows: List[List[Any]]):
+        if self._writer is None:
+            self.fp.mkdir(parents=True, exist_ok=True)
+            self._part = self.fp / f"part-{len(self._parts()):05d}.parquet"
+            self._writer = pyarrow.parquet.ParquetWriter(self._part.with_name(self._part.name + '.tmp'), self.schema)
+        columns = [
+            [None if index >= len(row) or row[index] is None else str(row[index]) for row in rows]
+            for index in range(len(self.columns))
+        ]
+        self._writer.write_table(pyarrow.table(columns, schema=self.schema))
+
+    def sync(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        temp = self._part.with_name(self._part.name + '.tmp')
+        with open(temp, 'rb') as file:
+            os.fsync(file.fileno())
+        os.replace(temp, self._part)
+        _fsync_dir(self.fp)
+        self._writer = self._part = None
+
+    def size(self) -> int:
+        return len(self._parts())
+
+    def truncate(self, size: int):
+        if not self.fp.is_dir():
+            return
+        for part in self.fp.glob('part-*.parquet.tmp'):
+            part.unlink()
+        for part in self._parts()[size:]:
+            part.unlink()
+
+    def rows(self) -> Iterator[List[Any]]:
+        for part in self._parts():
+            table = pyarrow.parquet.read_table(part, columns=self.columns)
+            yield from (list(row) for row in zip(*(column.to_pylist() for column in table.columns)))
+
+    def close(self):
+        self.sync()
+
+
+SINKS = {
+    FORMAT_CSV: CsvSink,
+    FORMAT_JSONL: JsonlSink,
+    FORMAT_SQLITE: SqliteSink,
+    FORMAT_PARQUET: ParquetSink,
+}
+
+
+class Writer:
+    """Буферизованная запись строк через фоновую задачу
+
+    `extend` только добавляет строки в буфер. Полный буфер отдаётся (`submit`) в ограниченную
+    очередь, из которой фоновая задача пишет пакеты в sink в отдельном потоке, держа файл
+    открытым всю работу; если очередь пуста дольше `flush_interval` секунд, задача сама
+    забирает накопившийся буфер. `save` - контрольная точка: ждёт записи всего, что было
+    в буфере, и сбрасывает sink на диск (fsync); возвращённый размер можно писать в журнал.
+    """
     def __init__(
         self,
         fp: str | Path,
         buffer: int = 500,
+        *,
+        format: Optional[str] = None,
+        columns: Sequence[str] = ('article',),
+        flush_interval: float = 5.0,
+        queue_size: int = 8,
     ):
+        """
+        Args:
+            - fp: Выходной файл (для Parquet - каталог)
+            - buffer: Сколько строк копить перед отправкой на запись
+            - format: csv, jsonl, sqlite или parquet (по умолчанию по расширению fp)
+            - columns: Названия колонок строк (в CSV не пишутся)
+            - flush_interval: Через сколько секунд простоя записать неполный буфер
+            - queue_size: Сколько пакетов может ждать записи, дальше submit ждёт место
+        """
         self.buffer_size = buffer
         self.fp = Path(fp)
         self.fp.parent.mkdir(parents=True, exist_ok=True)
-        
+        self.format = format or format_for(self.fp)
+        self.sink: Sink = SINKS[self.format](self.fp, columns)
+        self.flush_interval = flush_interval
+
+        self.buffer: List[List[Any]] = list()
+        # Пакеты строк и метки контрольных точек save()
+        self._queue: asyncio.Queue[List[List[Any]] | asyncio.Future] = asyncio.Queue(max(1, queue_size))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._error: Optional[BaseException] = None
+        # Очередь asyncio не пропускает ждущих места строго по порядку, поэтому пакеты
+        # встают в неё под честной блокировкой: метка save() не обгоняет отданные раньше строки
+        self._order = asyncio.Lock()
 
-        self.buffer: List[str | int] = list()
-        
     async def add(self, item: List[str] | str | int):
-        if isinstance(item, list):
-            self.buffer.append(item)
-        else:
-            self.buffer.append([item])
-        if len(self.buffer) >= self.buffer_size:
+        self.extend([item])
+        if self.full():
+            await self.submit()
+
+    def extend(self, items: Iterable[List[str] | str | int]):
+        """Добавляет строки в буфер без сохранения на диск"""
+        for item in items:
+            if isinstance(item, list):
+                self.buffer.append(item)
+            else:
+                self.buffer.append([item])
+
+    def full(self) -> bool:
+        return len(self.buffer) >= self.buffer_size
+
+    def _start(self):
+        if self._task is None:
+            # Один поток: sink не потокобезопасен, а пакеты пишутся строго по порядку
+            self._executor = ThreadPoolExecutor(1, thread_name_prefix='writer')
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                item = await asyncio.wait_for(self._queue.get(), self.flush_interval)
+            except asyncio.TimeoutError:
+                if self.buffer:
+                    # Очередь пуста, значит место в ней есть
+                    rows, self.buffer = self.buffer, list()
+                    self._queue.put_nowait(rows)
+                continue
+            try:
+                if isinstance(item, asyncio.Future):
+                    # Метка save(): всё, что было в очереди до неё, уже записано
+                    size = await loop.run_in_executor(self._executor, self._sync)
+                    if not item.done():
+                        item.set_result(size)
+                    continue
+                logger.info("Сохранения %d элементов...", len(item))
+                started = time.monotonic()
+                await loop.run_in_executor(self._executor, self.sink.write, item)
+                METRICS.writer_flush.observe(time.monotonic() - started)
+                METRICS.writer_rows.inc(len(item))
+            except Exception as error:
+                logger.exception(f"Ошибка записи в {self.fp}: {error}")
+                if isinstance(item, asyncio.Future):
+                    if not item.done():
+                        item.set_exception(error)
+                else:
+                    self._error = error
+            finally:
+                self._queue.task_done()
+
+    def _sync(self) -> int:
+        self.sink.sync()
+        return self.sink.size()
+
+    async def _put(self, *items: List[List[Any]] | asyncio.Future):
+        self._start()
+        # Отмена ожидающего места в очереди не должна терять уже забранные строки
+        await asyncio.shield(self._put_ordered(items))
+
+    async def _put_ordered(self, items: Sequence[List[List[Any]] | asyncio.Future]):
+        async with self._order:
+            for item in items:
+                await self._queue.put(item)
+
+    async def submit(self):
+        """Отдаёт буфер фоновой задаче; ждёт только если очередь записи заполнена"""
+        if not self.buffer:
+            return
+        rows, self.buffer = self.buffer, list()
+        await self._put(rows)
+
+    async def save(self) -> int:
+        """Контрольная точка: записывает весь буфер, сбрасывает его на диск (fsync) и возвращает size()
+
+        Размер считается в потоке записи на метке в очереди, поэтому строки, отправленные
+        другими задачами после начала save, в него не попадают и при возобновлении будут обрезаны.
+        """
+        # Буфер забирается сразу: строки, добавленные во время записи, попадут в следующее сохранение
+        rows, self.buffer = self.buffer, list()
+        barrier = asyncio.get_running_loop().create_future()
+        await self._put(*([rows] if rows else []), barrier)
+        size = await barrier
+        if self._error is not None:
+            # Пакет до метки не записался - такой размер нельзя отдавать в журнал
+            error, self._error = self._error, None
+            raise error
+        return size
+
+    async def close(self):
+        """Сохраняет остаток, закрывает файл и останавливает фоновую задачу"""
+        try:
             await self.save()
-    
-    async def save(self):
-        logger.info(f"Сохранения {len(self.buffer)} элементов...")
-        async with aiofiles.open(self.fp, 'a', newline='') as file:
-            _writer = aiocsv.AsyncWriter(file)
-            await _writer.writerows(self.buffer)
-        self.flush()
-        
+        finally:
+            if self._task is not None:
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+                await asyncio.get_running_loop().run_in_executor(self._executor, self.sink.close)
+                self._executor.shutdown()
+                self._task = self._executor = None
+
+    async def __aenter__(self) -> 'Writer':
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def size(self) -> int:
+        """Позиция записанного вывода для журнала (байты для CSV/JSONL, строки для SQLite, части для Parquet)"""
+        return self.sink.size()
+
+    def truncate(self, size: int):
+        """Обрезает вывод до `size` (при возобновлении с контрольной точки)"""
+        self.sink.truncate(size)
+
+    def rows(self) -> Iterator[List[Any]]:
+        """Уже записанные строки"""
+        return self.sink.rows()
+
+    def articles(self) -> Iterator[str]:
+        """Уже записанные артикулы (первая колонка)"""
+        return self.sink.articles()
+
     def flush(self):
-        self.buffer.clear()
\ No newline at end of file
+        self.buffer.clear()
+
+
+class CsvWriter(Writer):
+    def __init__(self, fp: str | Path, buffer: int = 500, **options):
+        super().__init__(fp, buffer, format=FORMAT_CSV, **options)
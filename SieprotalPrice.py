@@ -1,48 +1,106 @@
-from typing import List, Optional
+import asyncio
+import logging
+
+from typing import List, Dict, Iterable, Optional
 
-import aiohttp
 from SieportalTyping import PriceChild, NodeProduct, BaseAPI
+from SieportalRequests import RequestContext
+
+logger = logging.getLogger(__name__)
 
 class GetPriceAPI(BaseAPI):
-    def __init__(
-        self, 
-        session: aiohttp.ClientSession,
-        language: str,
-        region: str,
-        *,
-        proxy_list: Optional[List[str]] = None,
-        use_proxy: bool = False,
-        sleep_time = 1,
-        max_try = 3):
-        super().__init__(session, language, region, proxy_list=proxy_list, use_proxy=use_proxy, sleep_time=sleep_time, max_try=max_try)
+    PATH = '/api/mall/ProductInformation/GetProductsAndPrices'
+    BATCH_SIZE = 50
     
     async def get_pice(self, article: str, currency_code: str) -> Optional[NodeProduct]:
-        URL = 'https://sieportal.siemens.com/api/mall/ProductInformation/GetProductsAndPrices'
+        """Получает цену одного артикула (см. get_prices для пакетного запроса)"""
+        prices = await self._get_batch([article], currency_code)
+        if prices is None:
+            return None
+        products = [PriceChild(article, price) for price in prices.values() if price is not None]
+        return NodeProduct(products, len(products))
+    
+    async def get_prices(
+        self,
+        articles: Iterable[str],
+        currency_code: str,
+        *,
+        batch_size: Optional[int] = None,
+        rounds: int = 3,
+        concurrency: int = 4
+    ) -> Dict[str, Optional[str]]:
+        """get_prices получает цены многих артикулов пакетными запросами GetProductsAndPrices
+        
+        Args:
+        
+            articles: артикулы
+            
+            currency_code: код валюты, например 'EUR'
+            
+            batch_size: сколько артикулов в одном запросе (по умолчанию BATCH_SIZE)
+            
+            rounds: сколько раз перезапрашивать артикулы, которых не оказалось в ответе
+            
+            concurrency: сколько пакетов запрашивается одновременно
+            
+        Returns:
+        
+            Dict[str, Optional[str]] - артикул -> цена (None - у артикула нет цены). 
+            Артикулов, которые так и не удалось получить, в словаре нет
+        """
+        batch_size = batch_size or self.BATCH_SIZE
+        missing = list(dict.fromkeys(articles))
+        result: Dict[str, Optional[str]] = {}
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def fetch(batch: List[str]):
+            async with semaphore:
+                return await self._get_batch(batch, currency_code)
+        
+        for _ in range(rounds):
+            batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+            for prices in await asyncio.gather(*(fetch(batch) for batch in batches)):
+                if prices:
+                    result.update(prices)
+            # Повторно запрашиваем только то, чего не было в ответах
+            missing = [article for article in missing if article not in result]
+            if not missing:
+                break
+        
+        if missing:
+            logger.warning(f"Цены не получены для {len(missing)} артикулов")
+        return result
+    
+    async def _get_batch(self, articles: List[str], currency_code: str) -> Optional[Dict[str, Optional[str]]]:
+        """Один запрос GetProductsAndPrices; ответы сопоставляются с артикулами по itemId"""
+        by_item = {str(index): article for index, article in enumerate(articles, 1)}
         json_data = self._default_params({
             'countryCode': self.region,
             'products': [
                 {
-                    'itemId': '1',
+                    'itemId': item_id,
                     'articleNumber': article,
                 }
+                for item_id, article in by_item.items()
             ],
             'currencyCode': currency_code,
             'projectNumber': None,
         })
         
-        data = await self.requests.post(URL, json=json_data)
+        data = await self.requests.post(self.BASE_URL + self.PATH, json=json_data,
+                                        context=RequestContext(article=articles[0] if articles else None, items=len(articles)))
         
         if data is None or 'products' not in data:
             return None
             
         try:
-            products = []
+            prices = {}
             for item in data['products']:
-                if 'productPrice' in item and 'uiValueListPrice' in item['productPrice']:
-                    products.append(PriceChild(article, item['productPrice']['uiValueListPrice']))
-            
-            return NodeProduct(
-                products,
-                len(products))
-        except (KeyError, TypeError):
-            return None
\ No newline at end of file
+                article = by_item.get(str(item.get('itemId'))) or item.get('articleNumber')
+                if article is None:
+                    continue
+                price = item.get('productPrice') or {}
+                prices[article] = price.get('uiValueListPrice')
+            return prices
+        except (KeyError, TypeError, AttributeError):
+            return None
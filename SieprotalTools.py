@@ -29,21 +29,4 @@ def second_readable(seconds: int) -> str:
             else:
                 parts.append(f"{count} {unit_name}ов" if unit_name in ['год', 'день'] else f"{count} {unit_name}")
     
-    return ", ".join(parts) if parts else "менее секунды"
-
-def find_first_key(obj, key):
-    """Рекурсивно ищет первое значение для указанного ключа"""
-    if isinstance(obj, dict):
-        if key in obj:
-            return obj[key]
-        for k, v in obj.items():
-            if isinstance(v, (dict, list)):
-                result = find_first_key(v, key)
-                if result is not None:
-                    return result
-    elif isinstance(obj, list):
-        for item in obj:
-            result = find_first_key(item, key)
-            if result is not None:
-                return result
-    return None
\ No newline at end of file
+    return ", ".join(parts) if parts else "менее секунды"
\ No newline at end of file
@@ -1,46 +1,93 @@
 import asyncio
 import os
 import logging
+import argparse
+
+from pathlib import Path
 
 from SieprotalPrice import GetPriceAPI
 
-import aiohttp
-import aiofiles
-import aiocsv
 import dotenv
 
-from SieportalTyping import NodeProduct
-from SieportalWriter import CsvWriter
+from SieportalWriter import Writer, FORMATS, with_format
+from SieportalToken import TOKENS
+from SieportalProxy import ProxyPool
+from SieportalPipeline import PricePipeline, read_articles
+from SieportalTransport import Transport, add_arguments as add_transport_arguments, config_from_args as transport_config
 
 dotenv.load_dotenv()
 
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s] - %(message)s | %(asctime)s"
+)
+
 logger = logging.getLogger(__name__)
 
 PROXY_LIST = os.getenv("PROXY")
 PROXY_LIST = PROXY_LIST.split(',') if PROXY_LIST else []
 
+def parse():
+    parser = argparse.ArgumentParser(
+    description='Парсер цен Siemens SiePortal по списку артикулов',
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    epilog='''
+        Примеры использования:
+        python parse_price.py new_en_kr.csv -r kr -l en --currency KRW --proxy
+        python parse_price.py files/de-de.csv -r de -l de --currency EUR -c 16 -o files/de-de-prices.csv
+        python parse_price.py export.csv -r us -l en --currency USD --column article
+    '''
+    )
+
+    parser.add_argument('input', type=str,
+                       help='CSV с артикулами')
+    parser.add_argument('--region', '-r', type=str, required=True,
+                       help='Регион (например: kr, de, us)')
+    parser.add_argument('--language', '-l', type=str, required=True,
+                       help='Язык (например: en, de, ko)')
+    parser.add_argument('--currency', type=str, required=True,
+                       help='Код валюты (например: KRW, EUR, USD)')
+    parser.add_argument('--column', type=str, default='0',
+                       help='Номер колонки с артикулом или её имя в заголовке')
+    parser.add_argument('--output', '-o', type=str,
+                       help='Путь к выходному файлу, формат по расширению: .csv, .jsonl, .sqlite, .parquet (по умолчанию: files/{language}-{region}-prices.csv)')
+    parser.add_argument('--format', type=str, choices=FORMATS,
+                       help='Формат выходного файла (по умолчанию по расширению --output)')
+    parser.add_argument('--concurrent', '-c', type=int, default=8,
+                       help='Количество одновременных запросов')
+    parser.add_argument('--batch-size', '-b', type=int, default=GetPriceAPI.BATCH_SIZE,
+                       help='Артикулов в одном запросе цен')
+    parser.add_argument('--max-try', '-m', type=int,
+                       help='Максимальное количество попыток для запроса (по умолчанию 1.5 * количество прокси)')
+    parser.add_argument('--sleep', '-s', type=float, default=0.5,
+                       help='Базовая задержка повтора (секунды)')
+    parser.add_argument('--proxy', action='store_true',
+                       help='Использовать прокси из переменной окружения PROXY')
+
+    add_transport_arguments(parser)
+
+    return parser.parse_args()
+
 async def main():
-    writer = CsvWriter("files\\NEW_EN_KR.csv", 200)
-    
-    async with aiofiles.open("new_en_kr.csv", 'r', newline='') as file_read:
-        csv = aiocsv.AsyncReader(file_read)
-        async with aiohttp.ClientSession() as session:
-            api = GetPriceAPI(session, 'en', 'kr', proxy_list=PROXY_LIST, use_proxy=True, sleep_time=0.5, max_try=round(len(PROXY_LIST) * 1.5))
-            tasks = []
-            
-            async for line in csv:
-                if line and line[0]:  # Проверка на пустую строку
-                    tasks.append(asyncio.create_task(api.get_pice(line[0], "KRW")))
-                    if len(tasks) >= 50:
-                        results = await asyncio.gather(*tasks, return_exceptions=True)
-                        for response in results:
-                            if isinstance(response, Exception):
-                                logger.error(f"Ошибка при запросе: {response}")
-                                continue
-                            if response and response.products:
-                                await writer.add([response.products[0].node_id, response.products[0].price])
-                        tasks.clear()
-
-    await writer.save()
-    
-asyncio.run(main())
\ No newline at end of file
+    args = parse()
+    column = int(args.column) if args.column.isdigit() else args.column
+    output = with_format(args.output or Path("files") / f"{args.language}-{args.region}-prices.csv", args.format)
+    max_try = args.max_try or max(3, round(len(PROXY_LIST) * 1.5))
+
+    writer = Writer(output, 200, format=args.format, columns=('article', 'price'))
+    try:
+        async with Transport(transport_config(args)) as transport:
+            api = GetPriceAPI(transport.session, args.language, args.region, proxy_list=PROXY_LIST, use_proxy=args.proxy,
+                              sleep_time=args.sleep, max_try=max_try, proxy_pool=ProxyPool(PROXY_LIST), transport=transport)
+            pipeline = PricePipeline(api, writer, args.currency, workers=args.concurrent, batch_size=args.batch_size)
+            await pipeline.run(read_articles(args.input, column))
+            logger.info(f"РЕЗУЛЬТАТ: {pipeline.get_stats()}, {api.requests.get_stats()}!")
+    finally:
+        TOKENS.close()
+        await writer.close()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Парсинг цен остановлен досрочно пользователем!")